@@ -0,0 +1,228 @@
+"""asyncio serving path of the read endpoints.
+
+    uvicorn asgi:app --workers 4
+
+Serves the healthcheck, active_equipments, total_cost, average_cost and
+cost_series with the input schemas, statements and responses of the Flask
+views, on an asyncpg connection pool. start.sh runs it with APP_ENV=asgi.
+A request awaits its statements instead of holding a thread, so a
+process serves thousands of polling clients with ASYNC_POOL_SIZE connections.
+
+Writes, the response cache, replicas, metrics and profiling stay with the
+WSGI app. Streamed active_equipments responses are sent in one piece.
+"""
+import json
+import logging
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import config
+from apis import reads
+import apis.models.schemas as schemas
+
+logger = logging.getLogger(__name__)
+
+active_equipment_schema = schemas.ActiveEquipmentInputSchema()
+total_cost_schema = schemas.TotalCostOperationInputSchema()
+average_cost_schema = schemas.AverageCostInputSchema()
+cost_series_schema = schemas.CostSeriesInputSchema()
+
+
+class Response:
+    def __init__(self, body, status=200, content_type='application/json'):
+        self.status = status
+        self.content_type = content_type
+        if isinstance(body, bytes):
+            self.body = body
+        elif content_type == 'application/json':
+            # same bytes as flask.jsonify
+            self.body = reads.dumps(body) + b'\n'
+        else:
+            self.body = body.encode()
+
+
+async def healthcheck(app, input_data):
+    return Response('OK', content_type='text/html; charset=utf-8')
+
+
+async def active_equipments(app, input_data):
+    errors = active_equipment_schema.validate(input_data)
+    if errors:
+        return Response({'message': str(errors)}, 400)
+
+    input_data = active_equipment_schema.load(input_data)
+    vessel_code = input_data.get('vessel_code')
+    limit = input_data.get('limit')
+    try:
+        async with app.engine.connect() as connection:
+            vessel_id = await connection.scalar(reads.vessel_id_of(vessel_code))
+            if not vessel_id:
+                return Response({'message': 'Invalid vessel code'}, 400)
+            equipments = (await connection.execute(
+                reads.active_equipments(vessel_id, input_data)
+            )).all()
+    except Exception as e:
+        logger.error(e)
+        return Response({'message': str(e)}, 400)
+
+    return Response(reads.active_equipments_json(vessel_code, equipments, limit))
+
+
+async def total_cost(app, input_data):
+    errors = total_cost_schema.validate(input_data)
+    if errors:
+        return Response({'message': str(errors)}, 400)
+
+    try:
+        async with app.engine.connect() as connection:
+            matched, total = (await connection.execute(
+                reads.total_cost(total_cost_schema.load(input_data))
+            )).one()
+    except Exception as e:
+        logger.error(e)
+        return Response({'message': str(e)}, 400)
+
+    if matched < 1:
+        return Response({'message': 'Invalid parameters'}, 400)
+    return Response(reads.total_cost_response(total))
+
+
+async def average_cost(app, input_data):
+    input_data = input_data or {}
+    errors = average_cost_schema.validate(input_data)
+    if errors:
+        return Response({'message': str(errors)}, 400)
+
+    try:
+        async with app.engine.connect() as connection:
+            averages = (await connection.execute(
+                reads.average_cost(average_cost_schema.load(input_data))
+            )).all()
+    except Exception as e:
+        logger.error(e)
+        return Response({'message': str(e)}, 400)
+
+    return Response(reads.average_cost_response(averages))
+
+
+async def cost_series(app, input_data):
+    input_data = input_data or {}
+    errors = cost_series_schema.validate(input_data)
+    if errors:
+        return Response({'message': str(errors)}, 400)
+
+    try:
+        async with app.engine.connect() as connection:
+            rows = (await connection.execute(
+                reads.cost_series(cost_series_schema.load(input_data))
+            )).all()
+    except Exception as e:
+        logger.error(e)
+        return Response({'message': str(e)}, 400)
+
+    return Response(reads.cost_series_response(rows))
+
+
+# like request.get_json(silent=True), an invalid body reads as no input
+SILENT_JSON = (average_cost, cost_series)
+
+VIEWS = {
+    '/': healthcheck,
+    '/equipment/active_equipments': active_equipments,
+    '/operation_order/total_cost': total_cost,
+    '/operation_order/average_cost': average_cost,
+    '/operation_order/cost_series': cost_series
+}
+
+
+class AsyncApp:
+    """ASGI application of the read endpoints"""
+
+    def __init__(self, config):
+        self.config = config
+        self._engine = None
+
+    @property
+    def engine(self):
+        # created on first use, in the event loop of the server
+        if self._engine is None:
+            self._engine = create_async_engine(
+                make_url(self.config['SQLALCHEMY_DATABASE_URI']).set(drivername='postgresql+asyncpg'),
+                pool_size=self.config.get('ASYNC_POOL_SIZE', 10),
+                max_overflow=self.config.get('ASYNC_MAX_OVERFLOW', 0),
+                pool_timeout=self.config.get('ASYNC_POOL_TIMEOUT', 10),
+                pool_recycle=self.config.get('ASYNC_POOL_RECYCLE', 1800),
+                pool_pre_ping=self.config.get('ASYNC_POOL_PRE_PING', True)
+            )
+        return self._engine
+
+    async def dispose(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            response = await self._respond(scope, receive)
+            await send({
+                'type': 'http.response.start',
+                'status': response.status,
+                'headers': [
+                    (b'content-type', response.content_type.encode()),
+                    (b'content-length', str(len(response.body)).encode())
+                ]
+            })
+            await send({
+                'type': 'http.response.body',
+                'body': response.body if scope['method'] != 'HEAD' else b''
+            })
+
+    async def _respond(self, scope, receive):
+        view = VIEWS.get(scope['path'])
+        if view is None:
+            return Response({'message': 'Not Found'}, 404)
+        if scope['method'] not in ('GET', 'HEAD'):
+            return Response({'message': 'Method Not Allowed'}, 405)
+
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        # like request.json, bodies of other content types are None
+        input_data = None
+        content_type = dict(scope['headers']).get(b'content-type', b'').split(b';')[0].strip()
+        if body and (content_type == b'application/json' or content_type.endswith(b'+json')):
+            try:
+                input_data = json.loads(body)
+            except ValueError:
+                if view not in SILENT_JSON:
+                    return Response({'message': 'Failed to decode JSON object'}, 400)
+        return await view(self, input_data)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_app(test_config=False, production_conf=False):
+    if test_config:
+        config_object = config.TestConfig
+    elif production_conf:
+        config_object = config.ProductionConfig
+    else:
+        config_object = config.RunConfig
+    return AsyncApp({
+        key: getattr(config_object, key) for key in dir(config_object) if key.isupper()
+    })
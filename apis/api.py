@@ -1,8 +1,16 @@
+import json
 import logging
-from flask import Blueprint, request
-from psycopg2.errors import UniqueViolation
-from sqlalchemy import func, or_
-
+import queue
+from flask import Blueprint, Response, current_app, request, stream_with_context
+from marshmallow import ValidationError
+from sqlalchemy import any_, bindparam, func, select, true
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+
+from apis import ingestion, reads, rollups
+from apis.code_cache import code_cache
+from apis.replicas import replicas
+from apis.response_cache import response_cache
+from apis.write_behind import write_behind
 from apis.models.equipment import equipment
 from apis.models.operation_order import OperationOrder
 from apis.models.vessel import vessel
@@ -19,12 +27,16 @@ equipments_blueprint = Blueprint('equipments', __name__)
 operation_order_blueprint = Blueprint('operation_order', __name__)
 
 create_vessel_schema = schemas.CreateVesselInputSchema()
+create_vessels_schema = schemas.CreateVesselsInputSchema()
 create_equipment_schema = schemas.CreateEquipmentInputSchema()
+create_equipments_schema = schemas.CreateEquipmentsInputSchema()
 update_equipment_schema = schemas.UpdateEquipmentInputSchema()
+update_equipments_schema = schemas.UpdateEquipmentsInputSchema()
 active_equipment_schema = schemas.ActiveEquipmentInputSchema()
-equipments_output_schema = schemas.EquipmentOutputSchema(many=True)
 create_operation_schema = schemas.CreateOperationOrderInputSchema()
 total_cost_schema = schemas.TotalCostOperationInputSchema()
+average_cost_schema = schemas.AverageCostInputSchema()
+cost_series_schema = schemas.CostSeriesInputSchema()
 
 @healthcheck_blueprint.route('/', methods=['GET'])
 def healthcheck():
@@ -35,9 +47,7 @@ def healthcheck():
           200:
             description: OK if the system is alive
     """
-    logging.basicConfig(format='%(levelname)s - %(asctime)s (%(filename)s:%(funcName)s): %(message)s', level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.info('Test the health of the system')
+    logger.debug('Test the health of the system')
     return 'OK', 200
 
 
@@ -63,23 +73,84 @@ def insert_vessel():
     if errors:
       return {'message':str(errors)}, 400
 
-    new_vessel = vessel(code = input_data.get('code'))
+    statement = response_cache.touching(insert(vessel).values(
+      code=input_data.get('code')
+    ).on_conflict_do_nothing(
+      index_elements=[vessel.code]
+    ).returning(vessel.id), 'vessel')
 
     message, status_code = 'OK', 201
     transaction = db.session
     try:
-      transaction.add(new_vessel)
+      if transaction.execute(statement).scalar() is None:
+        transaction.rollback()
+        return {'message': 'Duplicated vessel code'}, 409
+      response_cache.touch(transaction, 'vessel', published=True)
       transaction.commit()
     except Exception as e:
       transaction.rollback()
-      if isinstance(e.orig, UniqueViolation):
-        message, status_code = 'Duplicated vessel code', 409
-      else:
-        logger.error(e)
-        message, status_code = str(e), 400
+      logger.error(e)
+      message, status_code = str(e), 400
 
     return {'message':message}, status_code
 
+@vessels_blueprint.route('/insert_vessels', methods=['POST'])
+def insert_vessels():
+    """Insert a batch of vessels with a single statement
+        ---
+        parameters:
+            - name: codes
+              in: body
+              type: list of string
+              required: true
+        responses:
+          201:
+            description: returns the codes grouped by result (created, duplicate or invalid)
+          400:
+            description: Error description
+    """
+    input_data = request.json
+    errors = create_vessels_schema.validate(input_data)
+    if errors:
+      return {'message':str(errors)}, 400
+
+    report = {'created': [], 'duplicate': [], 'invalid': []}
+    new_codes = {}
+    for code in input_data.get('codes'):
+      if create_vessel_schema.validate({'code': code}):
+        report['invalid'].append(code)
+      elif code in new_codes:
+        report['duplicate'].append(code)
+      else:
+        new_codes[code] = None
+
+    if not new_codes:
+      return report, 201
+
+    statement = insert(vessel).from_select(
+      [vessel.code],
+      select(func.unnest(bindparam('codes', type_=ARRAY(db.String))))
+    ).on_conflict_do_nothing(
+      index_elements=[vessel.code]
+    ).returning(vessel.code)
+
+    transaction = db.session
+    try:
+      created = set(transaction.execute(
+        statement, {'codes': list(new_codes)}
+      ).scalars())
+      response_cache.touch(transaction, 'vessel')
+      transaction.commit()
+    except Exception as e:
+      transaction.rollback()
+      logger.error(e)
+      return {'message': str(e)}, 400
+
+    for code in new_codes:
+      report['created' if code in created else 'duplicate'].append(code)
+
+    return report, 201
+
 @equipments_blueprint.route('/insert_equipment', methods=['POST'])
 def insert_equipment():
     """insert_equipment
@@ -112,36 +183,128 @@ def insert_equipment():
     if errors:
       return {'message':str(errors)}, 400
     
-    ref_vessel = db.session.query(vessel).filter(
-      vessel.code == input_data.get('vessel_code')
-    ).first()
-
-    if not ref_vessel:
-      return {'message': 'Invalid vessel code'}, 400
-    
-    new_equipment = equipment(
-      vessel_id=ref_vessel.id,
-      name=input_data.get('name'),
-      code=input_data.get('code'),
-      location=input_data.get('location'),
-      active=True
-    )
+    # one statement resolves the vessel and inserts the equipment unless its code exists
+    parent = reads.vessel_id_of(input_data.get('vessel_code')).cte('parent')
+    new_equipment = insert(equipment).from_select(
+      [equipment.vessel_id, equipment.code, equipment.name, equipment.location, equipment.active],
+      select(
+        parent.c.id,
+        bindparam('code', input_data.get('code'), type_=db.String),
+        bindparam('name', input_data.get('name'), type_=db.String),
+        bindparam('location', input_data.get('location'), type_=db.String),
+        true()
+      )
+    ).on_conflict_do_nothing(
+      index_elements=[equipment.code]
+    ).returning(equipment.id).cte('new_equipment')
+    statement = response_cache.touching(select(
+      parent.c.id.label('vessel_id'),
+      new_equipment.c.id.label('equipment_id')
+    ).select_from(
+      parent.outerjoin(new_equipment, true())
+    ), 'equipment')
 
     message, status_code = 'OK', 201
     transaction = db.session
     try:
-      transaction.add(new_equipment)
+      inserted = transaction.execute(statement).first()
+      if inserted is None or inserted.equipment_id is None:
+        transaction.rollback()
+        if inserted is None:
+          return {'message': 'Invalid vessel code'}, 400
+        return {'message': 'Duplicated equipment code'}, 409
+      response_cache.touch(transaction, 'equipment', published=True)
       transaction.commit()
     except Exception as e:
       transaction.rollback()
-      if isinstance(e.orig, UniqueViolation):
-        message, status_code = 'Duplicated equipment code', 409
-      else:
-        logger.error(e)
-        message, status_code = str(e), 400
+      logger.error(e)
+      message, status_code = str(e), 400
 
     return {'message':message}, status_code
 
+@equipments_blueprint.route('/insert_equipments', methods=['POST'])
+def insert_equipments():
+    """Insert a batch of equipments, possibly of many vessels, with a single statement
+        ---
+        parameters:
+            - name: equipments
+              in: body
+              type: list of objects with vessel_code, code, name and location
+              required: true
+        responses:
+          201:
+            description: returns the status of each equipment (created, invalid vessel code, duplicate or invalid)
+          400:
+            description: Error
+    """
+    input_data = request.json
+    errors = create_equipments_schema.validate(input_data)
+    if errors:
+      return {'message':str(errors)}, 400
+
+    rows = input_data.get('equipments')
+    results = [
+      {'code': row.get('code') if isinstance(row, dict) else None}
+      for row in rows
+    ]
+    valid = {}
+    for index, row in enumerate(rows):
+      errors = create_equipment_schema.validate(row)
+      if errors:
+        results[index].update(status='invalid', message=str(errors))
+      else:
+        valid[index] = row
+
+    vessel_codes = list({row.get('vessel_code') for row in valid.values()})
+    transaction = db.session
+    try:
+      vessel_ids = dict(transaction.query(vessel.code, vessel.id).filter(
+        vessel.code == any_(bindparam('vessel_codes', vessel_codes, type_=ARRAY(db.String)))
+      ).all()) if vessel_codes else {}
+
+      new_rows = {}
+      for index, row in valid.items():
+        if row.get('vessel_code') not in vessel_ids:
+          results[index]['status'] = 'invalid vessel code'
+        elif row.get('code') in new_rows:
+          results[index]['status'] = 'duplicate'
+        else:
+          new_rows[row.get('code')] = index
+
+      created = set()
+      if new_rows:
+        values = func.unnest(
+          bindparam('vessel_ids', type_=ARRAY(db.BigInteger)),
+          bindparam('codes', type_=ARRAY(db.String)),
+          bindparam('names', type_=ARRAY(db.String)),
+          bindparam('locations', type_=ARRAY(db.String))
+        ).table_valued('vessel_id', 'code', 'name', 'location').render_derived()
+        statement = insert(equipment).from_select(
+          [equipment.vessel_id, equipment.code, equipment.name, equipment.location, equipment.active],
+          select(values.c.vessel_id, values.c.code, values.c.name, values.c.location, true())
+        ).on_conflict_do_nothing(
+          index_elements=[equipment.code]
+        ).returning(equipment.code)
+
+        new_data = [valid[index] for index in new_rows.values()]
+        created = set(transaction.execute(statement, {
+          'vessel_ids': [vessel_ids[row.get('vessel_code')] for row in new_data],
+          'codes': [row.get('code') for row in new_data],
+          'names': [row.get('name') for row in new_data],
+          'locations': [row.get('location') for row in new_data]
+        }).scalars())
+      response_cache.touch(transaction, 'equipment')
+      transaction.commit()
+    except Exception as e:
+      transaction.rollback()
+      logger.error(e)
+      return {'message': str(e)}, 400
+
+    for code, index in new_rows.items():
+      results[index]['status'] = 'created' if code in created else 'duplicate'
+
+    return {'equipments': results}, 201
+
 @equipments_blueprint.route('/update_equipment_status', methods=['PUT'])
 def update_equipment_status():
     """update_equipment_status
@@ -151,39 +314,114 @@ def update_equipment_status():
               in: body
               type: list of string
               required: true
+            - name: active
+              in: body
+              type: boolean
+              required: false
+              description: status to set, false (deactivate) by default
         responses:
           201:
             description: returns OK if the equipments were correctly updated
           400:
             description: Error
     """
-    input_data = request.json
-    errors = update_equipment_schema.validate(input_data)
-    if errors:
-      return {'message':str(errors)}, 400
+    # the codes are deserialized and validated once
+    try:
+      input_data = update_equipment_schema.load(request.json)
+    except ValidationError as e:
+      return {'message':str(e.messages)}, 400
 
-    message, status_code = 'OK', 201
     transaction = db.session
     try:
-      transaction.query(equipment).filter(
-        equipment.code.in_(
-          input_data.get('codes')
-        )
-      ).update({
-        equipment.active: False
-      })
+      set_equipment_status(transaction, input_data['codes'], input_data['active'])
+      response_cache.touch(transaction, 'equipment')
       transaction.commit()
     except Exception as e:
       transaction.rollback()
-      if isinstance(e.orig, UniqueViolation):
-        message, status_code = 'Duplicated equipment code', 409
-      else:
-        logger.error(e)
-        message, status_code = str(e), 400
+      logger.error(e)
+      return {'message': str(e)}, 400
 
-    return {'message':message}, status_code
+    return {'message': 'OK'}, 201
+
+@equipments_blueprint.route('/update_equipments_status', methods=['PUT'])
+def update_equipments_status():
+    """Activate or deactivate up to a million equipments, reporting the codes that matched no equipment
+        ---
+        parameters:
+            - name: codes
+              in: body
+              type: list of string
+              required: true
+            - name: active
+              in: body
+              type: boolean
+              required: false
+              description: status to set, false (deactivate) by default
+        responses:
+          201:
+            description: returns the number of distinct codes, of updated equipments, of equipments already in the status and the unmatched codes
+          400:
+            description: Error
+    """
+    # the codes are deserialized and validated once
+    try:
+      input_data = update_equipments_schema.load(request.json)
+    except ValidationError as e:
+      return {'message':str(e.messages)}, 400
+
+    transaction = db.session
+    try:
+      codes, updated, unchanged, unmatched = set_equipment_status(
+        transaction, input_data['codes'], input_data['active']
+      )
+      response_cache.touch(transaction, 'equipment')
+      transaction.commit()
+    except Exception as e:
+      transaction.rollback()
+      logger.error(e)
+      return {'message': str(e)}, 400
+
+    return {
+      'active': input_data['active'],
+      'codes': codes,
+      'updated': updated,
+      'unchanged': unchanged,
+      'unmatched': unmatched
+    }, 201
+
+def set_equipment_status(transaction, codes, active):
+    """Sets the status of the equipments of the codes, a chunk of distinct codes per statement.
+
+    Each chunk is bound as one array parameter. Equipments already in the
+    status are not rewritten. Returns the number of distinct codes, of
+    updated equipments and of equipments already in the status, and the
+    codes matching no equipment.
+    """
+    codes = list(dict.fromkeys(codes))
+    updated, unchanged, unmatched = 0, 0, []
+    for chunk in ingestion.chunks(codes, current_app.config.get('EQUIPMENT_STATUS_CHUNK_SIZE', 10_000)):
+      changed = set(transaction.execute(
+        equipment.__table__.update().where(
+          equipment.code == any_(bindparam('codes', chunk, type_=ARRAY(db.String))),
+          equipment.active.is_distinct_from(active)
+        ).values(
+          active=active
+        ).returning(equipment.code)
+      ).scalars())
+      rest = [code for code in chunk if code not in changed]
+      existing = set(transaction.execute(
+        select(equipment.code).where(
+          equipment.code == any_(bindparam('codes', rest, type_=ARRAY(db.String)))
+        )
+      ).scalars()) if rest else set()
+      updated += len(changed)
+      unchanged += len(existing)
+      unmatched.extend(code for code in rest if code not in existing)
+    return len(codes), updated, unchanged, unmatched
 
 @equipments_blueprint.route('/active_equipments', methods=['GET'])
+@response_cache.cached('equipment')
+@replicas.read_only
 def active_equipment():
     """active_equipments
         ---
@@ -192,9 +430,26 @@ def active_equipment():
               in: query
               type: string
               required: true
+            - name: limit
+              in: query
+              type: integer
+              required: false
+              description: page size, the response then has the equipments and the next keys, next to be used as after
+            - name: after
+              in: query
+              type: integer
+              required: false
+              description: only equipments with a greater id are returned
+            - name: stream
+              in: query
+              type: boolean
+              required: false
+              description: streams the response from a server side cursor
         responses:
           200:
             description: returns a json with equipments key and a list of equipments
+          304:
+            description: not modified since the ETag sent in If-None-Match
           400:
             description: error
     """
@@ -203,25 +458,58 @@ def active_equipment():
     if errors:
       return {'message':str(errors)}, 400
 
-    ref_vessel = db.session.query(vessel).filter(
-      vessel.code == input_data.get('vessel_code')
-    ).first()
+    input_data = active_equipment_schema.load(input_data)
+    vessel_code = input_data.get('vessel_code')
+    vessel_id = code_cache.vessel_id(vessel_code)
 
-    if not ref_vessel:
+    if not vessel_id:
       return {'message': 'Invalid vessel code'}, 400
 
+    limit = input_data.get('limit')
+    statement = reads.active_equipments(vessel_id, input_data)
+
+    if input_data.get('stream'):
+      return Response(
+        stream_with_context(stream_equipments(vessel_code, statement, limit)),
+        mimetype='application/json'
+      )
+
     try:
-      equipments = db.session.query(equipment).filter(
-        equipment.vessel_id == ref_vessel.id \
-          and equipment.active == True
-      ).all()
+      rows = reads.fetch_all(statement, reads.EquipmentRow)
     except Exception as e:
       logger.error(e)
       return {'message': str(e)}, 400
 
-    return {
-      ref_vessel.code: equipments_output_schema.dump(equipments)
-    }, 200
+    if reads.fast_json(current_app):
+      return current_app.response_class(
+        reads.active_equipments_json(vessel_code, rows, limit), mimetype='application/json'
+      )
+    return reads.active_equipments_response(vessel_code, rows, limit), 200
+
+def stream_equipments(vessel_code, statement, limit, batch_size=1_000):
+    """Yields the json of active_equipments in chunks, reading the rows with a server side cursor"""
+    if limit:
+      yield '{"equipments":'
+    yield f'{{{json.dumps(vessel_code)}:['
+    sent, last_id, has_next = 0, None, False
+    try:
+      for batch in reads.stream(statement, reads.EquipmentRow, batch_size):
+        if limit and sent + len(batch) > limit:
+          batch, has_next = batch[:limit - sent], True
+        if not batch:
+          break
+        # the items of the batch, without the brackets of the list
+        yield (b',' if sent else b'') + reads.dumps(reads.equipment_items(batch))[1:-1]
+        sent, last_id = sent + len(batch), batch[-1].id
+    except Exception as e:
+      # the status was already sent, the client gets an incomplete json
+      logger.error(e)
+      raise
+
+    if limit:
+      yield f']}},"next":{json.dumps(last_id if has_next else None)}}}'
+    else:
+      yield ']}'
 
 @operation_order_blueprint.route('/insert_operation', methods=['POST'])
 def insert_operation():
@@ -243,31 +531,32 @@ def insert_operation():
         responses:
           201:
             description: returns OK if the equipment was correctly inserted
+          202:
+            description: the operation was queued and will be inserted (write-behind mode)
           400:
             description: Error
+          503:
+            description: the write-behind buffer is full
     """
     input_data = request.json
     errors = create_operation_schema.validate(input_data)
     if errors:
       return {'message':str(errors)}, 400
     
-    ref_equipment = db.session.query(equipment).filter(
-      equipment.code == input_data.get('code')
-    ).first()
-
-    if not ref_equipment:
-      return {'message': 'Invalid equipment code'}, 400
-    
-    new_operation = OperationOrder(
-      equipment_id = ref_equipment.id,
-      type=input_data.get('type'),
-      cost=input_data.get('cost')
-    )
+    writer = write_behind.writer()
+    if writer is not None:
+      ref_equipment = code_cache.equipment(input_data.get('code'))
+      if not ref_equipment:
+        return {'message': 'Invalid equipment code'}, 400
+      return enqueue_operation(writer, ref_equipment, input_data)
 
     message, status_code = 'OK', 201
     transaction = db.session
     try:
-      transaction.add(new_operation)
+      if transaction.execute(operation_statement(input_data)).scalar() is None:
+        transaction.rollback()
+        return {'message': 'Invalid equipment code'}, 400
+      response_cache.touch(transaction, 'operation_order', published=True)
       transaction.commit()
     except Exception as e:
       transaction.rollback()
@@ -276,7 +565,147 @@ def insert_operation():
 
     return {'message':message}, status_code
 
+def operation_statement(input_data):
+    """One statement resolving the equipment, inserting the operation and adding it to the rollups.
+
+    Returns the id of the equipment, no row when the code matches none.
+    """
+    cost = bindparam('cost', input_data.get('cost'), type_=db.Float)
+    operation_type = bindparam('type', input_data.get('type'), type_=db.String)
+    # Core tables, ORM enabled statements drop the CTEs added with add_cte
+    equipments = equipment.__table__
+    ref = select(equipments.c.id, equipments.c.vessel_id).where(
+      equipments.c.code == input_data.get('code')
+    ).cte('ref')
+    operation_orders = OperationOrder.__table__
+    new_operation = insert(operation_orders).from_select(
+      ['equipment_id', 'type', 'cost'],
+      select(ref.c.id, operation_type, cost)
+    ).returning(operation_orders.c.equipment_id).cte('new_operation')
+    # the rollups add the requested cost, as record_operations does
+    operations = select(
+      ref.c.vessel_id,
+      new_operation.c.equipment_id,
+      cost.label('cost'),
+      operation_type.label('type')
+    ).join_from(
+      new_operation, ref, ref.c.id == new_operation.c.equipment_id
+    ).cte('operations')
+    statement = response_cache.touching(select(operations.c.equipment_id), 'operation_order')
+    for cte in rollups.recording_ctes(operations):
+      statement = statement.add_cte(cte)
+    return statement
+
+def enqueue_operation(writer, ref_equipment, input_data):
+    """Hands the operation to the write-behind buffer"""
+    try:
+      pending = writer.submit(
+        ref_equipment.id, ref_equipment.vessel_id,
+        input_data.get('type'), input_data.get('cost')
+      )
+    except queue.Full:
+      return {'message': 'Too many pending operations, retry later'}, 503
+
+    if current_app.config['OPERATION_WRITE_BEHIND'] == 'async':
+      return {'message': 'Accepted'}, 202
+
+    # group commit: wait for the transaction of the batch
+    if not pending.done.wait(current_app.config['OPERATION_WAIT_TIMEOUT']):
+      return {'message': 'Accepted'}, 202
+    if pending.error is not None:
+      return {'message': str(pending.error)}, 400
+    return {'message': 'OK'}, 201
+
+@operation_order_blueprint.route('/upload_operations', methods=['POST'])
+def upload_operations():
+    """upload_operations
+        ---
+        consumes:
+            - application/x-ndjson
+            - text/csv
+        parameters:
+            - name: body
+              in: body
+              type: string
+              required: true
+              description: one operation order (code, type and cost) per line, as NDJSON or as CSV with a header
+        responses:
+          201:
+            description: returns the number of accepted and rejected rows and the rejected rows
+          400:
+            description: Error
+    """
+    try:
+      rows = ingestion.read_rows(request.stream, request.mimetype)
+    except ingestion.UnsupportedUpload as e:
+      return {'message': str(e)}, 400
+
+    accepted, rejected, rejected_rows = 0, 0, []
+    def reject(line, message):
+      nonlocal rejected
+      rejected += 1
+      if len(rejected_rows) < ingestion.MAX_REPORTED_REJECTIONS:
+        rejected_rows.append({'line': line, 'message': message})
+
+    transaction = db.session
+    try:
+      for chunk in ingestion.chunks(rows):
+        # what is written is what the schema loaded, each row on its own
+        loaded = []
+        for line, row in chunk:
+          try:
+            loaded.append((line, create_operation_schema.load(row), None))
+          except ValidationError as e:
+            loaded.append((line, None, e.messages))
+        codes = list({row['code'] for _, row, row_errors in loaded if not row_errors})
+        equipments = {
+          row.code: row
+          for row in reads.fetch_all(
+            select(equipment.code, equipment.id, equipment.vessel_id).where(
+              equipment.code == any_(bindparam('codes', codes, type_=ARRAY(db.String)))
+            ),
+            reads.CodeRef
+          )
+        } if codes else {}
+
+        new_operations = []
+        for line, row, row_errors in loaded:
+          if row_errors:
+            reject(line, str(row_errors))
+          elif row['code'] not in equipments:
+            reject(line, 'Invalid equipment code')
+          else:
+            new_operations.append((equipments[row['code']], row))
+
+        if new_operations:
+          ingestion.copy_rows(
+            transaction, OperationOrder.__tablename__,
+            ['equipment_id', 'type', 'cost'], [
+              (equip.id, row['type'], row['cost'])
+              for equip, row in new_operations
+            ]
+          )
+          rollups.record_operations(transaction, [
+            (equip.vessel_id, equip.id, row['cost'], row['type'])
+            for equip, row in new_operations
+          ])
+          accepted += len(new_operations)
+      response_cache.touch(transaction, 'operation_order')
+      transaction.commit()
+    except Exception as e:
+      transaction.rollback()
+      logger.error(e)
+      return {'message': str(e)}, 400
+
+    return {
+      'accepted': accepted,
+      'rejected': rejected,
+      'rejected_rows': rejected_rows
+    }, 201
+
 @operation_order_blueprint.route('/total_cost', methods=['GET'])
+@response_cache.cached('equipment', 'operation_order')
+@replicas.read_only
 def total_cost():
     """total_cost
         ---
@@ -289,9 +718,23 @@ def total_cost():
               in: query
               type: string
               required: false
+            - name: start
+              in: query
+              type: string
+              format: date-time
+              required: false
+              description: only operations executed from this time on
+            - name: end
+              in: query
+              type: string
+              format: date-time
+              required: false
+              description: only operations executed before this time
         responses:
           200:
             description: returns a json with equipments key and a list of equipments
+          304:
+            description: not modified since the ETag sent in If-None-Match
           400:
             description: error
     """
@@ -300,62 +743,117 @@ def total_cost():
     if errors:
       return {'message':str(errors)}, 400
 
-    ref_equipments = db.session.query(equipment).filter(
-      or_(
-        equipment.code == input_data.get('code', ''),
-        equipment.name == input_data.get('name', '')
-      )
-    ).all()
-
-    if len(ref_equipments) < 1:
-      return {'message': 'Invalid parameters'}, 400
-
-    total = .0
     try:
-      total = db.session.query(
-        func.sum(OperationOrder.cost).label('total')
-      ).filter(
-        OperationOrder.equipment_id.in_([
-          equip.id
-          for equip in ref_equipments
-        ])
-      ).first()[0]
-
+      matched, total = reads.fetch_one(
+        reads.total_cost(total_cost_schema.load(input_data))
+      )
     except Exception as e:
       logger.error(e)
       return {'message': str(e)}, 400
 
-    return {
-      'total_cost': total
-    }, 200
+    if matched < 1:
+      return {'message': 'Invalid parameters'}, 400
+
+    return reads.total_cost_response(total), 200
 
 @operation_order_blueprint.route('/average_cost', methods=['GET'])
+@response_cache.cached('operation_order')
+@replicas.read_only
 def average_cost():
     """average_cost
         ---
+        parameters:
+            - name: start
+              in: query
+              type: string
+              format: date-time
+              required: false
+              description: only operations executed from this time on
+            - name: end
+              in: query
+              type: string
+              format: date-time
+              required: false
+              description: only operations executed before this time
         responses:
           200:
             description: returns a json with equipments key and a list of equipments
+          304:
+            description: not modified since the ETag sent in If-None-Match
           400:
             description: error
     """
+    input_data = request.get_json(silent=True) or {}
+    errors = average_cost_schema.validate(input_data)
+    if errors:
+      return {'message':str(errors)}, 400
 
     try:
-      averages = db.session.query(
-        func.avg(OperationOrder.cost).label('average'),
-        vessel.code
-      ).join(
-        equipment, equipment.id == OperationOrder.equipment_id
-      ).join(
-        vessel, vessel.id == equipment.vessel_id
-      ).group_by(
-        vessel.code
-      ).all()
+      averages = reads.fetch_all(
+        reads.average_cost(average_cost_schema.load(input_data))
+      )
     except Exception as e:
       logger.error(e)
       return {'message': str(e)}, 400
 
-    return {
-      row.code: round(row.average, 2)
-      for row in averages
-    }, 200
\ No newline at end of file
+    return reads.average_cost_response(averages), 200
+
+@operation_order_blueprint.route('/cost_series', methods=['GET'])
+@response_cache.cached('operation_order')
+@replicas.read_only
+def cost_series():
+    """cost_series
+        ---
+        parameters:
+            - name: start
+              in: query
+              type: string
+              format: date
+              required: true
+              description: first UTC day of the series
+            - name: end
+              in: query
+              type: string
+              format: date
+              required: true
+              description: UTC day after the series, at most 3660 days after start
+            - name: bucket
+              in: query
+              type: string
+              enum: [day, month]
+              required: false
+              default: day
+            - name: group_by
+              in: query
+              type: string
+              enum: [vessel, equipment, type]
+              required: false
+              default: vessel
+            - name: code
+              in: query
+              type: string
+              required: false
+              description: only the vessel or equipment with this code
+        responses:
+          200:
+            description: returns a json with a list of buckets, oldest first, by vessel or equipment code or type. Buckets without operations are left out
+          304:
+            description: not modified since the ETag sent in If-None-Match
+          400:
+            description: error
+    """
+    input_data = request.get_json(silent=True) or {}
+    errors = cost_series_schema.validate(input_data)
+    if errors:
+      return {'message':str(errors)}, 400
+
+    try:
+      rows = reads.fetch_all(
+        reads.cost_series(cost_series_schema.load(input_data))
+      )
+    except Exception as e:
+      logger.error(e)
+      return {'message': str(e)}, 400
+
+    return reads.cost_series_response(rows), 200
+
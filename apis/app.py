@@ -1,8 +1,14 @@
 from flask import Flask
 from flask_marshmallow import Marshmallow
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 
+from apis import notifications
+from apis.code_cache import code_cache
+from apis.metrics import metrics, metrics_blueprint
+from apis.profiling import profiling
+from apis.replicas import replicas
+from apis.response_cache import response_cache
+from apis.write_behind import write_behind
 from apis.api import (
     healthcheck_blueprint, 
     vessels_blueprint, 
@@ -15,21 +21,35 @@ def create_app(app_name='VESSELS', test_config=False, production_conf=False):
 
     if test_config:
         app.config.from_object('config.TestConfig')
+    elif production_conf:
+        app.config.from_object('config.ProductionConfig')
     else:
         app.config.from_object('config.RunConfig')
 
-    from apis.models.model import db, migrate, ma
-    migrate = Migrate(app, db)
+    from apis.models.model import db, ma, slow_query_log
     ma = Marshmallow(app)
 
     # Register api blueprints
     app.register_blueprint(healthcheck_blueprint)
+    app.register_blueprint(metrics_blueprint)
     app.register_blueprint(vessels_blueprint, url_prefix='/vessel')
     app.register_blueprint(equipments_blueprint, url_prefix='/equipment')
     app.register_blueprint(operation_order_blueprint, url_prefix='/operation_order')
 
+    # imported here, flasgger is only needed when the docs are served
+    if app.config.get('API_DOCS'):
+        from flasgger import Swagger
+        Swagger(app)
+
     db.init_app(app)
-    migrate.init_app(app, db)
+    replicas.init_app(app)
+    slow_query_log.init_app(app)
+    metrics.init_app(app)
+    profiling.init_app(app)
+    code_cache.init_app(app)
+    response_cache.init_app(app)
+    write_behind.init_app(app)
+    notifications.start(app)
 
     return app
 
@@ -0,0 +1,146 @@
+"""Cache of the business code -> primary key resolutions.
+
+Misses are not cached, so creating a vessel or an equipment needs no
+invalidation. Explicit invalidations are published with NOTIFY and every
+worker listening on the channel drops the matching entries.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import select
+
+from apis import notifications, reads
+from apis.models.equipment import equipment
+from apis.models.model import db
+
+CHANNEL = 'code_cache'
+KINDS = ('vessel', 'equipment')
+
+
+class LRUCache:
+    """Thread safe LRU mapping whose entries expire after ttl seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class CodeCache:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CODE_CACHE_SIZE', 10_000)
+        app.config.setdefault('CODE_CACHE_TTL', 300)
+        app.config.setdefault('CODE_CACHE_LISTEN', False)
+        app.extensions['code_cache'] = {
+            kind: LRUCache(app.config['CODE_CACHE_SIZE'], app.config['CODE_CACHE_TTL'])
+            for kind in KINDS
+        }
+        if app.config['CODE_CACHE_LISTEN']:
+            self.subscribe(app)
+
+    def caches(self, app=None):
+        return (app or current_app).extensions['code_cache']
+
+    def _resolve(self, kind, code, load):
+        cache = self.caches()[kind]
+        value = cache.get(code)
+        if value is None:
+            value = load()
+            if value is not None:
+                cache.set(code, value)
+        return value
+
+    def vessel_id(self, code):
+        """Returns the id of the vessel with the code, or None"""
+        return self._resolve('vessel', code, lambda: db.session.connection().execute(
+            reads.vessel_id_of(code)
+        ).scalar())
+
+    def equipment(self, code):
+        """Returns the (id, vessel_id) row of the equipment with the code, or None"""
+        return self._resolve('equipment', code, lambda: reads.fetch_one(
+            select(equipment.id, equipment.vessel_id).where(equipment.code == code),
+            reads.EquipmentRef
+        ))
+
+    def stats(self):
+        return {kind: cache.stats() for kind, cache in self.caches().items()}
+
+    def invalidate(self, kind=None, code=None):
+        """Drops entries locally and publishes the invalidation to the other workers.
+
+        Without a kind every entry is dropped, without a code every entry of
+        the kind.
+        """
+        self.apply_invalidation(self.caches(), kind, code)
+        with db.engine.begin() as connection:
+            notifications.publish(
+                connection, CHANNEL, json.dumps({'kind': kind, 'code': code})
+            )
+
+    @staticmethod
+    def apply_invalidation(caches, kind, code):
+        for cache_kind, cache in caches.items():
+            if kind is None or kind == cache_kind:
+                cache.invalidate(code)
+
+    def subscribe(self, app):
+        caches = self.caches(app)
+
+        def handle(payload):
+            payload = json.loads(payload)
+            self.apply_invalidation(caches, payload.get('kind'), payload.get('code'))
+
+        notifications.subscribe(
+            app, CHANNEL, handle,
+            on_reconnect=lambda: self.apply_invalidation(caches, None, None)
+        )
+
+
+code_cache = CodeCache()
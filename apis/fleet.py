@@ -0,0 +1,92 @@
+"""Synthetic fleet generator used to load production sized data.
+
+Rows are generated by Postgres with generate_series, one statement per
+chunk of vessels, so nothing is built in Python. Codes continue after the
+existing ids and conflicting ones are skipped.
+"""
+from datetime import date
+
+from sqlalchemy import text
+
+from apis import partitions, rollups
+from apis.response_cache import response_cache
+
+TYPES = ('replacement', 'repair', 'inspection', 'maintenance')
+LOCATIONS = ('brazil', 'norway', 'singapore', 'usa', 'china', 'netherlands')
+
+_SEED_CHUNK = text('''
+WITH new_vessels AS (
+  INSERT INTO vessels (code)
+  SELECT 'V' || lpad(upper(to_hex(:vessel_base + n)), 7, '0')
+  FROM generate_series(:first, :last) n
+  ON CONFLICT DO NOTHING
+  RETURNING id
+), new_equipments AS (
+  INSERT INTO equipments (vessel_id, code, name, location, active)
+  SELECT
+    v.id,
+    'E' || lpad(upper(to_hex(:equipment_base + (v.rank - 1) * :per_vessel + n)), 7, '0'),
+    'equipment ' || n,
+    (:locations)[1 + (v.id + n) % cardinality(:locations)],
+    random() >= :inactive_ratio
+  FROM (SELECT id, row_number() OVER (ORDER BY id) AS rank FROM new_vessels) v,
+    generate_series(1, :per_vessel) n
+  ON CONFLICT DO NOTHING
+  RETURNING id
+), new_orders AS (
+  INSERT INTO operation_order (equipment_id, type, cost, executed_at)
+  SELECT
+    e.id,
+    (:types)[1 + n % cardinality(:types)],
+    round((random() * 10000)::numeric, 2),
+    now() - random() * (now() - :since)
+  FROM new_equipments e, generate_series(1, :per_equipment) n
+  RETURNING 1
+)
+SELECT
+  (SELECT count(*) FROM new_vessels) AS vessels,
+  (SELECT count(*) FROM new_equipments) AS equipments,
+  (SELECT count(*) FROM new_orders) AS orders
+''')
+
+
+def seed(transaction, vessels, equipments_per_vessel, orders_per_equipment,
+         months=1, inactive_ratio=0.25, chunk_size=1_000):
+    """Generates the fleet and rebuilds the rollups, committing every chunk.
+
+    Operation orders are spread from the start of the month months - 1 ago
+    until now, their partitions are created first. Returns the number of
+    vessels, equipments and operation orders created.
+    """
+    since = partitions.month_start(date.today(), 1 - months)
+    partitions.ensure_partitions(transaction, since=since)
+    transaction.commit()
+
+    vessel_base, equipment_base = transaction.execute(text(
+        'SELECT (SELECT coalesce(max(id), 0) FROM vessels), '
+        '(SELECT coalesce(max(id), 0) FROM equipments)'
+    )).one()
+
+    created = {'vessels': 0, 'equipments': 0, 'orders': 0}
+    for first in range(1, vessels + 1, chunk_size):
+        last = min(first + chunk_size - 1, vessels)
+        row = transaction.execute(_SEED_CHUNK, {
+            'vessel_base': vessel_base,
+            'equipment_base': equipment_base + (first - 1) * equipments_per_vessel,
+            'first': first,
+            'last': last,
+            'per_vessel': equipments_per_vessel,
+            'per_equipment': orders_per_equipment,
+            'inactive_ratio': inactive_ratio,
+            'since': since,
+            'locations': list(LOCATIONS),
+            'types': list(TYPES)
+        }).one()
+        transaction.commit()
+        for key in created:
+            created[key] += row._mapping[key]
+
+    rollups.rebuild(transaction)
+    response_cache.touch(transaction, 'vessel', 'equipment', 'operation_order')
+    transaction.commit()
+    return created
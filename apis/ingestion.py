@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+from itertools import islice
+
+CSV_MIMETYPES = ('text/csv',)
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines')
+CHUNK_SIZE = 5_000
+MAX_REPORTED_REJECTIONS = 1_000
+
+
+class UnsupportedUpload(ValueError):
+    pass
+
+
+def _decoded_lines(stream):
+    # the characters that are not UTF-8 are replaced, for the validation to reject them
+    for line in stream:
+        yield line.decode('utf-8', errors='replace')
+
+
+def _ndjson_rows(stream):
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line.decode('utf-8'))
+        except ValueError:
+            # UnicodeDecodeError included
+            yield line_number, None
+
+
+def _csv_rows(stream):
+    reader = csv.DictReader(_decoded_lines(stream))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_rows(stream, mimetype):
+    """Returns a lazy iterator of (line number, row) over an NDJSON or CSV body.
+
+    The stream is consumed line by line, so only the current line is kept
+    in memory. NDJSON lines that can not be decoded or parsed are yielded
+    as None.
+    """
+    if mimetype in NDJSON_MIMETYPES:
+        return _ndjson_rows(stream)
+    if mimetype in CSV_MIMETYPES:
+        return _csv_rows(stream)
+    raise UnsupportedUpload(f'Unsupported content type {mimetype}')
+
+
+def chunks(iterable, size=CHUNK_SIZE):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def copy_rows(transaction, table, columns, rows):
+    """Loads rows with COPY inside the transaction of the given session"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    cursor = transaction.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+    finally:
+        cursor.close()
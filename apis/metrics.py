@@ -0,0 +1,515 @@
+"""Prometheus metrics of the requests, the SQL statements and the connection pool.
+
+Metrics are kept per worker process and exposed in the Prometheus text
+format on /metrics. Latencies are measured until the view returns, so the
+body of streamed responses is not included.
+
+With METRICS_DIR, every worker writes its samples to a file of that
+directory every METRICS_WRITE_INTERVAL seconds, and /metrics renders the
+samples of all the workers: counters and histograms are summed, including
+the workers that exited, gauges of the live workers are summed or, for
+ratios and lags, their maximum is kept.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Blueprint, Response, current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from apis.models.model import db
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+logger = logging.getLogger(__name__)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+    # how the gauges of several workers are combined, sum or max
+    aggregate = 'sum'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', labels + [('le', _format_value(bound))], cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Collected(Metric):
+    """Metric whose samples are read from the app when scraped"""
+
+    def __init__(self, name, documentation, type, collect, labelnames=(), aggregate='sum'):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.collect = collect
+        self.aggregate = aggregate
+
+    def samples(self):
+        for key, value in self.collect():
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self):
+        """Samples of the metrics, by metric name"""
+        return {metric.name: list(metric.samples()) for metric in self.metrics}
+
+    def render(self, collected=None):
+        collected = collected if collected is not None else self.collect()
+        lines = []
+        for metric in self.metrics:
+            samples = collected.get(metric.name)
+            if not samples:
+                continue
+            lines.extend(metric.header())
+            lines.extend(
+                f'{name}{_format_labels(labels)} {_format_value(value)}'
+                for name, labels, value in samples
+            )
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(metric, sample_sets):
+    """Samples of a metric over the sample sets of several workers"""
+    merged = {}
+    for samples in sample_sets:
+        for name, labels, value in samples:
+            key = (name, tuple(tuple(label) for label in labels))
+            if key not in merged:
+                merged[key] = value
+            elif metric.type == 'gauge' and metric.aggregate == 'max':
+                merged[key] = max(merged[key], value)
+            else:
+                merged[key] += value
+    return [(name, list(labels), value) for (name, labels), value in merged.items()]
+
+
+class SharedSamples:
+    """Samples of the workers of a server, exchanged through a directory.
+
+    Each worker writes its own <pid>.json. The files of the workers that
+    exited are folded into archive.json, keeping their counters and
+    histograms and dropping their gauges.
+    """
+    ARCHIVE = 'archive.json'
+
+    def __init__(self, registry, path, interval):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.pid = os.getpid()
+        os.makedirs(path, exist_ok=True)
+
+    def start(self):
+        threading.Thread(target=self._run, name='metrics-writer', daemon=True).start()
+        atexit.register(self.write)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except Exception as e:
+                logger.warning(f'Could not write the metrics of worker {self.pid}: {e}')
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def write(self, collected=None):
+        collected = collected if collected is not None else self.registry.collect()
+        temporary = self._file(f'.{self.pid}.json')
+        with open(temporary, 'w') as output:
+            json.dump(collected, output)
+        os.replace(temporary, self._file(f'{self.pid}.json'))
+
+    def _read(self, name):
+        try:
+            with open(self._file(name)) as input:
+                return json.load(input)
+        except (OSError, ValueError):
+            return {}
+
+    def collect(self):
+        """Samples of every worker, this one read live"""
+        own = self.registry.collect()
+        live = [own]
+        with open(self._file('.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive = self._read(self.ARCHIVE)
+            exited = []
+            for name in os.listdir(self.path):
+                pid = name[:-len('.json')]
+                if not pid.isdigit() or int(pid) == self.pid:
+                    continue
+                samples = self._read(name)
+                if _alive(int(pid)):
+                    live.append(samples)
+                else:
+                    exited.append((name, samples))
+            if exited:
+                archive = {
+                    metric.name: _merge(metric, [archive.get(metric.name, [])] + [
+                        samples.get(metric.name, []) for _, samples in exited
+                    ])
+                    for metric in self.registry.metrics if metric.type != 'gauge'
+                }
+                temporary = self._file(f'.{self.ARCHIVE}')
+                with open(temporary, 'w') as output:
+                    json.dump(archive, output)
+                os.replace(temporary, self._file(self.ARCHIVE))
+                for name, _ in exited:
+                    os.remove(self._file(name))
+
+        return {
+            metric.name: _merge(metric, [samples.get(metric.name, []) for samples in live] + (
+                [] if metric.type == 'gauge' else [archive.get(metric.name, [])]
+            ))
+            for metric in self.registry.metrics
+        }
+
+
+class TimedQueuePool(QueuePool):
+    """Queue pool that reports how long checkouts wait for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if has_app_context():
+                registry = current_app.extensions.get('metrics')
+                if registry is not None:
+                    registry.pool_wait.observe(time.perf_counter() - start)
+
+
+def _route_labels():
+    return {
+        'blueprint': request.blueprint or '',
+        'route': request.url_rule.rule if request.url_rule is not None else '<unmatched>',
+        'method': request.method
+    }
+
+
+def _pool_stats(app):
+    with app.app_context():
+        pool = db.engine.pool
+    if not isinstance(pool, QueuePool):
+        return None
+    return {
+        'size': pool.size(),
+        'max_overflow': pool._max_overflow,
+        'checked_out': pool.checkedout(),
+        'idle': pool.checkedin()
+    }
+
+
+class Metrics:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        registry = Registry()
+        requests_labels = ('blueprint', 'route', 'method')
+        registry.in_flight = registry.register(Gauge(
+            'http_requests_in_flight', 'Requests being served', ('blueprint',)
+        ))
+        registry.latency = registry.register(Histogram(
+            'http_request_duration_seconds', 'Time to build the response', requests_labels
+        ))
+        registry.responses = registry.register(Counter(
+            'http_responses_total', 'Responses by status code', requests_labels + ('status',)
+        ))
+        registry.request_statements = registry.register(Histogram(
+            'http_request_sql_statements', 'SQL statements executed by a request',
+            requests_labels, COUNT_BUCKETS
+        ))
+        registry.request_sql = registry.register(Histogram(
+            'http_request_sql_duration_seconds', 'Time spent executing SQL by a request',
+            requests_labels
+        ))
+        registry.statements = registry.register(Histogram(
+            'sql_statement_duration_seconds', 'Duration of the SQL statements', ('verb',)
+        ))
+        registry.pool_wait = registry.register(Histogram(
+            'db_pool_checkout_wait_seconds', 'Time waited for a pooled connection'
+        ))
+        registry.writer_batch_size = registry.register(Histogram(
+            'operation_writer_batch_size', 'Operations per write-behind batch', buckets=BATCH_BUCKETS
+        ))
+        registry.writer_flush = registry.register(Histogram(
+            'operation_writer_flush_duration_seconds', 'Time to insert and commit a write-behind batch'
+        ))
+        self._register_collected(app, registry)
+        app.extensions['metrics'] = registry
+
+        app.config.setdefault('METRICS_DIR', '')
+        app.config.setdefault('METRICS_WRITE_INTERVAL', 5)
+        registry.shared = None
+        if app.config['METRICS_DIR']:
+            registry.shared = SharedSamples(
+                registry, app.config['METRICS_DIR'], app.config['METRICS_WRITE_INTERVAL']
+            )
+            registry.shared.start()
+
+        # the pool is created with the engine, on first use
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'poolclass': TimedQueuePool, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        }
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    @staticmethod
+    def _register_collected(app, registry):
+        def pool(stat):
+            def collect():
+                stats = _pool_stats(app)
+                return [((), stats[stat])] if stats else []
+            return collect
+
+        def pool_utilization():
+            stats = _pool_stats(app)
+            if not stats:
+                return []
+            capacity = stats['size'] + max(stats['max_overflow'], 0)
+            return [((), stats['checked_out'] / capacity)] if capacity else []
+
+        for stat, documentation in (
+            ('size', 'Connections kept in the pool'),
+            ('checked_out', 'Connections in use'),
+            ('idle', 'Connections waiting in the pool')
+        ):
+            registry.register(Collected(f'db_pool_{stat}', documentation, 'gauge', pool(stat)))
+        registry.register(Collected(
+            'db_pool_utilization', 'Connections in use over the pool capacity',
+            'gauge', pool_utilization, aggregate='max'
+        ))
+
+        def code_cache(stat):
+            def collect():
+                return [
+                    ((kind,), cache.stats()[stat])
+                    for kind, cache in app.extensions['code_cache'].items()
+                ]
+            return collect
+
+        for stat, name, type in (
+            ('hits', 'code_cache_hits_total', 'counter'),
+            ('misses', 'code_cache_misses_total', 'counter'),
+            ('evictions', 'code_cache_evictions_total', 'counter'),
+            ('size', 'code_cache_size', 'gauge')
+        ):
+            registry.register(Collected(
+                name, f'Code cache {stat}', type, code_cache(stat), ('kind',)
+            ))
+
+        def writer(stat):
+            def collect():
+                writer = app.extensions.get('operation_writer')
+                return [((), writer.stats()[stat])] if writer is not None else []
+            return collect
+
+        for stat, name, type in (
+            ('queue_depth', 'operation_writer_queue_depth', 'gauge'),
+            ('batches', 'operation_writer_batches_total', 'counter'),
+            ('flushed', 'operation_writer_flushed_total', 'counter'),
+            ('failed', 'operation_writer_failed_total', 'counter'),
+            ('flush_seconds', 'operation_writer_flush_seconds_total', 'counter')
+        ):
+            registry.register(Collected(name, f'Write-behind {stat}', type, writer(stat)))
+
+        def replica_lag():
+            router = app.extensions.get('replicas')
+            if router is None:
+                return []
+            return [((bind,), lag) for bind, lag in router.stats()['lag'].items() if lag is not None]
+
+        def replica_reads():
+            router = app.extensions.get('replicas')
+            return list(router.stats()['reads'].items()) if router is not None else []
+
+        registry.register(Collected(
+            'db_replica_lag_seconds', 'Last measured replication lag', 'gauge',
+            replica_lag, ('bind',), aggregate='max'
+        ))
+        registry.register(Collected(
+            'db_replica_reads_total', 'Read only views by database and reason', 'counter',
+            replica_reads, ('target', 'reason')
+        ))
+
+    @staticmethod
+    def registry():
+        return current_app.extensions['metrics']
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql = [0, 0.0]
+        self.registry().in_flight.inc(blueprint=request.blueprint or '')
+
+    def _after_request(self, response):
+        start = g.get('metrics_start')
+        if start is not None:
+            registry = self.registry()
+            labels = _route_labels()
+            registry.latency.observe(time.perf_counter() - start, **labels)
+            registry.responses.inc(status=response.status_code, **labels)
+            statements, duration = g.metrics_sql
+            registry.request_statements.observe(statements, **labels)
+            registry.request_sql.observe(duration, **labels)
+        return response
+
+    def _teardown_request(self, exception):
+        if g.pop('metrics_start', None) is not None:
+            self.registry().in_flight.dec(blueprint=request.blueprint or '')
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['metrics_start'].pop()
+    if not has_app_context():
+        return
+    registry = current_app.extensions.get('metrics')
+    if registry is None:
+        return
+    registry.statements.observe(elapsed, verb=statement.lstrip().split(None, 1)[0].upper())
+    if has_request_context() and 'metrics_sql' in g:
+        g.metrics_sql[0] += 1
+        g.metrics_sql[1] += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # failed statements never reach after_cursor_execute
+    if context.connection is not None and context.cursor is not None:
+        starts = context.connection.info.get('metrics_start')
+        if starts:
+            starts.pop()
+
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+def export():
+    """Metrics of this worker, or of every worker with METRICS_DIR, in the Prometheus text format
+        ---
+        responses:
+          200:
+            description: Request latencies, status codes, SQL timings, pool and cache usage
+    """
+    registry = Metrics.registry()
+    collected = registry.shared.collect() if registry.shared is not None else None
+    return Response(registry.render(collected), content_type=CONTENT_TYPE)
+
+
+metrics = Metrics()
@@ -0,0 +1,11 @@
+from apis.models.model import db
+
+
+class DailyEquipmentCost(db.Model):
+    __tablename__ = 'daily_equipment_costs'
+
+    equipment_id = db.Column(db.BigInteger, db.ForeignKey('equipments.id'), primary_key=True)
+    # UTC day the operations were executed
+    day = db.Column(db.Date, primary_key=True, index=True)
+    total_cost = db.Column(db.Float, nullable=False, default=0)
+    operations = db.Column(db.BigInteger, nullable=False, default=0)
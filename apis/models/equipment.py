@@ -3,10 +3,13 @@ from apis.models.model import db
 
 class equipment(db.Model):
     __tablename__ = 'equipments'
+    __table_args__ = (
+        db.Index('ix_equipments_vessel_id_active_id', 'vessel_id', 'active', 'id'),
+    )
 
     id = db.Column(db.BigInteger, primary_key=True)
     vessel_id = db.Column(db.BigInteger, db.ForeignKey('vessels.id'))
-    name = db.Column(db.String(256))
+    name = db.Column(db.String(256), index=True)
     code = db.Column(db.String(8), unique=True)
     location = db.Column(db.String(256))
     active = db.Column(db.Boolean)
@@ -0,0 +1,9 @@
+from apis.models.model import db
+
+
+class EquipmentCost(db.Model):
+    __tablename__ = 'equipment_costs'
+
+    equipment_id = db.Column(db.BigInteger, db.ForeignKey('equipments.id'), primary_key=True)
+    total_cost = db.Column(db.Float, nullable=False, default=0)
+    operations = db.Column(db.BigInteger, nullable=False, default=0)
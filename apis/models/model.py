@@ -1,11 +1,194 @@
-from flask_sqlalchemy import SQLAlchemy
-from flask import Flask
-from config import TestConfig
+import hashlib
+import logging
+import queue
+import re
+import threading
+import time
+from collections import deque
+
+from flask import current_app, g, has_app_context, has_request_context, request
 from flask_marshmallow import Marshmallow
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+import psycopg2
+from sqlalchemy import event, orm
+from sqlalchemy.engine import Engine
+
+
+class RoutingSession(SignallingSession):
+    """Runs the statements on the bind chosen by apis.replicas, if any"""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        bind = g.get('db_bind') if has_app_context() else None
+        if bind is not None and not self._flushing:
+            return get_state(self.app).db.get_engine(self.app, bind=bind)
+        return super().get_bind(mapper, clause)
 
-db = SQLAlchemy()
-migrate = Migrate()
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
 ma = Marshmallow()
 
+logger = logging.getLogger('apis.slow_queries')
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r'%\(\w+?_\d+\)s(?:\s*,\s*%\(\w+?_\d+\)s)*')
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """Identifies a statement regardless of its literals and expanded IN lists"""
+    normalized = _LITERALS.sub('?', statement)
+    normalized = _PLACEHOLDER_LISTS.sub('?', normalized)
+    normalized = _SPACES.sub(' ', normalized).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+class SlowQueryLog:
+    """Logs the statements slower than SLOW_QUERY_THRESHOLD_MS.
+
+    SELECT statements also get their EXPLAIN (ANALYZE, BUFFERS) plan, run by a
+    background thread on its own connection in a read only transaction. A
+    fingerprint is explained at most once per SLOW_QUERY_EXPLAIN_INTERVAL
+    seconds and at most SLOW_QUERY_EXPLAIN_PER_MINUTE plans are captured.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 0)
+        app.config.setdefault('SLOW_QUERY_EXPLAIN', True)
+        app.config.setdefault('SLOW_QUERY_EXPLAIN_INTERVAL', 600)
+        app.config.setdefault('SLOW_QUERY_EXPLAIN_PER_MINUTE', 6)
+        app.config.setdefault('SLOW_QUERY_EXPLAIN_TIMEOUT_MS', 10_000)
+        if not app.config['SLOW_QUERY_THRESHOLD_MS']:
+            app.extensions['slow_query_log'] = None
+            return
+
+        app.extensions['slow_query_log'] = SlowQueries(app)
+        for name, listener in (
+            ('before_cursor_execute', _before_cursor_execute),
+            ('after_cursor_execute', _after_cursor_execute),
+            ('handle_error', _handle_error)
+        ):
+            if not event.contains(Engine, name, listener):
+                event.listen(Engine, name, listener)
+
+
+class SlowQueries:
+    def __init__(self, app):
+        self.threshold = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000
+        self.explain = app.config['SLOW_QUERY_EXPLAIN']
+        self.interval = app.config['SLOW_QUERY_EXPLAIN_INTERVAL']
+        self.per_minute = app.config['SLOW_QUERY_EXPLAIN_PER_MINUTE']
+        self.timeout_ms = app.config['SLOW_QUERY_EXPLAIN_TIMEOUT_MS']
+        self.recent = deque(maxlen=100)
+        self.queue = queue.Queue(100)
+        self._explained_at = {}
+        self._captures = deque()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def record(self, statement, parameters, duration, executemany, url):
+        entry = {
+            'fingerprint': fingerprint(statement),
+            'endpoint': request.endpoint if has_request_context() else threading.current_thread().name,
+            'duration_ms': round(duration * 1000, 3),
+            'statement': statement,
+            'parameters': parameters,
+            'plan': None
+        }
+        logger.warning(
+            f"Slow statement {entry['fingerprint']} from {entry['endpoint']} "
+            f"took {entry['duration_ms']}ms: {statement} {parameters}"
+        )
+        self.recent.append(entry)
+        if self.explain and not executemany and self._should_explain(statement, entry['fingerprint']):
+            self._ensure_started()
+            try:
+                # explained where it ran, the primary or a replica
+                self.queue.put_nowait((entry, url))
+            except queue.Full:
+                pass
+
+    def _should_explain(self, statement, key):
+        if not statement.lstrip()[:6].upper() == 'SELECT':
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained_at.get(key, -self.interval) < self.interval:
+                return False
+            while self._captures and now - self._captures[0] >= 60:
+                self._captures.popleft()
+            if len(self._captures) >= self.per_minute:
+                return False
+            self._explained_at[key] = now
+            self._captures.append(now)
+            return True
+
+    def _ensure_started(self):
+        # started on first use, so each forked worker gets its own thread
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name='slow-query-explain', daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            entry, url = self.queue.get()
+            try:
+                entry['plan'] = self._explain(url, entry['statement'], entry['parameters'])
+                logger.warning(f"Plan of slow statement {entry['fingerprint']}:\n{entry['plan']}")
+            except Exception as e:
+                logger.error(f"Could not explain slow statement {entry['fingerprint']}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _explain(self, url, statement, parameters):
+        # own connection, outside of the pool used by the requests
+        connection = psycopg2.connect(
+            url.set(drivername='postgresql').render_as_string(hide_password=False)
+        )
+        try:
+            # read only, so that explaining can never change or lock data
+            connection.set_session(readonly=True)
+            with connection.cursor() as cursor:
+                cursor.execute(f'SET LOCAL statement_timeout = {int(self.timeout_ms)}')
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters)
+                return '\n'.join(row[0] for row in cursor.fetchall())
+        finally:
+            connection.rollback()
+            connection.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('slow_query_start')
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    if not has_app_context():
+        return
+    slow_queries = current_app.extensions.get('slow_query_log')
+    if slow_queries is not None and duration >= slow_queries.threshold:
+        slow_queries.record(statement, parameters, duration, executemany, conn.engine.url)
+
+
+def _handle_error(context):
+    starts = context.connection.info.get('slow_query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+slow_query_log = SlowQueryLog()
@@ -1,10 +1,30 @@
+from sqlalchemy import DDL, event
+
 from apis.models.model import db
 
 
 class OperationOrder(db.Model):
     __tablename__ = 'operation_order'
+    __table_args__ = (
+        db.Index(
+            'ix_operation_order_equipment_id_executed_at', 'equipment_id', 'executed_at',
+            postgresql_include=['cost']
+        ),
+        # monthly partitions are created by apis.partitions
+        {'postgresql_partition_by': 'RANGE (executed_at)'}
+    )
 
-    id = db.Column(db.BigInteger, primary_key=True)
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
     equipment_id = db.Column(db.BigInteger, db.ForeignKey('equipments.id'))
     type = db.Column(db.String(64))
     cost = db.Column(db.Float(2))
+    # part of the primary key, as the partition key must be
+    executed_at = db.Column(
+        db.DateTime(timezone=True), primary_key=True, server_default=db.func.now()
+    )
+
+
+# rows outside of the monthly partitions
+event.listen(OperationOrder.__table__, 'after_create', DDL(
+    'CREATE TABLE operation_order_default PARTITION OF operation_order DEFAULT'
+))
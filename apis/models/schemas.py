@@ -1,5 +1,5 @@
-from marshmallow import Schema, fields
-from marshmallow.validate import Length
+from marshmallow import Schema, ValidationError, fields, validates_schema
+from marshmallow.validate import Length, OneOf, Range
 
 from apis.models.model import ma
 
@@ -7,12 +7,26 @@ from apis.models.model import ma
 class CreateVesselInputSchema(Schema):
     code = fields.Str(required=True, validate=Length(1, 8))
 
+class CreateVesselsInputSchema(Schema):
+    codes = fields.List(
+        fields.Raw(allow_none=True),
+        validate=Length(1, 10_000),
+        required=True
+    )
+
 class CreateEquipmentInputSchema(Schema):
     vessel_code = fields.Str(required=True, validate=Length(1, 8))
     code = fields.Str(required=True, validate=Length(1, 8))
     name = fields.Str(required=True, validate=Length(1, 256))
     location = fields.Str(required=True, validate=Length(1, 256))
 
+class CreateEquipmentsInputSchema(Schema):
+    equipments = fields.List(
+        fields.Raw(allow_none=True),
+        validate=Length(1, 10_000),
+        required=True
+    )
+
 class UpdateEquipmentInputSchema(Schema):
     codes = fields.List(
         fields.Str(
@@ -21,9 +35,22 @@ class UpdateEquipmentInputSchema(Schema):
         validate=Length(1, 10_000), 
         required=True
     )
+    active = fields.Bool(load_default=False)
+
+class UpdateEquipmentsInputSchema(UpdateEquipmentInputSchema):
+    codes = fields.List(
+        fields.Str(
+            validate=Length(1, 8)
+        ),
+        validate=Length(1, 1_000_000),
+        required=True
+    )
 
 class ActiveEquipmentInputSchema(Schema):
     vessel_code = fields.Str(required=True, validate=Length(1, 8))
+    limit = fields.Int(required=False, validate=Range(1, 10_000))
+    after = fields.Int(required=False, validate=Range(min=0))
+    stream = fields.Bool(required=False)
 
 class EquipmentOutputSchema(ma.Schema):
     class Meta:
@@ -34,6 +61,38 @@ class CreateOperationOrderInputSchema(Schema):
     type = fields.Str(required=True, validate=Length(1, 64))
     cost = fields.Decimal(required=True, places=2)
 
-class TotalCostOperationInputSchema(Schema):
+class ExecutionRangeInputSchema(Schema):
+    start = fields.DateTime(required=False)
+    end = fields.DateTime(required=False)
+
+    @validates_schema
+    def validate_range(self, data, **kwargs):
+        if 'start' in data and 'end' in data:
+            if (data['start'].tzinfo is None) != (data['end'].tzinfo is None):
+                raise ValidationError('Must have a timezone if start has one.', 'end')
+            if data['start'] >= data['end']:
+                raise ValidationError('Must be after start.', 'end')
+
+class TotalCostOperationInputSchema(ExecutionRangeInputSchema):
     code = fields.Str(required=False, validate=Length(1, 8))
-    name = fields.Str(required=False, validate=Length(1, 256))
\ No newline at end of file
+    name = fields.Str(required=False, validate=Length(1, 256))
+
+class AverageCostInputSchema(ExecutionRangeInputSchema):
+    pass
+
+class CostSeriesInputSchema(Schema):
+    bucket = fields.Str(load_default='day', validate=OneOf(('day', 'month')))
+    group_by = fields.Str(load_default='vessel', validate=OneOf(('vessel', 'equipment', 'type')))
+    start = fields.Date(required=True)
+    end = fields.Date(required=True)
+    code = fields.Str(required=False, validate=Length(1, 8))
+
+    @validates_schema
+    def validate_series(self, data, **kwargs):
+        if 'start' in data and 'end' in data:
+            if data['start'] >= data['end']:
+                raise ValidationError('Must be after start.', 'end')
+            if (data['end'] - data['start']).days > 3_660:
+                raise ValidationError('Must be at most 3660 days after start.', 'end')
+        if 'code' in data and data.get('group_by') == 'type':
+            raise ValidationError('Only vessels and equipments have codes.', 'code')
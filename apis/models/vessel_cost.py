@@ -0,0 +1,9 @@
+from apis.models.model import db
+
+
+class VesselCost(db.Model):
+    __tablename__ = 'vessel_costs'
+
+    vessel_id = db.Column(db.BigInteger, db.ForeignKey('vessels.id'), primary_key=True)
+    total_cost = db.Column(db.Float, nullable=False, default=0)
+    operations = db.Column(db.BigInteger, nullable=False, default=0)
@@ -0,0 +1,98 @@
+"""Postgres LISTEN/NOTIFY used to keep the in-process caches of the workers coherent.
+
+Extensions subscribe handlers to channels while the app is created, then a
+single thread per app listens on all of them.
+"""
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+from sqlalchemy import func, text, true
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+
+def _state(app):
+    return app.extensions.setdefault('notifications', {'channels': {}, 'thread': None})
+
+
+def subscribe(app, channel, handler, on_reconnect=None):
+    """Calls handler(payload) for every notification on the channel.
+
+    on_reconnect() is called whenever the listener (re)connects, since
+    notifications sent while it was disconnected are lost.
+    """
+    _state(app)['channels'].setdefault(channel, []).append((handler, on_reconnect))
+
+
+def publish(connection, channel, payload):
+    """Sends the notification, delivered only if the transaction commits"""
+    connection.execute(
+        text('SELECT pg_notify(:channel, :payload)'),
+        {'channel': channel, 'payload': payload}
+    )
+
+
+def publishing(statement, channel, payload):
+    """Returns the statement sending the notification in its round trip.
+
+    The statement is a select or a write returning rows. As with publish,
+    the notification is delivered only if the transaction commits.
+    """
+    if not isinstance(statement, Select):
+        statement = statement.cte('written').select()
+    # a CTE is only evaluated when the query reads it
+    notify = func.pg_notify(channel, payload).select().cte(f'notify_{channel}')
+    return statement.join(notify, true())
+
+
+def start(app):
+    """Starts the listener thread if any channel was subscribed"""
+    state = _state(app)
+    if not state['channels'] or state['thread'] is not None:
+        return state['thread']
+
+    state['thread'] = threading.Thread(
+        target=_listen, args=(app.config['SQLALCHEMY_DATABASE_URI'], state['channels']),
+        name='notifications-listener', daemon=True
+    )
+    state['thread'].start()
+    return state['thread']
+
+
+def _dispatch(channels, notify):
+    for handler, _ in channels.get(notify.channel, []):
+        try:
+            handler(notify.payload)
+        except Exception as e:
+            logger.error(f'Invalid notification on {notify.channel}: {notify.payload} ({e})')
+
+
+def _listen(dsn, channels, poll_timeout=5, retry_delay=1):
+    while True:
+        connection = None
+        try:
+            connection = psycopg2.connect(dsn)
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                for channel in channels:
+                    cursor.execute(f'LISTEN {channel}')
+            for subscriptions in channels.values():
+                for _, on_reconnect in subscriptions:
+                    if on_reconnect is not None:
+                        on_reconnect()
+
+            while True:
+                if select.select([connection], [], [], poll_timeout) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    _dispatch(channels, connection.notifies.pop(0))
+        except psycopg2.Error as e:
+            logger.error(f'Notifications listener disconnected: {e}')
+            if connection is not None:
+                connection.close()
+            time.sleep(retry_delay)
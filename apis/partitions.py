@@ -0,0 +1,90 @@
+"""Monthly range partitions of operation_order.
+
+Rows of months without a partition go to operation_order_default. Creating
+the partition of such a month moves its rows out of the default partition.
+"""
+from datetime import date
+
+from sqlalchemy import text
+
+from apis.models.operation_order import OperationOrder
+
+TABLE = OperationOrder.__tablename__
+DEFAULT_PARTITION = f'{TABLE}_default'
+LOCK_ID = 72146094
+
+
+def month_start(day, months=0):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_{month:%Y_%m}'
+
+
+def existing_partitions(connection):
+    return set(connection.execute(text(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE parent.relname = :table'
+    ), {'table': TABLE}).scalars())
+
+
+def create_partition(connection, month):
+    """Creates the partition of the month, moving its rows out of the default partition"""
+    name, start, end = partition_name(month), month, month_start(month, 1)
+    # held until the end of the transaction: rows inserted in the default
+    # partition after the move would make the attach fail
+    connection.execute(text(f'LOCK TABLE {DEFAULT_PARTITION} IN SHARE ROW EXCLUSIVE MODE'))
+    connection.execute(text(
+        f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+    ))
+    connection.execute(text(
+        f'WITH moved AS ('
+        f'  DELETE FROM {DEFAULT_PARTITION} WHERE executed_at >= :start AND executed_at < :end'
+        f'  RETURNING *'
+        f') INSERT INTO {name} SELECT * FROM moved'
+    ), {'start': start, 'end': end})
+    # indexes and foreign keys of the parent are created while attaching
+    connection.execute(text(
+        f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    return name
+
+
+def ensure_partitions(connection, months_ahead=3, since=None):
+    """Creates the missing monthly partitions, from the month of since (this
+    month by default) to months_ahead months later. Returns their names.
+    """
+    # replicas running the maintenance together create each partition once
+    connection.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': LOCK_ID})
+    existing = existing_partitions(connection)
+    first = month_start(since or date.today())
+    last = month_start(date.today(), months_ahead)
+
+    created = []
+    month = first
+    while month <= last:
+        if partition_name(month) not in existing:
+            created.append(create_partition(connection, month))
+        month = month_start(month, 1)
+    return created
+
+
+def include_object(connection):
+    """Returns an alembic include_object hook that skips the partitions, as
+    they are created here and not declared by the models.
+    """
+    partitions = set(connection.execute(text(
+        'SELECT relname FROM pg_class WHERE relispartition'
+    )).scalars())
+
+    def include(object, name, type_, reflected, compare_to):
+        if type_ == 'table':
+            return name not in partitions
+        table = getattr(object, 'table', None)
+        return table is None or table.name not in partitions
+    return include
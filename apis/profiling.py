@@ -0,0 +1,153 @@
+"""Opt-in profiling of single requests.
+
+With PROFILING_ENABLED, requests carrying the PROFILING_HEADER (whose value
+must match PROFILING_TOKEN when one is set) run under cProfile and record
+every SQL statement with its parameters and duration. The results are
+written to PROFILING_DIR, or returned instead of the body when no
+directory is set.
+
+Nothing is registered when profiling is disabled.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# cProfile can not profile two threads of a process at once
+_lock = threading.Lock()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.profiler = cProfile.Profile()
+        self.statements = []
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def finish(self):
+        self.profiler.disable()
+        self.duration = time.perf_counter() - self.start
+
+    def stats(self, limit):
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    def report(self, response, limit):
+        return {
+            'id': self.id,
+            'endpoint': request.endpoint,
+            'path': request.full_path,
+            'status': response.status_code,
+            'duration_ms': round(self.duration * 1000, 3),
+            'sql_ms': round(sum(statement['duration_ms'] for statement in self.statements), 3),
+            'sql': self.statements,
+            'profile': self.stats(limit)
+        }
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and g.get('profile') is not None:
+        conn.info.setdefault('profile_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or g.get('profile') is None:
+        return
+    profile = g.profile
+    end = time.perf_counter()
+    start = conn.info['profile_start'].pop()
+    profile.statements.append({
+        'statement': statement,
+        'parameters': parameters,
+        'start_ms': round((start - profile.start) * 1000, 3),
+        'duration_ms': round((end - start) * 1000, 3)
+    })
+
+
+def _handle_error(context):
+    starts = context.connection.info.get('profile_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+class Profiling:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILING_ENABLED', False)
+        app.config.setdefault('PROFILING_HEADER', 'X-Profile')
+        app.config.setdefault('PROFILING_TOKEN', '')
+        app.config.setdefault('PROFILING_DIR', '')
+        app.config.setdefault('PROFILING_STATS_LIMIT', 40)
+        if not app.config['PROFILING_ENABLED']:
+            return
+
+        if app.config['PROFILING_DIR']:
+            os.makedirs(app.config['PROFILING_DIR'], exist_ok=True)
+        for name, listener in (
+            ('before_cursor_execute', _before_cursor_execute),
+            ('after_cursor_execute', _after_cursor_execute),
+            ('handle_error', _handle_error)
+        ):
+            if not event.contains(Engine, name, listener):
+                event.listen(Engine, name, listener)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    @staticmethod
+    def _requested():
+        value = request.headers.get(current_app.config['PROFILING_HEADER'])
+        if value is None:
+            return False
+        token = current_app.config['PROFILING_TOKEN']
+        return not token or value == token
+
+    def _before_request(self):
+        if not self._requested() or not _lock.acquire(blocking=False):
+            return
+        g.profile = RequestProfile()
+        g.profile.profiler.enable()
+
+    def _after_request(self, response):
+        profile = g.get('profile')
+        if profile is None:
+            return response
+        profile.finish()
+        report = profile.report(response, current_app.config['PROFILING_STATS_LIMIT'])
+
+        directory = current_app.config['PROFILING_DIR']
+        if directory:
+            profile.profiler.dump_stats(os.path.join(directory, f'{profile.id}.prof'))
+            with open(os.path.join(directory, f'{profile.id}.json'), 'w') as output:
+                json.dump(report, output, indent=2, default=str)
+        else:
+            report['response'] = response.get_data(as_text=True) if not response.is_streamed else None
+            response = current_app.response_class(
+                json.dumps(report, default=str), response.status_code, mimetype='application/json'
+            )
+        response.headers['X-Profile-Id'] = profile.id
+        return response
+
+    def _teardown_request(self, exception):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            if profile.duration is None:
+                profile.finish()
+            _lock.release()
+
+
+profiling = Profiling()
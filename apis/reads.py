@@ -0,0 +1,282 @@
+"""Statements and responses of the read endpoints.
+
+Shared by the views of apis.api and the asyncio path of apis.aio, so both
+answer the same input with the same response.
+
+Column only statements run through fetch_all, fetch_one and stream on the
+connection of the session: the rows skip the ORM loading and the identity
+map and are kept as compact named tuples.
+
+active_equipments rows are encoded by dumps, with orjson when it is
+installed (pip3 install orjson), instead of going through the output schema.
+The bytes are the ones jsonify produces outside of debug.
+"""
+import json
+from collections import namedtuple
+
+from sqlalchemy import func, literal_column, or_, select
+
+from apis.models.daily_equipment_cost import DailyEquipmentCost
+from apis.models.daily_type_cost import DailyTypeCost
+from apis.models.daily_vessel_cost import DailyVesselCost
+from apis.models.equipment import equipment
+from apis.models.equipment_cost import EquipmentCost
+from apis.models.model import db
+from apis.models.operation_order import OperationOrder
+from apis.models.schemas import EquipmentOutputSchema
+from apis.models.vessel import vessel
+from apis.models.vessel_cost import VesselCost
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+equipments_output_schema = EquipmentOutputSchema(many=True)
+# output fields, in the order of the sorted keys
+EQUIPMENT_FIELDS = sorted(EquipmentOutputSchema.Meta.fields)
+
+# read only rows, tuples without a __dict__
+EquipmentRow = namedtuple('EquipmentRow', EQUIPMENT_FIELDS)
+EquipmentRef = namedtuple('EquipmentRef', 'id vessel_id')
+CodeRef = namedtuple('CodeRef', 'code id vessel_id')
+
+
+def fetch_all(statement, row_class=None):
+    """Rows of a column only statement, as row_class instances when given.
+
+    Unlike Session.execute, pending changes of the session are not flushed
+    first.
+    """
+    result = db.session.connection().execute(statement)
+    if row_class is None:
+        return result.all()
+    return [row_class._make(row) for row in result]
+
+
+def fetch_one(statement, row_class=None):
+    """First row of a column only statement, or None"""
+    row = db.session.connection().execute(statement).first()
+    if row is None or row_class is None:
+        return row
+    return row_class._make(row)
+
+
+def stream(statement, row_class, batch_size):
+    """Batches of rows read with a server side cursor"""
+    result = db.session.connection().execution_options(
+        stream_results=True
+    ).execute(statement)
+    try:
+        while True:
+            batch = result.fetchmany(batch_size)
+            if not batch:
+                return
+            yield [row_class._make(row) for row in batch]
+    finally:
+        result.close()
+
+
+def dumps(obj):
+    """Compact JSON with sorted keys and escaped non ASCII characters, as bytes"""
+    if orjson is not None:
+        output = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+        # orjson writes UTF-8, the rare non ASCII outputs are encoded again
+        if output.isascii():
+            return output
+    return json.dumps(obj, sort_keys=True, separators=(',', ':')).encode()
+
+
+def fast_json(app):
+    """Whether dumps gives the bytes of jsonify with the configuration of the app"""
+    return (
+        not app.debug
+        and app.config['JSON_AS_ASCII']
+        and app.config['JSON_SORT_KEYS']
+        and not app.config['JSONIFY_PRETTYPRINT_REGULAR']
+    )
+
+
+def execution_period(input_data):
+    """Filters of the operation orders executed in [start, end) of the input"""
+    period = []
+    if input_data.get('start') is not None:
+        period.append(OperationOrder.executed_at >= input_data['start'])
+    if input_data.get('end') is not None:
+        period.append(OperationOrder.executed_at < input_data['end'])
+    return period
+
+
+def vessel_id_of(vessel_code):
+    return select(vessel.id).where(vessel.code == vessel_code)
+
+
+def active_equipments(vessel_id, input_data):
+    """Rows of the output fields, lighter to load than equipment instances"""
+    statement = select(
+        *(getattr(equipment, field) for field in EQUIPMENT_FIELDS)
+    ).where(
+        equipment.vessel_id == vessel_id,
+        equipment.active == True,
+        equipment.id > input_data.get('after', 0)
+    ).order_by(
+        equipment.id
+    )
+    if input_data.get('limit'):
+        # one more row tells whether there is a next page
+        statement = statement.limit(input_data['limit'] + 1)
+    return statement
+
+
+def equipment_items(rows):
+    return [dict(zip(EQUIPMENT_FIELDS, row)) for row in rows]
+
+
+def page(equipments, next_id):
+    """Paged response, the cursor is kept apart from the keys of the vessel codes"""
+    return {
+        'equipments': equipments,
+        'next': next_id
+    }
+
+
+def active_equipments_response(vessel_code, equipments, limit):
+    """Response of the equipments, through the output schema"""
+    response = {
+        vessel_code: equipments_output_schema.dump(equipments[:limit])
+    }
+    if limit:
+        return page(response, equipments[limit - 1].id if len(equipments) > limit else None)
+    return response
+
+
+def active_equipments_json(vessel_code, rows, limit):
+    """Bytes of active_equipments_response for the rows of active_equipments"""
+    response = {
+        vessel_code: equipment_items(rows[:limit])
+    }
+    if limit:
+        response = page(response, rows[limit - 1].id if len(rows) > limit else None)
+    return dumps(response) + b'\n'
+
+
+def total_cost(input_data):
+    """Number of equipments matching the code or name and the sum of their costs"""
+    period = execution_period(input_data)
+    if period:
+        # only the partitions of the period are read
+        cost = select(
+            func.sum(OperationOrder.cost)
+        ).where(
+            OperationOrder.equipment_id == equipment.id,
+            *period
+        ).scalar_subquery()
+    else:
+        cost = EquipmentCost.total_cost
+
+    statement = select(
+        func.count(equipment.id),
+        func.sum(cost)
+    ).select_from(equipment)
+    if not period:
+        statement = statement.outerjoin(
+            EquipmentCost, EquipmentCost.equipment_id == equipment.id
+        )
+    return statement.where(
+        or_(
+            equipment.code == input_data.get('code', ''),
+            equipment.name == input_data.get('name', '')
+        )
+    )
+
+
+def total_cost_response(total):
+    return {
+        'total_cost': total
+    }
+
+
+def average_cost(input_data):
+    period = execution_period(input_data)
+    if period:
+        # only the partitions of the period are read
+        return select(
+            func.avg(OperationOrder.cost).label('average'),
+            vessel.code
+        ).join(
+            equipment, equipment.id == OperationOrder.equipment_id
+        ).join(
+            vessel, vessel.id == equipment.vessel_id
+        ).where(
+            *period
+        ).group_by(
+            vessel.code
+        )
+    return select(
+        (VesselCost.total_cost / VesselCost.operations).label('average'),
+        vessel.code
+    ).join(
+        vessel, vessel.id == VesselCost.vessel_id
+    ).where(
+        VesselCost.operations > 0
+    )
+
+
+def average_cost_response(averages):
+    return {
+        row.code: round(row.average, 2)
+        for row in averages
+    }
+
+
+def cost_series(input_data):
+    # served from the daily rollups, maintained with the operation orders
+    if input_data['group_by'] == 'vessel':
+        model = DailyVesselCost
+        group = vessel.code
+        join = (vessel, vessel.id == model.vessel_id)
+    elif input_data['group_by'] == 'equipment':
+        model = DailyEquipmentCost
+        group = equipment.code
+        join = (equipment, equipment.id == model.equipment_id)
+    else:
+        model = DailyTypeCost
+        group = model.type
+        join = None
+
+    if input_data['bucket'] == 'day':
+        bucket = model.day
+    else:
+        # inlined, server side parameters would make GROUP BY a different expression
+        bucket = func.date_trunc(literal_column("'month'"), model.day).cast(db.Date)
+
+    statement = select(
+        group.label('group'),
+        bucket.label('bucket'),
+        func.sum(model.total_cost).label('total_cost'),
+        func.sum(model.operations).label('operations')
+    ).select_from(model)
+    if join:
+        statement = statement.join(*join)
+    if 'code' in input_data:
+        statement = statement.where(group == input_data['code'])
+
+    return statement.where(
+        model.day >= input_data['start'],
+        model.day < input_data['end']
+    ).group_by(
+        group, bucket
+    ).order_by(
+        group, bucket
+    )
+
+
+def cost_series_response(rows):
+    series = {}
+    for row in rows:
+        series.setdefault(row.group, []).append({
+            'bucket': row.bucket.isoformat(),
+            'total_cost': round(row.total_cost, 2),
+            'operations': int(row.operations)
+        })
+    return series
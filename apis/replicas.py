@@ -0,0 +1,216 @@
+"""Routing of the read only views to the read replicas.
+
+Replicas are the SQLALCHEMY_BINDS named replica_*. The statements of the
+views decorated with replicas.read_only run on one of them, in turn, while
+its replication lag is below REPLICA_MAX_LAG seconds. Otherwise, or when no
+replica is configured, they run on the primary like every other statement.
+
+With REPLICA_STICKY_SECONDS, a client that wrote gets a cookie and its
+reads go to the primary for that long, so it always sees its own writes.
+A response read from a replica is cached, and gets an ETag, only when
+the replica had replayed the WAL of the primary up to a position measured
+after the writes counted by the response cache versions.
+
+Lags are measured with pg_stat_wal_receiver, readable by roles with
+pg_read_all_stats (e.g. pg_monitor). A replica whose WAL receiver is not
+streaming, or whose state cannot be read, is not used.
+"""
+import functools
+import logging
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, request
+from sqlalchemy import text
+
+from apis.code_cache import LRUCache
+from apis.models.model import db
+
+logger = logging.getLogger(__name__)
+
+BIND_PREFIX = 'replica_'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# 0 when the replica replayed everything it received, as
+# pg_last_xact_replay_timestamp() does not move while the primary is idle.
+# NULL, unknown, when the WAL receiver is not streaming: the replica may be
+# cut off from the primary with nothing left to replay.
+_LAG = text('''
+SELECT
+  CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+  END AS lag,
+  CASE
+    WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn()
+    ELSE pg_current_wal_lsn()
+  END - '0/0' AS replayed
+''')
+# end of the WAL of the primary, past the commits of the finished transactions
+_PRIMARY_LSN = text("SELECT pg_current_wal_lsn() - '0/0'")
+# (entities, versions) -> WAL position of the primary once they were read
+REQUIRED_LSNS_SIZE = 1_000
+REQUIRED_LSNS_TTL = 3600
+
+
+class Replica:
+    def __init__(self, bind):
+        self.bind = bind
+        # lag in seconds and replayed WAL position, None while unknown or unreachable
+        self.state = (None, None)
+        self.checked_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def lag(self):
+        return self.state[0]
+
+    def current_state(self, app, interval):
+        """Lag and replayed position measured at most once per interval, other threads get the last ones"""
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < interval:
+            return self.state
+        if not self._lock.acquire(blocking=False):
+            return self.state
+        try:
+            with db.get_engine(app, bind=self.bind).connect() as connection:
+                lag, replayed = connection.execute(_LAG).one()
+            self.state = (
+                float(lag) if lag is not None else None,
+                int(replayed) if lag is not None else None
+            )
+        except Exception as e:
+            logger.warning(f'Could not measure the lag of {self.bind}: {e}')
+            self.state = (None, None)
+        finally:
+            self.checked_at = time.monotonic()
+            self._lock.release()
+        return self.state
+
+
+class Router:
+    def __init__(self, app):
+        self.replicas = [
+            Replica(bind) for bind in sorted(app.config.get('SQLALCHEMY_BINDS') or {})
+            if bind.startswith(BIND_PREFIX)
+        ]
+        self.max_lag = app.config['REPLICA_MAX_LAG']
+        self.interval = app.config['REPLICA_LAG_CHECK_INTERVAL']
+        self.sticky = app.config['REPLICA_STICKY_SECONDS']
+        self.cookie = app.config['REPLICA_STICKY_COOKIE']
+        self.reads = Counter()  # (target, reason) -> reads
+        self._required_lsns = LRUCache(REQUIRED_LSNS_SIZE, REQUIRED_LSNS_TTL)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def choose(self, app):
+        """Bind of the replica serving the next read and the position it replayed, None for the primary"""
+        if self.sticky and self._wrote_recently():
+            self._count('primary', 'sticky')
+            return None
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        for n in range(len(self.replicas)):
+            replica = self.replicas[(start + n) % len(self.replicas)]
+            lag, replayed = replica.current_state(app, self.interval)
+            if lag is not None and lag <= self.max_lag:
+                self._count(replica.bind, 'replica')
+                return replica.bind, replayed
+        self._count('primary', 'lagging')
+        return None
+
+    def replayed_past(self, app, replayed, state):
+        """Whether a replica that replayed up to replayed has the writes counted by state"""
+        required = self._required_lsns.get(state)
+        if required is None:
+            # the writes were committed before their versions were bumped
+            try:
+                with db.get_engine(app).connect() as connection:
+                    required = int(connection.execute(_PRIMARY_LSN).scalar())
+            except Exception as e:
+                logger.warning(f'Could not read the WAL position of the primary: {e}')
+                return False
+            self._required_lsns.set(state, required)
+        return replayed is not None and replayed >= required
+
+    def _wrote_recently(self):
+        try:
+            return float(request.cookies.get(self.cookie, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _count(self, target, reason):
+        with self._lock:
+            self.reads[target, reason] += 1
+
+    def stats(self):
+        with self._lock:
+            reads = dict(self.reads)
+        return {
+            'lag': {replica.bind: replica.lag for replica in self.replicas},
+            'reads': reads
+        }
+
+
+class Replicas:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('REPLICA_MAX_LAG', 5.0)
+        app.config.setdefault('REPLICA_LAG_CHECK_INTERVAL', 1.0)
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 0)
+        app.config.setdefault('REPLICA_STICKY_COOKIE', 'db_primary_until')
+        router = Router(app)
+        if not router.replicas:
+            app.extensions['replicas'] = None
+            return
+
+        app.extensions['replicas'] = router
+        if router.sticky:
+            app.after_request(self._after_request)
+
+    @staticmethod
+    def _after_request(response):
+        router = current_app.extensions.get('replicas')
+        if router is None or request.method in SAFE_METHODS or response.status_code >= 400:
+            return response
+        response.set_cookie(
+            router.cookie, str(time.time() + router.sticky),
+            max_age=int(router.sticky) + 1, httponly=True, samesite='Lax'
+        )
+        return response
+
+    def read_only(self, view):
+        """Runs the statements of the view on a replica when one is fresh enough"""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            router = current_app.extensions.get('replicas')
+            chosen = router.choose(current_app._get_current_object()) if router is not None else None
+            if chosen is None:
+                return view(*args, **kwargs)
+
+            # bind and replayed position, measured before the view runs
+            g.db_bind = chosen[0]
+            g.read_from_replica = chosen
+            try:
+                return view(*args, **kwargs)
+            finally:
+                g.pop('db_bind', None)
+        return wrapper
+
+    def has_writes_of(self, replayed, state):
+        """Whether a response read from a replica that replayed up to replayed
+        has the writes counted by state, the versions of the response cache"""
+        router = current_app.extensions.get('replicas')
+        return router is not None and router.replayed_past(
+            current_app._get_current_object(), replayed, state
+        )
+
+
+replicas = Replicas()
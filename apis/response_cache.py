@@ -0,0 +1,239 @@
+"""Cache of the responses of the read endpoints.
+
+Entries are keyed on the endpoint, its normalized input and the versions of
+the entities it reads. Writes touch the entities they change and their
+versions are bumped once the transaction commits, so older entries are
+never served again and just age out of the backend.
+
+The same key gives the ETag of the responses, so conditional requests are
+answered with 304 without running the view.
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+import uuid
+from collections import defaultdict
+from functools import wraps
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from apis import notifications
+from apis.code_cache import LRUCache
+from apis.replicas import replicas
+
+CHANNEL = 'response_cache'
+TOUCHED = 'response_cache_touched'
+
+
+class MemoryBackend:
+    """Entries and versions kept in the process.
+
+    Validators include an epoch of the process, so an ETag only matches on
+    the worker that sent it. RedisBackend shares them between workers.
+    """
+    shared = False
+
+    def __init__(self, app):
+        self.ttl = app.config['RESPONSE_CACHE_TTL']
+        # a ttl of 0 keeps the entries until they are evicted
+        self.entries = LRUCache(app.config['RESPONSE_CACHE_SIZE'], self.ttl or math.inf)
+        self.versions = defaultdict(int)
+        self.coherent = app.config['RESPONSE_CACHE_LISTEN']
+        # versions are counted per process, so they only identify a state
+        # together with the process
+        self.epoch = uuid.uuid4().hex
+        self._lock = threading.Lock()
+
+    def validator_token(self):
+        if self.coherent or not self.ttl:
+            return self.epoch
+        # writes made by other workers are unseen, validators expire like
+        # the entries do
+        return f'{self.epoch}:{int(time.time() // self.ttl)}'
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, response):
+        self.entries.set(key, response)
+
+    def versions_of(self, entities):
+        return tuple(self.versions[entity] for entity in entities)
+
+    def bump(self, entities):
+        with self._lock:
+            for entity in entities:
+                self.versions[entity] += 1
+
+    def clear(self):
+        self.entries.invalidate()
+
+
+class RedisBackend:
+    """Entries and versions shared by every worker through redis"""
+    shared = True
+
+    def __init__(self, app):
+        import redis
+        self.client = redis.Redis.from_url(app.config['RESPONSE_CACHE_REDIS_URL'])
+        self.ttl = app.config['RESPONSE_CACHE_TTL']
+
+    def validator_token(self):
+        return ''
+
+    def get(self, key):
+        value = self.client.get(f'response:{hashlib.sha1(key.encode()).hexdigest()}')
+        if value is None:
+            return None
+        data, status, mimetype = json.loads(value)
+        return data.encode(), status, mimetype
+
+    def set(self, key, response):
+        data, status, mimetype = response
+        self.client.set(
+            f'response:{hashlib.sha1(key.encode()).hexdigest()}',
+            json.dumps([data.decode(), status, mimetype]),
+            ex=self.ttl or None
+        )
+
+    def versions_of(self, entities):
+        return tuple(
+            int(version or 0)
+            for version in self.client.mget([f'version:{entity}' for entity in entities])
+        )
+
+    def bump(self, entities):
+        pipeline = self.client.pipeline()
+        for entity in entities:
+            pipeline.incr(f'version:{entity}')
+        pipeline.execute()
+
+    def clear(self):
+        pass
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'redis': RedisBackend
+}
+
+
+class ResponseCache:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_BACKEND', 'memory')
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 10_000)
+        app.config.setdefault('RESPONSE_CACHE_TTL', 60)
+        app.config.setdefault('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        app.config.setdefault('RESPONSE_CACHE_LISTEN', False)
+
+        backend_name = app.config['RESPONSE_CACHE_BACKEND']
+        backend = BACKENDS[backend_name](app) if backend_name else None
+        app.extensions['response_cache'] = backend
+
+        # versions of the memory backend are kept coherent between workers
+        # by notifying the bumps
+        if backend is not None and not backend.shared and app.config['RESPONSE_CACHE_LISTEN']:
+            notifications.subscribe(
+                app, CHANNEL,
+                lambda payload: backend.bump(json.loads(payload)),
+                on_reconnect=backend.clear
+            )
+
+    def backend(self):
+        return current_app.extensions.get('response_cache')
+
+    def _notified(self):
+        backend = self.backend()
+        return backend is not None and not backend.shared and current_app.config['RESPONSE_CACHE_LISTEN']
+
+    def touch(self, transaction, *entities, published=False):
+        """Marks the entities as changed by the transaction of the session.
+
+        With published, the statement of the write was built with touching
+        and already notifies the other workers.
+        """
+        backend = self.backend()
+        if backend is None:
+            return
+        transaction.info.setdefault(TOUCHED, set()).update(entities)
+        if not published and self._notified():
+            notifications.publish(transaction, CHANNEL, json.dumps(sorted(entities)))
+
+    def touching(self, statement, *entities):
+        """The statement of a write, notifying the other workers in its round trip"""
+        if not self._notified():
+            return statement
+        return notifications.publishing(statement, CHANNEL, json.dumps(sorted(entities)))
+
+    def cached(self, *entities):
+        """Caches the successful responses of a view that reads the entities.
+
+        Successful responses carry an ETag and requests with a matching
+        If-None-Match get a 304 without running the view.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                backend = self.backend()
+                if backend is None:
+                    return view(*args, **kwargs)
+
+                # versions are read before the view, so a concurrent write can
+                # only make an entry newer than its key
+                versions = backend.versions_of(entities)
+                key = json.dumps([
+                    request.endpoint,
+                    versions,
+                    sorted(request.args.items(multi=True)),
+                    request.get_json(silent=True)
+                ], sort_keys=True, separators=(',', ':'))
+                etag = hashlib.sha1(f'{backend.validator_token()}|{key}'.encode()).hexdigest()
+
+                cacheable = True
+                if request.if_none_match.contains(etag):
+                    response = current_app.response_class(status=304)
+                else:
+                    cached_response = backend.get(key)
+                    if cached_response is not None:
+                        data, status, mimetype = cached_response
+                        response = current_app.response_class(data, status, mimetype=mimetype)
+                    else:
+                        response = current_app.make_response(view(*args, **kwargs))
+                        # a replica may not have replayed the writes of the versions yet
+                        read_from_replica = g.pop('read_from_replica', None)
+                        if read_from_replica is not None:
+                            cacheable = replicas.has_writes_of(read_from_replica[1], (entities, versions))
+                        if response.status_code == 200 and not response.is_streamed and cacheable:
+                            backend.set(key, (response.get_data(), response.status_code, response.mimetype))
+
+                if response.status_code in (200, 304) and cacheable:
+                    response.set_etag(etag)
+                    response.cache_control.no_cache = True
+                return response
+            return wrapper
+        return decorator
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_touched(session):
+    entities = session.info.pop(TOUCHED, None)
+    if entities:
+        backend = current_app.extensions.get('response_cache')
+        if backend is not None:
+            backend.bump(entities)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_touched(session):
+    session.info.pop(TOUCHED, None)
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,170 @@
+"""Aggregates of operation_order kept up to date by every insertion path.
+
+They must be recorded in the same transaction as the operation orders, so
+a rollback also discards them.
+"""
+from collections import defaultdict
+
+from sqlalchemy import bindparam, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+
+from apis.models.daily_equipment_cost import DailyEquipmentCost
+from apis.models.daily_type_cost import DailyTypeCost
+from apis.models.daily_vessel_cost import DailyVesselCost
+from apis.models.equipment import equipment
+from apis.models.equipment_cost import EquipmentCost
+from apis.models.model import db
+from apis.models.operation_order import OperationOrder
+from apis.models.vessel_cost import VesselCost
+
+# rollup model -> position of its key in the recorded operations
+ROLLUPS = {
+    VesselCost: 0,
+    EquipmentCost: 1
+}
+# rollups bucketed by the UTC day the operations were executed
+DAILY_ROLLUPS = {
+    DailyVesselCost: 0,
+    DailyEquipmentCost: 1,
+    DailyTypeCost: 3
+}
+EXECUTION_DAY = func.timezone('UTC', OperationOrder.executed_at).cast(db.Date)
+# executed_at defaults to now(), the start of the transaction
+TODAY = func.timezone('UTC', func.now()).cast(db.Date)
+# columns of the recorded operations, in the order of the tuples
+OPERATION_COLUMNS = ('vessel_id', 'equipment_id', 'cost', 'type')
+
+
+def _key_column(model):
+    return model.__table__.primary_key.columns.values()[0]
+
+
+def _upsert(model, columns, query):
+    statement = insert(model).from_select(columns, query)
+    return statement.on_conflict_do_update(
+        index_elements=model.__table__.primary_key.columns.values(),
+        set_={
+            'total_cost': model.total_cost + statement.excluded.total_cost,
+            'operations': model.operations + statement.excluded.operations
+        }
+    )
+
+
+def _add_costs(transaction, model, costs, daily=False):
+    # Rows are locked in key order to avoid deadlocks between concurrent batches
+    keys = sorted(costs)
+    key_column = _key_column(model)
+    values = func.unnest(
+        bindparam('keys', type_=ARRAY(key_column.type)),
+        bindparam('totals', type_=ARRAY(db.Float)),
+        bindparam('counts', type_=ARRAY(db.BigInteger))
+    ).table_valued('key', 'total_cost', 'operations').render_derived()
+    columns = [key_column, model.total_cost, model.operations]
+    selected = [values.c.key, values.c.total_cost, values.c.operations]
+    if daily:
+        columns.append(model.day)
+        selected.append(TODAY)
+    transaction.execute(_upsert(model, columns, select(*selected)), {
+        'keys': keys,
+        'totals': [costs[key][0] for key in keys],
+        'counts': [costs[key][1] for key in keys]
+    })
+
+
+def record_operations(transaction, operations):
+    """Adds (vessel_id, equipment_id, cost, type) operations to the rollups.
+
+    The operations must be inserted by the transaction, with the default
+    executed_at.
+    """
+    rollups = {**ROLLUPS, **DAILY_ROLLUPS}
+    costs = {model: defaultdict(lambda: [0.0, 0]) for model in rollups}
+    for operation in operations:
+        for model, position in rollups.items():
+            cost = costs[model][operation[position]]
+            cost[0] += float(operation[2])
+            cost[1] += 1
+
+    for model, model_costs in costs.items():
+        if model_costs:
+            _add_costs(transaction, model, model_costs, daily=model in DAILY_ROLLUPS)
+
+
+def recording_ctes(operations):
+    """CTEs adding the rows of the operations CTE to the rollups.
+
+    operations has the OPERATION_COLUMNS of operation orders inserted by
+    the same statement, with the default executed_at. Attached to it with
+    add_cte, the rollups are updated in the round trip of the insertion.
+    """
+    ctes = []
+    for model, position in {**ROLLUPS, **DAILY_ROLLUPS}.items():
+        key = operations.c[OPERATION_COLUMNS[position]]
+        columns = [_key_column(model), model.total_cost, model.operations]
+        selected = [key, func.sum(operations.c.cost), func.count()]
+        if model in DAILY_ROLLUPS:
+            columns.append(model.day)
+            selected.append(TODAY)
+        ctes.append(_upsert(
+            model, columns, select(*selected).group_by(key).order_by(key)
+        ).cte(f'add_{model.__tablename__}'))
+    return ctes
+
+
+def _fresh_costs(transaction, source_columns):
+    return {
+        tuple(row[:-2]): (row.total_cost, row.operations)
+        for row in transaction.query(
+            *source_columns,
+            func.sum(OperationOrder.cost).label('total_cost'),
+            func.count(OperationOrder.id).label('operations')
+        ).join(
+            equipment, equipment.id == OperationOrder.equipment_id
+        ).filter(
+            source_columns[0].isnot(None)
+        ).group_by(
+            *source_columns
+        )
+    }
+
+
+def rebuild(transaction):
+    """Recomputes the rollups from operation_order.
+
+    Returns, for each rollup table, the keys whose stored rollup had
+    drifted. Inserts of operation orders are blocked until the transaction
+    ends.
+    """
+    transaction.execute(text(f'LOCK TABLE {OperationOrder.__tablename__} IN SHARE MODE'))
+
+    drifted = {}
+    for model, source_columns in (
+        (VesselCost, [equipment.vessel_id]),
+        (EquipmentCost, [equipment.id]),
+        (DailyVesselCost, [equipment.vessel_id, EXECUTION_DAY]),
+        (DailyEquipmentCost, [equipment.id, EXECUTION_DAY]),
+        (DailyTypeCost, [OperationOrder.type, EXECUTION_DAY])
+    ):
+        key_columns = model.__table__.primary_key.columns.values()
+        fresh = _fresh_costs(transaction, source_columns)
+        stored = {
+            tuple(row[:-2]): (row.total_cost, row.operations)
+            for row in transaction.query(*key_columns, model.total_cost, model.operations)
+        }
+        drifted[model.__tablename__] = sorted(
+            key[0] if len(key) == 1 else key
+            for key in fresh.keys() | stored.keys()
+            if fresh.get(key, (0, 0))[1] != stored.get(key, (0, 0))[1]
+            or abs(fresh.get(key, (0, 0))[0] - stored.get(key, (0, 0))[0]) > 0.005
+        )
+
+        transaction.query(model).delete()
+        transaction.bulk_insert_mappings(model, [
+            {
+                **{column.key: value for column, value in zip(key_columns, key)},
+                'total_cost': total_cost,
+                'operations': operations
+            }
+            for key, (total_cost, operations) in fresh.items()
+        ])
+    return drifted
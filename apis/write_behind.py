@@ -0,0 +1,195 @@
+"""Write-behind buffer of the operation orders.
+
+Requests enqueue validated orders and a flusher thread per app inserts them
+in batches, one transaction per batch, when the batch is full or the flush
+interval elapsed. Requests either wait for the commit of their batch (group
+commit) or are answered right away.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+
+from apis import rollups
+from apis.models.model import db
+from apis.models.operation_order import OperationOrder
+from apis.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+MODES = ('', 'wait', 'async')
+
+
+class PendingOperation:
+    __slots__ = ('equipment_id', 'vessel_id', 'type', 'cost', 'done', 'error')
+
+    def __init__(self, equipment_id, vessel_id, type, cost):
+        self.equipment_id = equipment_id
+        self.vessel_id = vessel_id
+        self.type = type
+        self.cost = cost
+        self.done = threading.Event()
+        self.error = None
+
+
+class OperationWriter:
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config['OPERATION_BATCH_SIZE']
+        self.flush_interval = app.config['OPERATION_FLUSH_INTERVAL']
+        self.queue = queue.Queue(app.config['OPERATION_QUEUE_SIZE'])
+        self.batches = self.flushed = self.failed = 0
+        self.last_batch_size = 0
+        self.flush_seconds = self.max_flush_seconds = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, equipment_id, vessel_id, type, cost):
+        """Enqueues the operation, raises queue.Full when the buffer is full"""
+        self._ensure_started()
+        pending = PendingOperation(equipment_id, vessel_id, type, cost)
+        self.queue.put_nowait(pending)
+        return pending
+
+    def _ensure_started(self):
+        # started on first use, so each forked worker gets its own thread
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name='operation-writer', daemon=True
+                    )
+                    self._thread.start()
+                    atexit.register(self.drain)
+
+    def drain(self, timeout=10):
+        """Waits until every enqueued operation was flushed"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(self.flush_interval / 2 or 0.001)
+        return not self.queue.unfinished_tasks
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # the thread must outlive any failure, or nothing is written anymore
+                logger.exception(f'Flush of {len(batch)} operations failed')
+                for pending in batch:
+                    if not pending.done.is_set():
+                        pending.error = pending.error or e
+                        pending.done.set()
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        with self.app.app_context():
+            try:
+                self._insert(batch)
+            except Exception as e:
+                logger.error(f'Batch of {len(batch)} operations failed, retrying one by one: {e}')
+                # one invalid operation must not fail the others
+                for pending in batch:
+                    try:
+                        self._insert([pending])
+                    except Exception as e:
+                        logger.error(e)
+                        pending.error = e
+            finally:
+                db.session.remove()
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.batches += 1
+            self.last_batch_size = len(batch)
+            self.failed += sum(1 for pending in batch if pending.error is not None)
+            self.flushed += sum(1 for pending in batch if pending.error is None)
+            self.flush_seconds += elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        for pending in batch:
+            pending.done.set()
+        registry = self.app.extensions.get('metrics')
+        if registry is not None:
+            registry.writer_batch_size.observe(len(batch))
+            registry.writer_flush.observe(elapsed)
+
+    def _insert(self, batch):
+        transaction = db.session
+        values = func.unnest(
+            bindparam('equipment_ids', type_=ARRAY(db.BigInteger)),
+            bindparam('types', type_=ARRAY(db.String)),
+            bindparam('costs', type_=ARRAY(db.Float))
+        ).table_valued('equipment_id', 'type', 'cost').render_derived()
+        try:
+            transaction.execute(insert(OperationOrder).from_select(
+                [OperationOrder.equipment_id, OperationOrder.type, OperationOrder.cost],
+                select(values.c.equipment_id, values.c.type, values.c.cost)
+            ), {
+                'equipment_ids': [pending.equipment_id for pending in batch],
+                'types': [pending.type for pending in batch],
+                'costs': [float(pending.cost) for pending in batch]
+            })
+            rollups.record_operations(transaction, [
+                (pending.vessel_id, pending.equipment_id, pending.cost, pending.type)
+                for pending in batch
+            ])
+            response_cache.touch(transaction, 'operation_order')
+            transaction.commit()
+        except Exception:
+            transaction.rollback()
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'batches': self.batches,
+                'flushed': self.flushed,
+                'failed': self.failed,
+                'last_batch_size': self.last_batch_size,
+                'flush_seconds': self.flush_seconds,
+                'max_flush_seconds': self.max_flush_seconds
+            }
+
+
+class WriteBehind:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('OPERATION_WRITE_BEHIND', '')
+        app.config.setdefault('OPERATION_BATCH_SIZE', 500)
+        app.config.setdefault('OPERATION_FLUSH_INTERVAL', 0.05)
+        app.config.setdefault('OPERATION_QUEUE_SIZE', 100_000)
+        app.config.setdefault('OPERATION_WAIT_TIMEOUT', 10)
+        if app.config['OPERATION_WRITE_BEHIND'] not in MODES:
+            raise ValueError(f'OPERATION_WRITE_BEHIND must be one of {MODES}')
+
+        app.extensions['operation_writer'] = \
+            OperationWriter(app) if app.config['OPERATION_WRITE_BEHIND'] else None
+
+    def writer(self):
+        return current_app.extensions.get('operation_writer')
+
+
+write_behind = WriteBehind()
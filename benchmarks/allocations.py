@@ -0,0 +1,150 @@
+"""Memory of the read paths: ORM entities against read only rows.
+
+    python3 benchmarks/allocations.py --rows 1000 10000 100000 --output allocations.json
+
+For every size, the database of TestConfig is dropped and one vessel gets
+that many active equipments. Each way of loading them then runs in a fresh
+interpreter, which reports:
+
+* the bytes and blocks allocated by one load and still held by its result,
+  and the peak during the load, from tracemalloc;
+* the growth of the peak RSS of the process over the load (ru_maxrss);
+* the duration of the load, measured again without tracemalloc.
+
+The ways are:
+
+* entities: equipment instances through the session, as before the read
+  only layer;
+* session_rows: the output columns through the session, ORM result rows;
+* read_rows: the output columns through reads.fetch_all, EquipmentRow
+  tuples outside of the identity map;
+* request: a whole active_equipments request through the test client.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+
+from apis.app import create_app
+from apis.models.model import db
+from serialization import seed
+
+WAYS = ('entities', 'session_rows', 'read_rows', 'request')
+
+# runs in a fresh interpreter: python - WAY ROWS ROOT
+MEASURE = '''
+import json, resource, sys, time, tracemalloc
+sys.path.append(sys.argv[3])
+from sqlalchemy import select
+from apis import reads
+from apis.app import create_app
+from apis.models.equipment import equipment
+from apis.models.model import db
+from apis.response_cache import response_cache
+
+way = sys.argv[1]
+app = create_app(test_config=True)
+app.debug = False
+# every request runs its query
+app.config['RESPONSE_CACHE_BACKEND'] = ''
+response_cache.init_app(app)
+client = app.test_client()
+
+with app.app_context():
+    vessel_id = db.session.execute(select(equipment.vessel_id).limit(1)).scalar()
+    statement = reads.active_equipments(vessel_id, {})
+
+    def load():
+        if way == 'entities':
+            return db.session.execute(
+                select(equipment).where(equipment.vessel_id == vessel_id, equipment.active == True)
+                .order_by(equipment.id)
+            ).scalars().all()
+        if way == 'session_rows':
+            return db.session.execute(statement).all()
+        if way == 'read_rows':
+            return reads.fetch_all(statement, reads.EquipmentRow)
+        return client.get('/equipment/active_equipments', json={'vessel_code': 'MVBENCH'}).get_data()
+
+    # warm up: connection, compiled statement cache, imports
+    load()
+    db.session.expunge_all()
+
+    start = time.perf_counter()
+    result = load()
+    seconds = time.perf_counter() - start
+    del result
+    db.session.expunge_all()
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = load()
+    after = tracemalloc.take_snapshot()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+
+print(json.dumps({
+    'held_kib': round(held / 1024, 1),
+    'peak_kib': round(peak / 1024, 1),
+    'held_blocks': blocks,
+    'maxrss_growth_kib': rss_after - rss_before,
+    'ms': round(seconds * 1000, 3)
+}))
+'''
+
+
+def measure(way, rows):
+    output = subprocess.run(
+        [sys.executable, '-', way, str(rows), ROOT],
+        input=MEASURE, cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--way', choices=WAYS, action='append', help='all by default')
+    parser.add_argument('--output', default='benchmark-allocations.json')
+    args = parser.parse_args()
+
+    app = create_app(test_config=True)
+    results = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'sizes': []
+    }
+    for rows in args.rows:
+        with app.app_context():
+            seed(rows)
+            db.session.remove()
+        size_results = {'rows': rows, 'ways': []}
+        for way in args.way or WAYS:
+            summary = measure(way, rows)
+            summary['way'] = way
+            size_results['ways'].append(summary)
+            print(f"{rows:>8} rows {way:<13} held {summary['held_kib']:>10}KiB "
+                  f"peak {summary['peak_kib']:>10}KiB blocks {summary['held_blocks']:>8} "
+                  f"maxrss +{summary['maxrss_growth_kib']:>7}KiB {summary['ms']:>9}ms")
+        results['sizes'].append(size_results)
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""Read endpoints under many concurrent clients, WSGI against asyncio.
+
+    python3 benchmarks/concurrency.py --clients 10 100 1000 --duration 10 --output concurrency.json
+
+The database of TestConfig is seeded once with the fleet generator (--size,
+as in benchmarks/routes.py). Then, for every server, route and number of
+clients, that many clients poll the route for --duration seconds, each
+opening a connection per request. The servers run as subprocesses:
+
+* wsgi: uWSGI with the options of uwsgi.ini, --processes of --threads.
+* asgi: uvicorn with --processes workers of apis.aio.
+
+The response cache of the WSGI app is disabled, so both run the queries.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+
+from sqlalchemy.engine import make_url
+
+from apis.app import create_app
+from config import TestConfig
+from routes import reset_and_seed
+
+PORT = 5081
+ROUTES = ('active_equipments', 'total_cost', 'average_cost', 'cost_series')
+
+
+def server_command(server, processes, threads):
+    if server == 'wsgi':
+        return [
+            'uwsgi', '--module', 'wsgi:app', '--http-socket', f'127.0.0.1:{PORT}',
+            '--master', '--processes', str(processes), '--threads', str(threads),
+            '--enable-threads', '--lazy-apps', '--need-app', '--die-on-term',
+            '--buffer-size', '32768', '--disable-logging', '--listen', '1024'
+        ]
+    return [
+        sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(PORT),
+        '--workers', str(processes), '--no-access-log', '--log-level', 'warning', '--backlog', '1024'
+    ]
+
+
+def server_environment():
+    """Points RunConfig and ProductionConfig at the database of TestConfig"""
+    url = make_url(TestConfig.SQLALCHEMY_DATABASE_URI)
+    return {
+        **os.environ,
+        'PGHOST': url.host, 'PGPORT': str(url.port), 'PGDATABASE': url.database,
+        'PGUSER': url.username, 'PGPASSWORD': url.password,
+        'RESPONSE_CACHE_BACKEND': '', 'CODE_CACHE_LISTEN': 'false',
+        'RESPONSE_CACHE_LISTEN': 'false', 'API_DOCS': 'false'
+    }
+
+
+async def wait_until_serving(timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            status, _ = await request('GET', '/', b'')
+            if status == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f'Nothing served on port {PORT}')
+
+
+async def request(method, path, body):
+    reader, writer = await asyncio.open_connection('127.0.0.1', PORT)
+    try:
+        writer.write(
+            f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body
+        )
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    status = int(response.split(b' ', 2)[1])
+    return status, response
+
+
+async def poll(route_body, path, clients, duration):
+    latencies, statuses, errors = [], {}, 0
+    deadline = time.monotonic() + duration
+
+    async def client(n):
+        nonlocal errors
+        i = n
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status, _ = await request('GET', path, route_body(i))
+            except OSError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            i += clients
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    elapsed = time.perf_counter() - start
+    return summarize(latencies, statuses, errors, elapsed)
+
+
+def summarize(latencies, statuses, errors, elapsed):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        if not latencies:
+            return None
+        return round(latencies[max(0, int(len(latencies) * p / 100 + 0.5) - 1)] * 1000, 3)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3) if latencies else None,
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'statuses': statuses
+    }
+
+
+def route_bodies(samples):
+    vessels, equipments = samples['vessels'], samples['equipments']
+    today = datetime.now(timezone.utc).date()
+
+    def encoded(build):
+        return lambda i: json.dumps(build(i)).encode()
+
+    return {
+        'active_equipments': ('/equipment/active_equipments', encoded(
+            lambda i: {'vessel_code': vessels[i % len(vessels)]}
+        )),
+        'total_cost': ('/operation_order/total_cost', encoded(
+            lambda i: {'code': equipments[i % len(equipments)]}
+        )),
+        'average_cost': ('/operation_order/average_cost', lambda i: b''),
+        'cost_series': ('/operation_order/cost_series', encoded(
+            lambda i: {'start': str(today.replace(year=today.year - 1)), 'end': str(today), 'bucket': 'month'}
+        ))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', default='200x20x10')
+    parser.add_argument('--clients', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--duration', type=float, default=10, help='seconds per run')
+    parser.add_argument('--processes', type=int, default=2, help='worker processes of each server')
+    parser.add_argument('--threads', type=int, default=4, help='threads of each WSGI worker')
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), action='append', help='both by default')
+    parser.add_argument('--route', choices=ROUTES, action='append', help='all routes by default')
+    parser.add_argument('--output', default='benchmark-concurrency.json')
+    args = parser.parse_args()
+
+    app = create_app(test_config=True)
+    created, samples = reset_and_seed(app, args.size)
+    bodies = route_bodies(samples)
+
+    results = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'size': args.size,
+        'rows': created,
+        'duration': args.duration,
+        'processes': args.processes,
+        'threads': args.threads,
+        'runs': []
+    }
+    for server in args.server or ['wsgi', 'asgi']:
+        process = subprocess.Popen(
+            server_command(server, args.processes, args.threads),
+            cwd=ROOT, env=server_environment(), stdout=subprocess.DEVNULL
+        )
+        try:
+            asyncio.run(wait_until_serving())
+            for route in args.route or ROUTES:
+                path, body = bodies[route]
+                for clients in args.clients:
+                    summary = asyncio.run(poll(body, path, clients, args.duration))
+                    summary.update(server=server, route=route, clients=clients)
+                    results['runs'].append(summary)
+                    print(f"{server:>5} {route:<18} {clients:>5} clients "
+                          f"p50 {summary['p50_ms']}ms p99 {summary['p99_ms']}ms "
+                          f"{summary['throughput_rps']} req/s {summary['errors']} errors")
+        finally:
+            process.terminate()
+            process.wait()
+
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
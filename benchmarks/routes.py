@@ -0,0 +1,258 @@
+"""Latency and throughput of every route at several fleet sizes.
+
+    python3 benchmarks/routes.py --sizes 10x10x5 1000x20x10 --requests 200 --output routes.json
+
+Sizes are VESSELSxEQUIPMENTSxORDERS (equipments per vessel, orders per
+equipment). For every size the database of TestConfig is dropped, seeded
+with the fleet generator, then every route is driven through the Flask test
+client and over HTTP (a threaded werkzeug server on a local port).
+
+The response cache is disabled unless --response-cache is given, so the
+read routes measure their queries.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import text
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from apis import fleet
+from apis.app import create_app
+from apis.models.model import db
+from apis.response_cache import response_cache
+
+DEFAULT_SIZES = ('10x10x5', '200x20x10', '2000x20x10')
+BATCH = 100
+UPLOAD_ROWS = 1_000
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class Route:
+    def __init__(self, name, method, path, body, content_type='application/json'):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body  # body(i) for the i-th request, already encoded
+        self.content_type = content_type
+
+
+def routes(samples, prefix):
+    """Requests of every route, writes use codes unique to the prefix"""
+    vessels, equipments = samples['vessels'], samples['equipments']
+
+    def encoded(build):
+        return lambda i: json.dumps(build(i)).encode()
+
+    def code(kind, i, j=0):
+        # 8 characters: kind, prefix and a hex counter
+        return f'{kind}{prefix}{i * BATCH + j:06X}'
+
+    def upload(i):
+        return ''.join(
+            json.dumps({'code': equipments[(i + j) % len(equipments)], 'type': 'repair', 'cost': 10.5}) + '\n'
+            for j in range(UPLOAD_ROWS)
+        ).encode()
+
+    return [
+        Route('healthcheck', 'GET', '/', lambda i: b''),
+        Route('insert_vessel', 'POST', '/vessel/insert_vessel',
+              encoded(lambda i: {'code': code('A', i)})),
+        Route('insert_vessels', 'POST', '/vessel/insert_vessels',
+              encoded(lambda i: {'codes': [code('B', i, j) for j in range(BATCH)]})),
+        Route('insert_equipment', 'POST', '/equipment/insert_equipment',
+              encoded(lambda i: {
+                  'vessel_code': vessels[i % len(vessels)], 'code': code('C', i),
+                  'name': 'compressor', 'location': 'brazil'
+              })),
+        Route('insert_equipments', 'POST', '/equipment/insert_equipments',
+              encoded(lambda i: {'equipments': [
+                  {'vessel_code': vessels[(i + j) % len(vessels)], 'code': code('D', i, j),
+                   'name': 'compressor', 'location': 'brazil'}
+                  for j in range(BATCH)
+              ]})),
+        Route('active_equipments', 'GET', '/equipment/active_equipments',
+              encoded(lambda i: {'vessel_code': vessels[i % len(vessels)]})),
+        Route('active_equipments_page', 'GET', '/equipment/active_equipments',
+              encoded(lambda i: {'vessel_code': vessels[i % len(vessels)], 'limit': 10})),
+        Route('insert_operation', 'POST', '/operation_order/insert_operation',
+              encoded(lambda i: {'code': equipments[i % len(equipments)], 'type': 'repair', 'cost': 10.5})),
+        Route('upload_operations', 'POST', '/operation_order/upload_operations',
+              upload, 'application/x-ndjson'),
+        Route('total_cost_by_code', 'GET', '/operation_order/total_cost',
+              encoded(lambda i: {'code': equipments[i % len(equipments)]})),
+        Route('total_cost_by_name', 'GET', '/operation_order/total_cost',
+              encoded(lambda i: {'name': f'equipment {i % 10 + 1}'})),
+        Route('average_cost', 'GET', '/operation_order/average_cost', lambda i: b''),
+        Route('cost_series', 'GET', '/operation_order/cost_series',
+              encoded(lambda i: {'start': str(date.today() - timedelta(days=365)),
+                                 'end': str(date.today() + timedelta(days=1))})),
+        # last, it deactivates equipments used by the other routes
+        Route('update_equipment_status', 'PUT', '/equipment/update_equipment_status',
+              encoded(lambda i: {'codes': [equipments[(i * 10 + j) % len(equipments)] for j in range(10)]})),
+        Route('metrics', 'GET', '/metrics', lambda i: b'')
+    ]
+
+
+def summarize(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return round(latencies[max(0, int(len(latencies) * p / 100 + 0.5) - 1)] * 1000, 3)
+
+    return {
+        'requests': len(latencies),
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'statuses': dict(Counter(statuses))
+    }
+
+
+def run_client(app, route, requests):
+    client = app.test_client()
+    latencies, statuses = [], []
+    start = time.perf_counter()
+    for i in range(requests):
+        body = route.body(i)
+        request_start = time.perf_counter()
+        response = client.open(
+            route.path, method=route.method, data=body,
+            content_type=route.content_type if body else None
+        )
+        response.get_data()
+        latencies.append(time.perf_counter() - request_start)
+        statuses.append(response.status_code)
+    return summarize(latencies, statuses, time.perf_counter() - start)
+
+
+def run_http(port, route, requests, concurrency):
+    latencies, statuses = [], []
+    lock = threading.Lock()
+
+    def worker(indexes):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        for i in indexes:
+            body = route.body(i)
+            headers = {'Content-Type': route.content_type} if body else {}
+            request_start = time.perf_counter()
+            connection.request(route.method, route.path, body=body or None, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - request_start
+            with lock:
+                latencies.append(elapsed)
+                statuses.append(response.status)
+        connection.close()
+
+    threads = [
+        threading.Thread(target=worker, args=(range(n, requests, concurrency),))
+        for n in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, statuses, time.perf_counter() - start)
+
+
+def reset_and_seed(app, size):
+    vessels, equipments, orders = (int(n) for n in size.split('x'))
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        created = fleet.seed(db.session, vessels, equipments, orders)
+        for table in db.metadata.sorted_tables:
+            db.session.execute(text(f'ANALYZE {table.name}'))
+        db.session.commit()
+        samples = {
+            'vessels': db.session.execute(text(
+                'SELECT code FROM vessels ORDER BY random() LIMIT 100'
+            )).scalars().all(),
+            'equipments': db.session.execute(text(
+                'SELECT code FROM equipments WHERE active ORDER BY random() LIMIT 1000'
+            )).scalars().all()
+        }
+        db.session.remove()
+    return created, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--requests', type=int, default=100, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=4, help='HTTP connections')
+    parser.add_argument('--transport', choices=('client', 'http'), action='append',
+                        help='both by default')
+    parser.add_argument('--route', action='append', help='all routes by default')
+    parser.add_argument('--response-cache', action='store_true')
+    parser.add_argument('--output', default='benchmark-routes.json')
+    args = parser.parse_args()
+    transports = args.transport or ['client', 'http']
+
+    app = create_app(test_config=True)
+    if not args.response_cache:
+        app.config['RESPONSE_CACHE_BACKEND'] = ''
+        response_cache.init_app(app)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'requests_per_route': args.requests,
+        'concurrency': args.concurrency,
+        'response_cache': args.response_cache,
+        'sizes': []
+    }
+    for size in args.sizes:
+        created, samples = reset_and_seed(app, size)
+        size_results = {'size': size, 'rows': created, 'routes': []}
+        # codes written by each transport must not collide
+        transport_routes = zip(*(routes(samples, prefix=str(n)) for n in range(len(transports))))
+        for same_routes in transport_routes:
+            if args.route and same_routes[0].name not in args.route:
+                continue
+            for transport, route in zip(transports, same_routes):
+                if transport == 'client':
+                    summary = run_client(app, route, args.requests)
+                else:
+                    summary = run_http(server.server_port, route, args.requests, args.concurrency)
+                summary.update(route=route.name, transport=transport)
+                size_results['routes'].append(summary)
+                print(f"{size:>12} {transport:>6} {route.name:<24} "
+                      f"p50 {summary['p50_ms']:>9}ms p95 {summary['p95_ms']:>9}ms "
+                      f"p99 {summary['p99_ms']:>9}ms {summary['throughput_rps']:>8} req/s")
+        results['sizes'].append(size_results)
+
+    server.shutdown()
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
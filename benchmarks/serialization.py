@@ -0,0 +1,137 @@
+"""Time to load and encode the active equipments of a vessel.
+
+    python3 benchmarks/serialization.py --rows 1000 10000 100000 --repeat 5 --output serialization.json
+
+For every size, the database of TestConfig is dropped and one vessel gets
+that many active equipments. Each path then loads them and builds the
+response body of active_equipments:
+
+* orm_schema: equipment instances through EquipmentOutputSchema and jsonify,
+  the path before the rows.
+* rows_schema: rows of the output columns through the schema and jsonify,
+  the fallback in debug.
+* rows_json: the same rows through reads.dumps with the json module.
+* rows_orjson: the same rows through reads.dumps with orjson, when installed.
+
+Every path must produce the same bytes. The best of --repeat runs is kept.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import jsonify
+from sqlalchemy import select, text
+
+from apis import reads
+from apis.app import create_app
+from apis.models.equipment import equipment
+from apis.models.model import db
+
+VESSEL_CODE = 'MVBENCH'
+
+
+def seed(rows):
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    db.session.execute(text('''
+        WITH new_vessel AS (
+          INSERT INTO vessels (code) VALUES (:code) RETURNING id
+        )
+        INSERT INTO equipments (vessel_id, code, name, location, active)
+        SELECT new_vessel.id, 'E' || lpad(upper(to_hex(n)), 7, '0'), 'equipment ' || n, 'brazil', true
+        FROM new_vessel, generate_series(1, :rows) n
+    '''), {'code': VESSEL_CODE, 'rows': rows})
+    db.session.commit()
+    db.session.execute(text('ANALYZE equipments'))
+    db.session.commit()
+    return db.session.execute(select(equipment.vessel_id).limit(1)).scalar()
+
+
+def orm_schema(vessel_id):
+    equipments = db.session.execute(
+        select(equipment).where(equipment.vessel_id == vessel_id, equipment.active == True).order_by(equipment.id)
+    ).scalars().all()
+    body = jsonify(reads.active_equipments_response(VESSEL_CODE, equipments, None)).get_data()
+    # the instances are not reused between runs
+    db.session.expunge_all()
+    return body
+
+
+def rows_schema(vessel_id):
+    rows = db.session.execute(reads.active_equipments(vessel_id, {})).all()
+    return jsonify(reads.active_equipments_response(VESSEL_CODE, rows, None)).get_data()
+
+
+def rows_fast(vessel_id):
+    rows = db.session.execute(reads.active_equipments(vessel_id, {})).all()
+    return reads.active_equipments_json(VESSEL_CODE, rows, None)
+
+
+def best_of(path, vessel_id, repeat):
+    timings, body = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = path(vessel_id)
+        timings.append(time.perf_counter() - start)
+    return min(timings), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='benchmark-serialization.json')
+    args = parser.parse_args()
+
+    app = create_app(test_config=True)
+    # jsonify indents in debug
+    app.debug = False
+    orjson = reads.orjson
+    paths = [('orm_schema', orm_schema), ('rows_schema', rows_schema), ('rows_json', rows_fast)]
+    if orjson is not None:
+        paths.append(('rows_orjson', rows_fast))
+
+    results = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'orjson': getattr(orjson, '__version__', None),
+        'repeat': args.repeat,
+        'sizes': []
+    }
+    with app.test_request_context():
+        for rows in args.rows:
+            vessel_id = seed(rows)
+            size_results = {'rows': rows, 'paths': []}
+            bodies = set()
+            for name, path in paths:
+                reads.orjson = orjson if name == 'rows_orjson' else None
+                seconds, body = best_of(path, vessel_id, args.repeat)
+                bodies.add(body)
+                size_results['paths'].append({
+                    'path': name,
+                    'ms': round(seconds * 1000, 3),
+                    'rows_per_second': round(rows / seconds),
+                    'bytes': len(body)
+                })
+                print(f'{rows:>8} rows {name:<12} {seconds * 1000:>10.3f}ms')
+            reads.orjson = orjson
+            assert len(bodies) == 1, 'the paths produced different bodies'
+            results['sizes'].append(size_results)
+
+        db.session.remove()
+        db.drop_all()
+
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Startup time of a worker and of the boot migration step.
+
+Every scenario runs in a fresh interpreter, so imports are not cached
+between runs:
+
+    python3 benchmarks/startup.py --repeat 10 --output startup.json
+
+The upgrade scenario needs the database of RunConfig (PG* variables) and
+measures a boot where every migration was already applied.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SCENARIOS = {
+    'import': 'import apis.app',
+    'create_app': (
+        'from apis.app import create_app\n'
+        'create_app(production_conf=True)'
+    ),
+    'create_app_with_docs': (
+        'from apis.app import create_app\n'
+        'create_app()'
+    ),
+    'upgrade': (
+        'from flask_migrate import Migrate, upgrade\n'
+        'from apis.app import create_app\n'
+        'from apis.models.model import db\n'
+        'app = create_app()\n'
+        'Migrate(app, db)\n'
+        'with app.app_context():\n'
+        '    upgrade()'
+    )
+}
+
+
+def run(code):
+    env = dict(
+        os.environ,
+        # no listener threads, they would outlive the measured code
+        CODE_CACHE_LISTEN='false',
+        RESPONSE_CACHE_LISTEN='false'
+    )
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def measure(code, repeat):
+    run(code)  # warms the filesystem and bytecode caches
+    timings = [run(code) for _ in range(repeat)]
+    return {
+        'runs': repeat,
+        'median_ms': round(statistics.median(timings) * 1000, 1),
+        'min_ms': round(min(timings) * 1000, 1),
+        'max_ms': round(max(timings) * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='all scenarios by default')
+    parser.add_argument('--output', help='also writes the results to this JSON file')
+    args = parser.parse_args()
+
+    results = {
+        'python': sys.version.split()[0],
+        'scenarios': {
+            name: measure(SCENARIOS[name], args.repeat)
+            for name in args.scenario or SCENARIOS
+        }
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,66 @@
-from flask_migrate import MigrateCommand
-from flasgger import Swagger
+import os
+from datetime import datetime
+
+# commands do not serve the api docs, the server is started from apis.app.
+# Set before the imports below, they load config.
+os.environ.setdefault('API_DOCS', 'false')
+
+from flask_migrate import Migrate, MigrateCommand
 from flask_script import Manager
 
+from apis import fleet, partitions, rollups
 from apis.app import create_app
+from apis.code_cache import code_cache
+from apis.response_cache import response_cache
+from apis.models.model import db
 
 app = create_app()
+migrate = Migrate(app, db)
 manager = Manager(app)
-swagger = Swagger(app)
 
 
 manager.add_command('db', MigrateCommand)
 
+
+@manager.command
+def rebuild_rollups():
+    """Recomputes the cost rollups from operation_order"""
+    drifted = rollups.rebuild(db.session)
+    response_cache.touch(db.session, 'operation_order')
+    db.session.commit()
+    for table, keys in drifted.items():
+        print(f'{table} rebuilt, {len(keys)} rows had drifted: {keys}')
+
+
+@manager.option('-k', '--kind', dest='kind', default=None, help='vessel or equipment, all by default')
+@manager.option('-c', '--code', dest='code', default=None, help='a single code, all by default')
+def invalidate_code_cache(kind, code):
+    """Drops code cache entries on every worker"""
+    code_cache.invalidate(kind, code)
+    print('Code cache invalidation published')
+
+
+@manager.option('-m', '--months-ahead', dest='months_ahead', type=int, default=3, help='months after this one')
+@manager.option('-s', '--since', dest='since', default=None, help='first month (YYYY-MM), this month by default')
+def create_partitions(months_ahead, since):
+    """Creates the missing monthly partitions of operation_order"""
+    since = datetime.strptime(since, '%Y-%m').date() if since else None
+    created = partitions.ensure_partitions(db.session, months_ahead, since)
+    db.session.commit()
+    print(f'Created partitions: {created}')
+
+
+@manager.option('-v', '--vessels', dest='vessels', type=int, default=1_000, help='vessels to create')
+@manager.option('-e', '--equipments', dest='equipments', type=int, default=20, help='equipments per vessel')
+@manager.option('-o', '--orders', dest='orders', type=int, default=10, help='operation orders per equipment')
+@manager.option('-p', '--months', dest='months', type=int, default=12, help='months the orders are spread over')
+def seed_fleet(vessels, equipments, orders, months):
+    """Loads a synthetic fleet in bulk"""
+    created = fleet.seed(db.session, vessels, equipments, orders, months=months)
+    print(f"Created {created['vessels']} vessels, {created['equipments']} equipments "
+          f"and {created['orders']} operation orders")
+
+
 if __name__ == '__main__':
     manager.run()
-        
\ No newline at end of file
+        
@@ -0,0 +1,142 @@
+from __future__ import with_statement
+
+import logging
+from logging.config import fileConfig
+
+from sqlalchemy import engine_from_config
+from sqlalchemy import pool
+from sqlalchemy import text
+from flask import current_app
+
+from alembic import context
+from alembic.script import ScriptDirectory
+
+from apis import partitions
+
+# this is the Alembic Config object, which provides
+# access to the values within the .ini file in use.
+config = context.config
+
+# Interpret the config file for Python logging.
+# This line sets up loggers basically.
+fileConfig(config.config_file_name)
+logger = logging.getLogger('alembic.env')
+
+# add your model's MetaData object here
+# for 'autogenerate' support
+# from myapp import mymodel
+# target_metadata = mymodel.Base.metadata
+config.set_main_option(
+    'sqlalchemy.url',
+    str(current_app.extensions['migrate'].db.engine.url).replace('%', '%%'))
+target_metadata = current_app.extensions['migrate'].db.metadata
+
+# other values from the config, defined by the needs of env.py,
+# can be acquired:
+# my_important_option = config.get_main_option("my_important_option")
+# ... etc.
+
+
+def run_migrations_offline():
+    """Run migrations in 'offline' mode.
+
+    This configures the context with just a URL
+    and not an Engine, though an Engine is acceptable
+    here as well.  By skipping the Engine creation
+    we don't even need a DBAPI to be available.
+
+    Calls to context.execute() here emit the given string to the
+    script output.
+
+    """
+    url = config.get_main_option("sqlalchemy.url")
+    context.configure(
+        url=url, target_metadata=target_metadata, literal_binds=True
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def forget_unknown_revisions(connection):
+    """Drops revisions that are not part of this repository.
+
+    Before migrations were checked in they were regenerated on every boot,
+    so old databases point to revisions that no longer exist. Forgetting
+    them lets the baseline revision adopt those databases.
+    """
+    if not connection.dialect.has_table(connection, 'alembic_version'):
+        return
+
+    known = {
+        script.revision
+        for script in ScriptDirectory.from_config(config).walk_revisions()
+    }
+    current = connection.execute(
+        text('SELECT version_num FROM alembic_version')
+    ).scalars().all()
+    for revision in set(current) - known:
+        logger.info('Forgetting unknown revision %s', revision)
+        connection.execute(
+            text('DELETE FROM alembic_version WHERE version_num = :revision'),
+            {'revision': revision}
+        )
+
+
+# key of the advisory lock held while migrating, so that replicas booting
+# together apply the pending revisions one at a time
+MIGRATIONS_LOCK_ID = 72146093
+
+
+def run_migrations_online():
+    """Run migrations in 'online' mode.
+
+    In this scenario we need to create an Engine
+    and associate a connection with the context.
+
+    """
+
+    # this callback is used to prevent an auto-migration from being generated
+    # when there are no changes to the schema
+    # reference: http://alembic.zzzcomputing.com/en/latest/cookbook.html
+    def process_revision_directives(context, revision, directives):
+        if getattr(config.cmd_opts, 'autogenerate', False):
+            script = directives[0]
+            if script.upgrade_ops.is_empty():
+                directives[:] = []
+                logger.info('No changes in schema detected.')
+
+    connectable = engine_from_config(
+        config.get_section(config.config_ini_section),
+        prefix='sqlalchemy.',
+        poolclass=pool.NullPool,
+    )
+
+    with connectable.connect() as connection:
+        # session level lock: it outlives the transactions of the revisions
+        # and the ones that run outside of a transaction
+        connection.execute(
+            text('SELECT pg_advisory_lock(:id)'), {'id': MIGRATIONS_LOCK_ID}
+        )
+        try:
+            forget_unknown_revisions(connection)
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                process_revision_directives=process_revision_directives,
+                include_object=partitions.include_object(connection),
+                **current_app.extensions['migrate'].configure_args
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            connection.execute(
+                text('SELECT pg_advisory_unlock(:id)'), {'id': MIGRATIONS_LOCK_ID}
+            )
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,34 @@
+"""index hot query paths
+
+Revision ID: 5a8adefb6577
+Revises: 92075aba8f40
+Create Date: 2026-10-18 10:13:20.772398
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a8adefb6577'
+down_revision = '92075aba8f40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # built concurrently so that existing tables keep accepting writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_equipments_vessel_id_active', 'equipments', ['vessel_id', 'active'],
+            unique=False, postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_operation_order_equipment_id', 'operation_order', ['equipment_id'],
+            unique=False, postgresql_include=['cost'], postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    op.drop_index('ix_operation_order_equipment_id', table_name='operation_order')
+    op.drop_index('ix_equipments_vessel_id_active', table_name='equipments')
@@ -0,0 +1,34 @@
+"""keyset index for active equipments
+
+Revision ID: 5bada5f40012
+Revises: 5a8adefb6577
+Create Date: 2026-10-18 10:15:17.887629
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5bada5f40012'
+down_revision = '5a8adefb6577'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # id is part of the index so pages are read in order, without a sort
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_equipments_vessel_id_active_id', 'equipments', ['vessel_id', 'active', 'id'],
+            unique=False, postgresql_concurrently=True
+        )
+        op.drop_index(
+            'ix_equipments_vessel_id_active', table_name='equipments',
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    op.create_index('ix_equipments_vessel_id_active', 'equipments', ['vessel_id', 'active'], unique=False)
+    op.drop_index('ix_equipments_vessel_id_active_id', table_name='equipments')
@@ -0,0 +1,102 @@
+"""baseline schema
+
+Revision ID: 92075aba8f40
+Revises: 
+Create Date: 2026-10-18 10:13:08.891961
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '92075aba8f40'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# rollup table -> key column and the expression it is computed from
+ROLLUPS = {
+    'vessel_costs': ('vessel_id', 'equipments.vessel_id'),
+    'equipment_costs': ('equipment_id', 'equipments.id')
+}
+
+
+def upgrade():
+    # Databases created while migrations were regenerated on every boot
+    # already have some of these tables, they are adopted as they are
+    existing_tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'vessels' not in existing_tables:
+        op.create_table('vessels',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('code', sa.String(length=8), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('code')
+        )
+    if 'equipments' not in existing_tables:
+        op.create_table('equipments',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('vessel_id', sa.BigInteger(), nullable=True),
+        sa.Column('name', sa.String(length=256), nullable=True),
+        sa.Column('code', sa.String(length=8), nullable=True),
+        sa.Column('location', sa.String(length=256), nullable=True),
+        sa.Column('active', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['vessel_id'], ['vessels.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('code')
+        )
+    op.execute('CREATE INDEX IF NOT EXISTS ix_equipments_name ON equipments (name)')
+    if 'vessel_costs' not in existing_tables:
+        op.create_table('vessel_costs',
+        sa.Column('vessel_id', sa.BigInteger(), nullable=False),
+        sa.Column('total_cost', sa.Float(), nullable=False),
+        sa.Column('operations', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['vessel_id'], ['vessels.id'], ),
+        sa.PrimaryKeyConstraint('vessel_id')
+        )
+    if 'equipment_costs' not in existing_tables:
+        op.create_table('equipment_costs',
+        sa.Column('equipment_id', sa.BigInteger(), nullable=False),
+        sa.Column('total_cost', sa.Float(), nullable=False),
+        sa.Column('operations', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['equipment_id'], ['equipments.id'], ),
+        sa.PrimaryKeyConstraint('equipment_id')
+        )
+    if 'operation_order' not in existing_tables:
+        op.create_table('operation_order',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('equipment_id', sa.BigInteger(), nullable=True),
+        sa.Column('type', sa.String(length=64), nullable=True),
+        sa.Column('cost', sa.Float(precision=2), nullable=True),
+        sa.ForeignKeyConstraint(['equipment_id'], ['equipments.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    # rollups created here start from the operation orders already adopted,
+    # inserts of operation orders wait for the backfill, so none is missed
+    created_rollups = {
+        table: columns for table, columns in ROLLUPS.items() if table not in existing_tables
+    }
+    if created_rollups:
+        op.execute('LOCK TABLE operation_order IN SHARE MODE')
+    for table, (key, source) in created_rollups.items():
+        op.execute(f'''
+            INSERT INTO {table} ({key}, total_cost, operations)
+            SELECT {source}, sum(operation_order.cost), count(operation_order.id)
+            FROM operation_order
+            JOIN equipments ON equipments.id = operation_order.equipment_id
+            WHERE {source} IS NOT NULL
+            GROUP BY 1
+        ''')
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table('operation_order')
+    op.drop_table('equipment_costs')
+    op.drop_table('vessel_costs')
+    op.drop_index(op.f('ix_equipments_name'), table_name='equipments')
+    op.drop_table('equipments')
+    op.drop_table('vessels')
+    # ### end Alembic commands ###
@@ -0,0 +1,84 @@
+"""partition operation_order by month
+
+Revision ID: c3d1e5a7f210
+Revises: 5bada5f40012
+Create Date: 2026-10-18 11:02:41.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d1e5a7f210'
+down_revision = '5bada5f40012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a table can not be turned into a partitioned one, the rows are copied
+    # to a new table. Their execution time is unknown, they get the time of
+    # the migration.
+    op.execute('ALTER TABLE operation_order RENAME TO operation_order_unpartitioned')
+    op.execute('ALTER INDEX operation_order_pkey RENAME TO operation_order_unpartitioned_pkey')
+    op.execute('DROP INDEX ix_operation_order_equipment_id')
+
+    op.execute('''
+        CREATE TABLE operation_order (
+            id BIGINT NOT NULL DEFAULT nextval('operation_order_id_seq'),
+            equipment_id BIGINT REFERENCES equipments (id),
+            type VARCHAR(64),
+            cost REAL,
+            executed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, executed_at)
+        ) PARTITION BY RANGE (executed_at)
+    ''')
+    op.execute('CREATE TABLE operation_order_default PARTITION OF operation_order DEFAULT')
+    op.execute('''
+        DO $$
+        DECLARE
+            month date := date_trunc('month', now());
+        BEGIN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF operation_order FOR VALUES FROM (%L) TO (%L)',
+                'operation_order_' || to_char(month, 'YYYY_MM'), month, month + interval '1 month'
+            );
+        END $$
+    ''')
+    op.create_index(
+        'ix_operation_order_equipment_id_executed_at', 'operation_order',
+        ['equipment_id', 'executed_at'], unique=False, postgresql_include=['cost']
+    )
+
+    op.execute('''
+        INSERT INTO operation_order (id, equipment_id, type, cost)
+        SELECT id, equipment_id, type, cost FROM operation_order_unpartitioned
+    ''')
+    op.execute('ALTER SEQUENCE operation_order_id_seq OWNED BY operation_order.id')
+    op.execute('DROP TABLE operation_order_unpartitioned')
+
+
+def downgrade():
+    op.execute('ALTER TABLE operation_order RENAME TO operation_order_partitioned')
+    op.execute('ALTER INDEX operation_order_pkey RENAME TO operation_order_partitioned_pkey')
+    op.execute('DROP INDEX ix_operation_order_equipment_id_executed_at')
+
+    op.create_table('operation_order',
+    sa.Column('id', sa.BigInteger(), server_default=sa.text("nextval('operation_order_id_seq')"), nullable=False),
+    sa.Column('equipment_id', sa.BigInteger(), nullable=True),
+    sa.Column('type', sa.String(length=64), nullable=True),
+    sa.Column('cost', sa.Float(precision=2), nullable=True),
+    sa.ForeignKeyConstraint(['equipment_id'], ['equipments.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_operation_order_equipment_id', 'operation_order', ['equipment_id'],
+        unique=False, postgresql_include=['cost']
+    )
+    op.execute('''
+        INSERT INTO operation_order (id, equipment_id, type, cost)
+        SELECT id, equipment_id, type, cost FROM operation_order_partitioned
+    ''')
+    op.execute('ALTER SEQUENCE operation_order_id_seq OWNED BY operation_order.id')
+    op.execute('DROP TABLE operation_order_partitioned')
@@ -0,0 +1,69 @@
+"""daily cost rollups
+
+Revision ID: e4b2f6c8a913
+Revises: c3d1e5a7f210
+Create Date: 2026-10-18 16:02:41.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b2f6c8a913'
+down_revision = 'c3d1e5a7f210'
+branch_labels = None
+depends_on = None
+
+# table -> key column and the expression it is computed from
+ROLLUPS = {
+    'daily_vessel_costs': ('vessel_id', 'equipments.vessel_id'),
+    'daily_equipment_costs': ('equipment_id', 'equipments.id'),
+    'daily_type_costs': ('type', 'operation_order.type')
+}
+
+
+def upgrade():
+    op.create_table('daily_vessel_costs',
+    sa.Column('vessel_id', sa.BigInteger(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('total_cost', sa.Float(), nullable=False),
+    sa.Column('operations', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['vessel_id'], ['vessels.id'], ),
+    sa.PrimaryKeyConstraint('vessel_id', 'day')
+    )
+    op.create_table('daily_equipment_costs',
+    sa.Column('equipment_id', sa.BigInteger(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('total_cost', sa.Float(), nullable=False),
+    sa.Column('operations', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['equipment_id'], ['equipments.id'], ),
+    sa.PrimaryKeyConstraint('equipment_id', 'day')
+    )
+    op.create_table('daily_type_costs',
+    sa.Column('type', sa.String(length=64), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('total_cost', sa.Float(), nullable=False),
+    sa.Column('operations', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('type', 'day')
+    )
+
+    # inserts of operation orders wait for the backfill, so none is missed
+    op.execute('LOCK TABLE operation_order IN SHARE MODE')
+    for table, (key, source) in ROLLUPS.items():
+        op.create_index(op.f(f'ix_{table}_day'), table, ['day'], unique=False)
+        op.execute(f'''
+            INSERT INTO {table} ({key}, day, total_cost, operations)
+            SELECT {source}, (operation_order.executed_at AT TIME ZONE 'UTC')::date,
+              sum(operation_order.cost), count(operation_order.id)
+            FROM operation_order
+            JOIN equipments ON equipments.id = operation_order.equipment_id
+            WHERE {source} IS NOT NULL
+            GROUP BY 1, 2
+        ''')
+
+
+def downgrade():
+    for table in reversed(list(ROLLUPS)):
+        op.drop_index(op.f(f'ix_{table}_day'), table_name=table)
+        op.drop_table(table)
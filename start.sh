@@ -30,19 +30,35 @@
 #   echo "Database $PGDATABASETEST created."
 # fi
 
-export FLASK_APP="manage.py"
-export FLASK_DEBUG=1
+export FLASK_APP="apis.app:create_app()"
 
 
 # flask db init
 # flask db migrate
 # flask db upgrade
 
-rm -rf migrations
-python3 manage.py db init
-python3 manage.py db migrate
+# migrations are versioned in migrations/versions, new ones are created
+# with: python3 manage.py db migrate -m "description"
 python3 manage.py db upgrade
+python3 manage.py create_partitions
 
 # pytest -v --disable-pytest-warnings
 
+if [ "$APP_ENV" = "asgi" ]; then
+  # asyncio read endpoints, next to the uWSGI app serving the rest
+  exec uvicorn asgi:app --host 0.0.0.0 --port "${ASGI_PORT:-5000}" \
+    --workers "${ASGI_WORKERS:-$(nproc)}" --no-access-log
+fi
+
+if [ "$APP_ENV" = "production" ]; then
+  # DB bound workload: a couple of processes per core, a few threads each
+  export WSGI_PROCESSES=${WSGI_PROCESSES:-$(( $(nproc) * 2 ))}
+  export WSGI_THREADS=${WSGI_THREADS:-4}
+  # the workers share their metrics through files, the ones of a previous run are dropped
+  export METRICS_DIR=${METRICS_DIR:-/tmp/vessels-metrics}
+  mkdir -p "$METRICS_DIR" && rm -f "$METRICS_DIR"/*.json
+  exec uwsgi --ini uwsgi.ini
+fi
+
+export FLASK_DEBUG=1
 flask run -h 0.0.0.0 -p 5000
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import pytest
+from datetime import datetime, timedelta, timezone
+from flask_migrate import Migrate
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from apis import aio, rollups
+from apis.app import create_app
+from apis.models.equipment import equipment
+from apis.models.model import db
+from apis.models.operation_order import OperationOrder
+from apis.models.vessel import vessel
+
+TODAY = datetime.now(timezone.utc).date()
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+    # jsonify only indents in debug
+    app.debug = False
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Migrate(app, db)
+        db.session.add(vessel(code='MV101'))
+        db.session.add(vessel(code='MV102'))
+        db.session.commit()
+        db.session.add(equipment(vessel_id=1, code='5310B9D7', location='brazil', name='compressor', active=True))
+        db.session.add(equipment(vessel_id=1, code='5310B9D8', location='norway', name='pump', active=True))
+        db.session.add(equipment(vessel_id=2, code='5310B9D9', location='brazil', name='compressor', active=False))
+        db.session.commit()
+        for equipment_id, cost in ((1, 10.5), (1, 20.25), (2, 5.0), (3, 40.0)):
+            db.session.add(OperationOrder(equipment_id=equipment_id, type='repair', cost=cost))
+        db.session.commit()
+        rollups.rebuild(db.session)
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def asgi_request(asgi_app, path, body=b'', method='GET', content_type=b'application/json'):
+    async def run():
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            'type': 'http', 'method': method, 'path': path,
+            'headers': [(b'content-type', content_type)]
+        }
+        try:
+            await asgi_app(scope, receive, send)
+        finally:
+            # the pool belongs to the event loop
+            await asgi_app.dispose()
+        return sent[0]['status'], sent[1]['body']
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('path,input_data', [
+    ('/', None),
+    ('/equipment/active_equipments', {'vessel_code': 'MV101'}),
+    ('/equipment/active_equipments', {'vessel_code': 'MV101', 'limit': 1}),
+    ('/equipment/active_equipments', {'vessel_code': 'MV101', 'limit': 1, 'after': 1}),
+    ('/equipment/active_equipments', {'vessel_code': 'MV101', 'limit': '1'}),
+    ('/equipment/active_equipments', {'vessel_code': 'MV101', 'limit': 1.0}),
+    ('/equipment/active_equipments', {'vessel_code': 'MV999'}),
+    ('/equipment/active_equipments', {'vessel_code': 'MV101', 'limit': 0}),
+    ('/equipment/active_equipments', None),
+    ('/operation_order/total_cost', {'code': '5310B9D7'}),
+    ('/operation_order/total_cost', {'name': 'compressor'}),
+    ('/operation_order/total_cost', {'name': 'compressor', 'start': f'{TODAY}T00:00:00+00:00'}),
+    ('/operation_order/total_cost', {'code': 'NOTFOUND'}),
+    ('/operation_order/average_cost', None),
+    ('/operation_order/average_cost', {'end': '2020-01-01T00:00:00'}),
+    ('/operation_order/cost_series', {'start': str(TODAY), 'end': str(TODAY + timedelta(days=1))}),
+    ('/operation_order/cost_series', {
+        'start': str(TODAY), 'end': str(TODAY + timedelta(days=1)), 'group_by': 'equipment', 'bucket': 'month'
+    }),
+    ('/operation_order/cost_series', {'start': str(TODAY)})
+])
+def test_same_responses_as_wsgi(app, path, input_data):
+    body = json.dumps(input_data).encode() if input_data is not None else b''
+    result = app.test_client().get(path, data=body, content_type='application/json' if body else None)
+
+    status, asgi_body = asgi_request(aio.create_app(test_config=True), path, body)
+    assert (status, asgi_body) == (result.status_code, result.get_data())
+
+
+def test_invalid_json(app):
+    asgi_app = aio.create_app(test_config=True)
+    status, body = asgi_request(asgi_app, '/operation_order/total_cost', b'{')
+    assert status == 400
+    status, body = asgi_request(asgi_app, '/operation_order/average_cost', b'{')
+    assert status == 200
+
+
+@pytest.mark.parametrize('path,method,status', [
+    ('/vessel/insert_vessel', 'POST', 404),
+    ('/operation_order/total_cost', 'POST', 405)
+])
+def test_only_reads_are_served(path, method, status):
+    result = asgi_request(aio.create_app(test_config=True), path, method=method)
+    assert result[0] == status
@@ -0,0 +1,102 @@
+import time
+import pytest
+from flask_migrate import Migrate
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from apis import notifications
+from apis.app import create_app
+from apis.code_cache import LRUCache, code_cache
+from apis.models.model import db
+from apis.models.vessel import vessel
+from apis.models.equipment import equipment
+from sqlalchemy import text
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Migrate(app, db)
+        db.session.add(vessel(code='MV102'))
+        db.session.add(vessel(code='MV101'))
+        db.session.commit()
+        db.session.add(equipment(vessel_id=1, code='5310B9D7', location='brazil', name='compressor', active=True))
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+def test_lru_eviction_and_stats():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 3, 'misses': 1, 'evictions': 1}
+
+def test_lru_ttl():
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+def test_resolutions_are_cached(app):
+    with app.app_context():
+        assert code_cache.vessel_id('MV101') == 2
+        assert code_cache.vessel_id('MV101') == 2
+        assert code_cache.vessel_id('INVALID') is None
+        assert code_cache.vessel_id('INVALID') is None
+        ref_equipment = code_cache.equipment('5310B9D7')
+        assert (ref_equipment.id, ref_equipment.vessel_id) == (1, 1)
+
+        stats = code_cache.stats()
+        assert (stats['vessel']['hits'], stats['vessel']['misses'], stats['vessel']['size']) == (1, 3, 1)
+        assert (stats['equipment']['hits'], stats['equipment']['misses']) == (0, 1)
+
+def test_invalidation(app):
+    with app.app_context():
+        code_cache.vessel_id('MV102')
+        code_cache.invalidate('vessel', 'MV101')
+        assert code_cache.stats()['vessel']['size'] == 1
+        code_cache.invalidate()
+        assert code_cache.stats()['vessel']['size'] == 0
+
+def test_listener_applies_notifications(app):
+    code_cache.subscribe(app)
+    notifications.start(app)
+    with app.app_context():
+        deadline = time.monotonic() + 5
+        # pg_stat_activity is a snapshot taken once per transaction
+        while not db.session.execute(text(
+            "SELECT count(*) FROM pg_stat_activity WHERE query = 'LISTEN code_cache'"
+        )).scalar():
+            db.session.commit()
+            assert time.monotonic() < deadline, 'listener did not start'
+            time.sleep(0.05)
+        db.session.commit()
+
+        code_cache.vessel_id('MV101')
+        code_cache.vessel_id('MV102')
+        db.session.execute(text(
+            """SELECT pg_notify('code_cache', '{"kind": "vessel", "code": "MV101"}')"""
+        ))
+        db.session.commit()
+
+        caches = code_cache.caches()
+        deadline = time.monotonic() + 5
+        while len(caches['vessel']) != 1:
+            assert time.monotonic() < deadline, 'notification was not applied'
+            time.sleep(0.05)
+        assert caches['vessel'].get('MV102') == 1
@@ -0,0 +1,151 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from flask_migrate import Migrate
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from apis import rollups
+from apis.app import create_app
+from apis.models.daily_vessel_cost import DailyVesselCost
+from apis.models.equipment import equipment
+from apis.models.model import db
+from apis.models.operation_order import OperationOrder
+from apis.models.vessel import vessel
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Migrate(app, db)
+        db.session.add(vessel(code='MV101'))
+        db.session.add(vessel(code='MV102'))
+        db.session.commit()
+        db.session.add(equipment(vessel_id=1, code='5310B9D7', location='brazil', name='compressor', active=True))
+        db.session.add(equipment(vessel_id=1, code='5310B9D8', location='brazil', name='compressor', active=True))
+        db.session.add(equipment(vessel_id=2, code='5310B9D9', location='brazil', name='compressor', active=True))
+        db.session.commit()
+        for equipment_id, order_type, cost, executed_at in (
+            (1, 'repair', 10.0, datetime(2025, 1, 10, 8, tzinfo=timezone.utc)),
+            (2, 'repair', 20.0, datetime(2025, 1, 10, 23, 30, tzinfo=timezone.utc)),
+            (1, 'inspection', 5.5, datetime(2025, 1, 11, 1, tzinfo=timezone.utc)),
+            (3, 'repair', 40.0, datetime(2025, 1, 20, tzinfo=timezone.utc)),
+            (1, 'repair', 80.0, datetime(2025, 2, 10, tzinfo=timezone.utc))
+        ):
+            db.session.add(OperationOrder(
+                equipment_id=equipment_id, type=order_type, cost=cost, executed_at=executed_at
+            ))
+        db.session.commit()
+        rollups.rebuild(db.session)
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def series(app, **input_data):
+    return app.test_client().get('/operation_order/cost_series', json=input_data)
+
+
+@pytest.mark.parametrize('description,input_data,expected_resp', [
+    (
+        'daily buckets by vessel',
+        {'start': '2025-01-01', 'end': '2025-02-01'},
+        {
+            'MV101': [
+                {'bucket': '2025-01-10', 'total_cost': 30.0, 'operations': 2},
+                {'bucket': '2025-01-11', 'total_cost': 5.5, 'operations': 1}
+            ],
+            'MV102': [
+                {'bucket': '2025-01-20', 'total_cost': 40.0, 'operations': 1}
+            ]
+        }
+    ),
+    (
+        'monthly buckets by vessel',
+        {'start': '2025-01-01', 'end': '2025-03-01', 'bucket': 'month'},
+        {
+            'MV101': [
+                {'bucket': '2025-01-01', 'total_cost': 35.5, 'operations': 3},
+                {'bucket': '2025-02-01', 'total_cost': 80.0, 'operations': 1}
+            ],
+            'MV102': [
+                {'bucket': '2025-01-01', 'total_cost': 40.0, 'operations': 1}
+            ]
+        }
+    ),
+    (
+        'daily buckets of one equipment',
+        {'start': '2025-01-01', 'end': '2025-03-01', 'group_by': 'equipment', 'code': '5310B9D7'},
+        {
+            '5310B9D7': [
+                {'bucket': '2025-01-10', 'total_cost': 10.0, 'operations': 1},
+                {'bucket': '2025-01-11', 'total_cost': 5.5, 'operations': 1},
+                {'bucket': '2025-02-10', 'total_cost': 80.0, 'operations': 1}
+            ]
+        }
+    ),
+    (
+        'monthly buckets by type, end is excluded',
+        {'start': '2025-01-11', 'end': '2025-02-10', 'bucket': 'month', 'group_by': 'type'},
+        {
+            'inspection': [{'bucket': '2025-01-01', 'total_cost': 5.5, 'operations': 1}],
+            'repair': [{'bucket': '2025-01-01', 'total_cost': 40.0, 'operations': 1}]
+        }
+    ),
+    (
+        'no operations in the range',
+        {'start': '2024-01-01', 'end': '2025-01-01'},
+        {}
+    )
+])
+def test_cost_series(app, description, input_data, expected_resp):
+    result = series(app, **input_data)
+    assert result.get_json() == expected_resp, description
+    assert result.status_code == 200
+
+
+@pytest.mark.parametrize('input_data', [
+    {},
+    {'start': '2025-01-01'},
+    {'start': '2025-02-01', 'end': '2025-01-01'},
+    {'start': '2010-01-01', 'end': '2025-01-01'},
+    {'start': '2025-01-01', 'end': '2025-02-01', 'bucket': 'week'},
+    {'start': '2025-01-01', 'end': '2025-02-01', 'group_by': 'location'},
+    {'start': '2025-01-01', 'end': '2025-02-01', 'group_by': 'type', 'code': '5310B9D7'}
+])
+def test_cost_series_invalid_input(app, input_data):
+    result = series(app, **input_data)
+    assert 'message' in result.get_json()
+    assert result.status_code == 400
+
+
+def test_cost_series_includes_new_operations(app):
+    client = app.test_client()
+    for cost in (1.25, 2.5):
+        result = client.post('/operation_order/insert_operation', json={
+            'code': '5310B9D9', 'type': 'repair', 'cost': cost
+        })
+        assert result.status_code == 201
+
+    today = datetime.now(timezone.utc).date()
+    result = series(
+        app, start=today.isoformat(), end=(today + timedelta(days=1)).isoformat(),
+        group_by='equipment'
+    )
+    assert result.get_json() == {
+        '5310B9D9': [{'bucket': today.isoformat(), 'total_cost': 3.75, 'operations': 2}]
+    }
+
+    with app.app_context():
+        assert db.session.query(DailyVesselCost).filter(DailyVesselCost.day == today).one().operations == 2
+        assert not any(rollups.rebuild(db.session).values())
+        db.session.rollback()
@@ -1,10 +1,14 @@
+import json
 import pytest
+from collections import namedtuple
+from flask import jsonify
 from flask_migrate import Migrate
 
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
 
+from apis import reads
 from apis.app import create_app
 from apis.models.model import db
 from apis.models.vessel import vessel
@@ -228,5 +232,218 @@ def test_update_cases(app, description, input_data, expected_msg, expected_statu
         assert query_results[1][0].active == False, description
         assert query_results[1][0].name == 'compressor', description
 
+def test_insert_batch(app):
+    result = app.test_client().post('/equipment/insert_equipments', json={'equipments': [
+        {'vessel_code':'MV102', 'code':'5310B9D9', 'location':'brazil', 'name':'pump'},
+        {'vessel_code':'MV101', 'code':'5310B9DA', 'location':'chile', 'name':'pump'},
+        {'vessel_code':'INVALID', 'code':'5310B9DB', 'location':'brazil', 'name':'pump'},
+        {'vessel_code':'MV101', 'code':'5310B9D7', 'location':'brazil', 'name':'pump'},
+        {'vessel_code':'MV101', 'code':'5310B9D9', 'location':'brazil', 'name':'pump'},
+        {'vessel_code':'MV101', 'code':'', 'location':'brazil', 'name':'pump'}
+    ]})
+    assert result.get_json() == {'equipments': [
+        {'code': '5310B9D9', 'status': 'created'},
+        {'code': '5310B9DA', 'status': 'created'},
+        {'code': '5310B9DB', 'status': 'invalid vessel code'},
+        {'code': '5310B9D7', 'status': 'duplicate'},
+        {'code': '5310B9D9', 'status': 'duplicate'},
+        {'code': '', 'status': 'invalid', 'message': "{'code': ['Length must be between 1 and 8.']}"}
+    ]}
+    assert result.status_code == 201
+    with app.app_context():
+        query = db.session.query(equipment)\
+            .order_by(equipment.code)
+        query_results = db.session.execute(query).all()
+
+        assert len(query_results) == 4
+        assert query_results[2][0].vessel_id == 1
+        assert query_results[2][0].code == '5310B9D9'
+        assert query_results[2][0].active
+        assert query_results[3][0].vessel_id == 2
+        assert query_results[3][0].code == '5310B9DA'
+        assert query_results[3][0].location == 'chile'
+
+def test_insert_batch_without_equipments(app):
+    result = app.test_client().post('/equipment/insert_equipments', json={})
+    assert result.get_json().get('message') == "{'equipments': ['Missing data for required field.']}"
+    assert result.status_code == 400
+
+def test_insert_batch_null_equipment(app):
+    result = app.test_client().post('/equipment/insert_equipments', json={'equipments': [None]})
+    single = app.test_client().post('/equipment/insert_equipment', data='null', content_type='application/json')
+    assert result.get_json() == {'equipments': [
+        {'code': None, 'status': 'invalid', 'message': single.get_json()['message']}
+    ]}
+    assert result.status_code == 201
+
+def test_get_active_pages(app):
+    result = app.test_client().post('/equipment/insert_equipments', json={'equipments': [
+        {'vessel_code':'MV102', 'code':code, 'location':'brazil', 'name':'valve'}
+        for code in ('P1', 'P2', 'P3')
+    ]})
+    assert result.status_code == 201
+
+    client = app.test_client()
+    everything = client.get('/equipment/active_equipments', json={'vessel_code':'MV102'}).get_json()
+    assert [item['code'] for item in everything['MV102']] == ['5310B9D9', 'P1', 'P2', 'P3']
+
+    first = client.get('/equipment/active_equipments', json={'vessel_code':'MV102', 'limit': 3}).get_json()
+    assert first['equipments'] == {'MV102': everything['MV102'][:3]}
+    assert first['next'] == everything['MV102'][2]['id']
+
+    second = client.get(
+        '/equipment/active_equipments',
+        json={'vessel_code':'MV102', 'limit': 3, 'after': first['next']}
+    ).get_json()
+    assert second == {'equipments': {'MV102': everything['MV102'][3:]}, 'next': None}
+
+@pytest.mark.parametrize('description,stream', [
+    ('test page', False),
+    ('test stream a page', True)
+])
+def test_get_active_pages_vessel_next(app, description, stream):
+    client = app.test_client()
+    client.post('/vessel/insert_vessel', json={'code':'next'})
+    client.post('/equipment/insert_equipment', json={
+        'vessel_code':'next', 'code':'NEXT1', 'location':'brazil', 'name':'valve'
+    })
+    result = client.get(
+        '/equipment/active_equipments', json={'vessel_code':'next', 'limit': 1, 'stream': stream}
+    )
+    assert result.status_code == 200, description
+    body = json.loads(result.get_data())
+    assert [item['code'] for item in body['equipments']['next']] == ['NEXT1'], description
+    assert body['next'] is None, description
+
+@pytest.mark.parametrize('description,input_data,expected_next', [
+    ('test stream everything', {}, False),
+    ('test stream a page', {'limit': 2}, True),
+    ('test stream a full last page', {'limit': 4}, False)
+])
+def test_get_active_stream(app, description, input_data, expected_next):
+    client = app.test_client()
+    expected = client.get(
+        '/equipment/active_equipments', json={'vessel_code':'MV102', **input_data}
+    ).get_json()
+    result = client.get(
+        '/equipment/active_equipments', json={'vessel_code':'MV102', 'stream': True, **input_data}
+    )
+    assert result.status_code == 200, description
+    assert result.mimetype == 'application/json', description
+    assert json.loads(result.get_data()) == expected, description
+    assert bool(expected.get('next')) == expected_next, description
+
+@pytest.mark.parametrize('description,input_data', [
+    ('test string limit', {'limit': '3'}),
+    ('test float limit', {'limit': 3.0}),
+    ('test string after', {'limit': 3, 'after': '0'})
+])
+def test_get_active_converted_inputs(app, description, input_data):
+    client = app.test_client()
+    expected = client.get('/equipment/active_equipments', json={'vessel_code':'MV102', 'limit': 3}).get_json()
+    result = client.get('/equipment/active_equipments', json={'vessel_code':'MV102', **input_data})
+    assert result.status_code == 200, description
+    assert result.get_json() == expected, description
+
+def test_get_active_stream_false(app):
+    result = app.test_client().get(
+        '/equipment/active_equipments', json={'vessel_code':'MV102', 'stream': 'false'}
+    )
+    assert result.status_code == 200
+    # streamed responses have no length
+    assert result.content_length == len(result.get_data())
+
+def test_get_active_invalid_page(app):
+    result = app.test_client().get('/equipment/active_equipments', json={'vessel_code':'MV102', 'limit': 0})
+    assert result.get_json() == {'message': "{'limit': ['Must be greater than or equal to 1 and less than or equal to 10000.']}"}
+    assert result.status_code == 400
+
+def test_read_rows_skip_the_identity_map(app):
+    with app.app_context():
+        vessel_id = db.session.query(vessel.id).filter(vessel.code == 'MV102').scalar()
+        statement = reads.active_equipments(vessel_id, {})
+        rows = reads.fetch_all(statement, reads.EquipmentRow)
+        streamed = [row for batch in reads.stream(statement, reads.EquipmentRow, 2) for row in batch]
+
+        assert [row.code for row in rows] == ['5310B9D9', 'P1', 'P2', 'P3']
+        assert streamed == rows
+        assert all(type(row) is reads.EquipmentRow and not hasattr(row, '__dict__') for row in rows)
+        assert len(db.session.identity_map) == 0
+        db.session.rollback()
+
+Row = namedtuple('Row', reads.EQUIPMENT_FIELDS)
+
+@pytest.mark.parametrize('with_orjson', [True, False])
+@pytest.mark.parametrize('rows,limit', [
+    ([], None),
+    ([Row('E1', 1, 'brazil', 'compressor', 2), Row('E2', 3, None, 'pump "B"', 2)], None),
+    ([Row('E1', 1, 'brazil', 'compressor', 2), Row('E2', 3, 'brazil', 'pump', 2)], 1),
+    ([Row('E3', 4, 'são paulo', 'bomba d\'água ⚓', 2)], 1)
+])
+def test_fast_json_matches_jsonify(app, monkeypatch, with_orjson, rows, limit):
+    if not with_orjson:
+        monkeypatch.setattr(reads, 'orjson', None)
+    app.debug = False
+    try:
+        with app.test_request_context():
+            assert reads.fast_json(app)
+            expected = jsonify(reads.active_equipments_response('MV102', rows, limit)).get_data()
+            assert reads.active_equipments_json('MV102', rows, limit) == expected
+    finally:
+        app.debug = True
+
+def test_fast_json_only_outside_of_debug(app):
+    result = app.test_client().get('/equipment/active_equipments', json={'vessel_code':'MV102'})
+    # jsonify indents in debug
+    assert result.get_data().startswith(b'{\n')
+    assert not reads.fast_json(app)
+
+def test_update_bulk_status(app):
+    client = app.test_client()
+    app.config['EQUIPMENT_STATUS_CHUNK_SIZE'] = 2
+    try:
+        result = client.put('/equipment/update_equipments_status', json={
+            'codes': ['P1', 'P2', 'P1', '5310B9D7', 'NOPE']
+        })
+        assert result.get_json() == {
+            'active': False, 'codes': 4, 'updated': 2, 'unchanged': 1, 'unmatched': ['NOPE']
+        }
+        assert result.status_code == 201
+        active = client.get('/equipment/active_equipments', json={'vessel_code':'MV102'}).get_json()
+        assert [item['code'] for item in active['MV102']] == ['5310B9D9', 'P3']
+
+        result = client.put('/equipment/update_equipments_status', json={
+            'codes': ['P2', 'P1', 'P3'], 'active': True
+        })
+        assert result.get_json() == {
+            'active': True, 'codes': 3, 'updated': 2, 'unchanged': 1, 'unmatched': []
+        }
+    finally:
+        app.config.pop('EQUIPMENT_STATUS_CHUNK_SIZE')
+    with app.app_context():
+        inactive = db.session.execute(
+            db.select(equipment.code).where(equipment.active == False).order_by(equipment.code)
+        ).scalars().all()
+        assert inactive == ['5310B9D7', '5310B9D8']
+
+def test_update_status_activates(app):
+    client = app.test_client()
+    result = client.put('/equipment/update_equipment_status', json={'codes': ['5310B9D8'], 'active': True})
+    assert result.get_json().get('message') == 'OK'
+    assert result.status_code == 201
+    result = client.put('/equipment/update_equipment_status', json={'codes': ['5310B9D8']})
+    assert result.status_code == 201
+    with app.app_context():
+        assert db.session.query(equipment.active).filter(equipment.code == '5310B9D8').scalar() == False
+
+@pytest.mark.parametrize('description,input_data,expected_msg', [
+    ('test bulk update empty codes', {'codes': []}, "{'codes': ['Length must be between 1 and 1000000.']}"),
+    ('test bulk update invalid status', {'codes': ['P1'], 'active': 'x'}, "{'active': ['Not a valid boolean.']}")
+])
+def test_update_bulk_status_invalid(app, description, input_data, expected_msg):
+    result = app.test_client().put('/equipment/update_equipments_status', json=input_data)
+    assert result.get_json().get('message') == expected_msg, description
+    assert result.status_code == 400, description
+
 if __name__ == '__main__':
     pytest.main(['tests/test_equipments.py'])
\ No newline at end of file
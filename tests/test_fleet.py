@@ -0,0 +1,51 @@
+import pytest
+from flask_migrate import Migrate
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from apis import fleet, rollups
+from apis.app import create_app
+from apis.models.equipment import equipment
+from apis.models.model import db
+from apis.models.operation_order import OperationOrder
+from apis.models.vessel import vessel
+from apis.models.vessel_cost import VesselCost
+from sqlalchemy import func
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Migrate(app, db)
+        db.session.add(vessel(code='MV101'))
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def test_seed_fleet(app):
+    with app.app_context():
+        assert fleet.seed(db.session, 5, 3, 2, chunk_size=2) == {
+            'vessels': 5, 'equipments': 15, 'orders': 30
+        }
+        assert fleet.seed(db.session, 2, 1, 1) == {
+            'vessels': 2, 'equipments': 2, 'orders': 2
+        }
+
+        assert db.session.query(func.count(vessel.id)).scalar() == 8
+        assert db.session.query(func.count(func.distinct(equipment.code))).scalar() == 17
+        assert db.session.query(func.max(func.length(equipment.code))).scalar() == 8
+        assert db.session.query(func.count(OperationOrder.id)).scalar() == 32
+        assert db.session.query(func.sum(VesselCost.operations)).scalar() == 32
+        assert not any(rollups.rebuild(db.session).values())
+        db.session.rollback()
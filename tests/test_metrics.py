@@ -0,0 +1,137 @@
+import pytest
+from flask_migrate import Migrate
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from apis.app import create_app
+import json
+import subprocess
+
+from apis.metrics import Counter, Gauge, Histogram, Registry, SharedSamples
+from apis.models.model import db
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Migrate(app, db)
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def samples(client):
+    result = client.get('/metrics')
+    assert result.status_code == 200
+    assert result.content_type.startswith('text/plain; version=0.0.4')
+    return dict(
+        line.rsplit(' ', 1)
+        for line in result.get_data(as_text=True).splitlines()
+        if not line.startswith('#')
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.register(Histogram('latency', 'help', ('route',), buckets=(0.1, 1)))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, route='/a"b')
+
+    assert registry.render().splitlines() == [
+        '# HELP latency help',
+        '# TYPE latency histogram',
+        'latency_bucket{route="/a\\"b",le="0.1"} 1',
+        'latency_bucket{route="/a\\"b",le="1"} 2',
+        'latency_bucket{route="/a\\"b",le="+Inf"} 3',
+        'latency_sum{route="/a\\"b"} 5.55',
+        'latency_count{route="/a\\"b"} 3'
+    ]
+
+
+def test_request_metrics(app):
+    client = app.test_client()
+    client.post('/vessel/insert_vessel', json={'code': 'MV102'})
+    client.post('/vessel/insert_vessel', json={'code': 'MV102'})
+    client.get('/not_a_route')
+
+    metrics = samples(client)
+    route = 'blueprint="vessels",route="/vessel/insert_vessel",method="POST"'
+    assert metrics[f'http_responses_total{{{route},status="201"}}'] == '1'
+    assert metrics[f'http_responses_total{{{route},status="409"}}'] == '1'
+    assert metrics[f'http_request_duration_seconds_count{{{route}}}'] == '2'
+    assert metrics['http_responses_total{blueprint="",route="<unmatched>",method="GET",status="404"}'] == '1'
+    # the scrape itself is in flight
+    assert metrics['http_requests_in_flight{blueprint="metrics"}'] == '1'
+    assert metrics['http_requests_in_flight{blueprint="vessels"}'] == '0'
+
+
+def test_sql_metrics(app):
+    client = app.test_client()
+    client.post('/vessel/insert_vessel', json={'code': 'MV103'})
+
+    metrics = samples(client)
+    route = 'blueprint="vessels",route="/vessel/insert_vessel",method="POST"'
+    assert int(metrics[f'http_request_sql_statements_count{{{route}}}']) >= 1
+    assert float(metrics[f'http_request_sql_duration_seconds_sum{{{route}}}']) > 0
+    assert int(metrics['sql_statement_duration_seconds_count{verb="INSERT"}']) >= 1
+    assert int(metrics['db_pool_checkout_wait_seconds_count']) >= 1
+    assert metrics['db_pool_checked_out'] == '0'
+    assert float(metrics['db_pool_utilization']) == 0
+    assert int(metrics['code_cache_misses_total{kind="vessel"}']) >= 0
+
+
+def test_shared_samples_cover_every_worker(tmp_path):
+    registry = Registry()
+    counter = registry.register(Counter('requests_total', 'help', ('route',)))
+    gauge = registry.register(Gauge('in_flight', 'help'))
+    histogram = registry.register(Histogram('latency', 'help', buckets=(1,)))
+    counter.inc(2, route='/a')
+    gauge.inc(1)
+    histogram.observe(0.5)
+    shared = SharedSamples(registry, str(tmp_path), 5)
+
+    exited_pid = subprocess.Popen(['true'])
+    exited_pid.wait()
+    other = {
+        'requests_total': [['requests_total', [['route', '/a']], 3], ['requests_total', [['route', '/b']], 1]],
+        'in_flight': [['in_flight', [], 4]],
+        'latency': [['latency_bucket', [['le', '1']], 0], ['latency_bucket', [['le', '+Inf']], 1],
+                    ['latency_sum', [], 2.0], ['latency_count', [], 1]]
+    }
+    # a live worker, the parent of the tests, and one that exited
+    (tmp_path / f'{os.getppid()}.json').write_text(json.dumps(other))
+    (tmp_path / f'{exited_pid.pid}.json').write_text(json.dumps(other))
+
+    expected = [
+        '# HELP requests_total help',
+        '# TYPE requests_total counter',
+        'requests_total{route="/a"} 8',
+        'requests_total{route="/b"} 2',
+        '# HELP in_flight help',
+        '# TYPE in_flight gauge',
+        'in_flight 5',
+        '# HELP latency help',
+        '# TYPE latency histogram',
+        'latency_bucket{le="1"} 1',
+        'latency_bucket{le="+Inf"} 3',
+        'latency_sum 4.5',
+        'latency_count 3'
+    ]
+    assert registry.render(shared.collect()).splitlines() == expected
+    # the exited worker is folded into the archive
+    assert not (tmp_path / f'{exited_pid.pid}.json').exists()
+    assert (tmp_path / 'archive.json').exists()
+    assert registry.render(shared.collect()).splitlines() == expected
+
+    shared.write()
+    assert json.loads((tmp_path / f'{os.getpid()}.json').read_text())['in_flight'] == [['in_flight', [], 1]]
+
@@ -1,3 +1,6 @@
+import time
+
+import psycopg2
 import pytest
 from flask_migrate import Migrate
 
@@ -5,13 +8,16 @@ import sys
 import os
 
 from apis.models.operation_order import OperationOrder
+from apis.models.vessel_cost import VesselCost
+from apis.models.equipment_cost import EquipmentCost
 sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
 
+from apis import rollups
 from apis.app import create_app
 from apis.models.model import db
 from apis.models.vessel import vessel
 from apis.models.equipment import equipment
-from sqlalchemy import func
+from sqlalchemy import event, func
 
 
 @pytest.fixture(scope="module")
@@ -132,5 +138,207 @@ def test_operation_cases(
         query_results = db.session.execute(query).all()
         assert query_results[0][0] == 2, description
 
+def test_upload_ndjson(app):
+    body = '\n'.join([
+        '{"code": "5310B9D7", "type": "replacement", "cost": 10.5}',
+        '{"code": "INVALID", "type": "replacement", "cost": 10.5}',
+        '',
+        'not json',
+        '{"code": "5310B9D8", "type": "inspection", "cost": 20}',
+        '{"code": "5310B9D8", "type": "inspection"}'
+    ])
+    result = app.test_client().post(
+        '/operation_order/upload_operations',
+        data=body, content_type='application/x-ndjson'
+    )
+    assert result.get_json() == {
+        'accepted': 2,
+        'rejected': 3,
+        'rejected_rows': [
+            {'line': 2, 'message': 'Invalid equipment code'},
+            {'line': 4, 'message': "{'_schema': ['Invalid input type.']}"},
+            {'line': 6, 'message': "{'cost': ['Missing data for required field.']}"}
+        ]
+    }
+    assert result.status_code == 201
+    with app.app_context():
+        query = db.session.query(OperationOrder)\
+            .order_by(OperationOrder.id)
+        query_results = db.session.execute(query).all()
+        assert len(query_results) == 4
+        assert query_results[2][0].equipment_id == 1
+        assert query_results[2][0].type == 'replacement'
+        assert query_results[2][0].cost == 10.5
+        assert query_results[3][0].equipment_id == 2
+        assert query_results[3][0].cost == 20
+
+def test_upload_csv(app):
+    body = 'code,type,cost\n5310B9D7,"replacement, urgent",1.25\n5310B9D7,replacement,abc\n'
+    result = app.test_client().post(
+        '/operation_order/upload_operations',
+        data=body, content_type='text/csv'
+    )
+    assert result.get_json() == {
+        'accepted': 1,
+        'rejected': 1,
+        'rejected_rows': [{'line': 3, 'message': "{'cost': ['Not a valid number.']}"}]
+    }
+    assert result.status_code == 201
+    with app.app_context():
+        query = db.session.query(OperationOrder)\
+            .order_by(OperationOrder.id.desc())
+        query_results = db.session.execute(query).all()
+        assert len(query_results) == 5
+        assert query_results[0][0].type == 'replacement, urgent'
+        assert query_results[0][0].cost == 1.25
+
+def test_upload_unsupported_content_type(app):
+    result = app.test_client().post(
+        '/operation_order/upload_operations',
+        data='<orders/>', content_type='application/xml'
+    )
+    assert result.get_json() == {'message': 'Unsupported content type application/xml'}
+    assert result.status_code == 400
+
+def test_average_cost_after_upload(app):
+    result = app.test_client().get('/operation_order/average_cost')
+    assert result.get_json() == {
+        'MV101': round((234.56 + 20) / 2, 2),
+        'MV102': round((123.45 + 10.5 + 1.25) / 3, 2)
+    }
+    assert result.status_code == 200
+
+def test_rebuild_rollups(app):
+    with app.app_context():
+        db.session.query(VesselCost).filter(VesselCost.vessel_id == 2).delete()
+        db.session.commit()
+
+        db.session.query(EquipmentCost).filter(EquipmentCost.equipment_id == 1)\
+            .update({EquipmentCost.total_cost: 0})
+        db.session.commit()
+
+        drifted = rollups.rebuild(db.session)
+        assert drifted['vessel_costs'] == [2]
+        assert drifted['equipment_costs'] == [1]
+        db.session.commit()
+
+        rows = db.session.query(VesselCost).order_by(VesselCost.vessel_id).all()
+        assert [(row.vessel_id, row.operations) for row in rows] == [(1, 3), (2, 2)]
+        assert round(rows[1].total_cost, 2) == 254.56
+        rows = db.session.query(EquipmentCost).order_by(EquipmentCost.equipment_id).all()
+        assert [(row.equipment_id, row.operations) for row in rows] == [(1, 3), (2, 2)]
+        assert round(rows[0].total_cost, 2) == 135.2
+        assert not any(rollups.rebuild(db.session).values())
+        db.session.commit()
+
+@pytest.mark.parametrize('description,input_data,expected_resp', [
+    (
+        'test total_cost by code after upload',
+        {'code':'5310B9D8'},
+        {'total_cost': 234.56 + 20}
+    ),
+    (
+        'test total_cost by name after upload',
+        {'name':'compressor'},
+        {'total_cost': 234.56 + 20 + 123.45 + 10.5 + 1.25}
+    )
+])
+def test_total_cost_after_upload(app, description, input_data, expected_resp):
+    result = app.test_client().get('/operation_order/total_cost', json=input_data)
+    assert result.get_json()['total_cost'] == pytest.approx(expected_resp['total_cost']), description
+    assert result.status_code == 200, description
+
+@pytest.mark.parametrize('description,listen,operations', [
+    ('test without notifications', False, 6),
+    ('test notifying the other workers', True, 7)
+])
+def test_writes_take_one_statement(app, monkeypatch, description, listen, operations):
+    monkeypatch.setitem(app.config, 'RESPONSE_CACHE_LISTEN', listen)
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    listener = psycopg2.connect(app.config['SQLALCHEMY_DATABASE_URI'])
+    listener.autocommit = True
+    listener.cursor().execute('LISTEN response_cache')
+
+    client = app.test_client()
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        result = client.post('/vessel/insert_vessel', json={'code': f'MV{operations}'})
+        assert result.status_code == 201, description
+        result = client.post('/equipment/insert_equipment', json={
+            'vessel_code': f'MV{operations}', 'code': f'ONE{operations}', 'location': 'brazil', 'name': 'pump'
+        })
+        assert result.status_code == 201, description
+        result = client.post('/operation_order/insert_operation', json={'code':'5310B9D8', 'type': 'repair', 'cost': 5})
+        assert result.status_code == 201, description
+        assert len(statements) == 3, description
+        result = client.post('/operation_order/insert_operation', json={'code':'NOPE', 'type': 'repair', 'cost': 5})
+        assert result.get_json() == {'message': 'Invalid equipment code'}, description
+        assert result.status_code == 400, description
+        assert len(statements) == 4, description
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    # the notifications are sent by the statements of the writes
+    deadline = time.monotonic() + 5
+    payloads = []
+    while listen and len(payloads) < 3:
+        assert time.monotonic() < deadline, description
+        listener.poll()
+        payloads.extend(notify.payload for notify in listener.notifies)
+        listener.notifies.clear()
+        time.sleep(0.05)
+    listener.poll()
+    payloads.extend(notify.payload for notify in listener.notifies)
+    listener.close()
+    expected = ['["vessel"]', '["equipment"]', '["operation_order"]'] if listen else []
+    assert payloads == expected, description
+
+    with app.app_context():
+        assert not any(rollups.rebuild(db.session).values())
+        db.session.rollback()
+        assert db.session.query(func.count(OperationOrder.id)).scalar() == operations, description
+
+def test_upload_loaded_values(app):
+    body = b'\n'.join([
+        b'{"code": "5310B9D7", "type": "replacement", "cost": 1}',
+        b'\xff\xfe',
+        b'{"code": "5310B9D7", "type": "replacement", "cost": "1_000"}',
+        b'{"code": "5310B9D8", "type": "inspection", "cost": "2.005"}'
+    ])
+    result = app.test_client().post(
+        '/operation_order/upload_operations',
+        data=body, content_type='application/x-ndjson'
+    )
+    assert result.get_json() == {
+        'accepted': 3,
+        'rejected': 1,
+        'rejected_rows': [{'line': 2, 'message': "{'_schema': ['Invalid input type.']}"}]
+    }
+    assert result.status_code == 201
+
+    body = b'code,type,cost\n5310B9D7,replacement,1\n5310B9D7,replacement,\xff1\n'
+    result = app.test_client().post(
+        '/operation_order/upload_operations',
+        data=body, content_type='text/csv'
+    )
+    assert result.get_json() == {
+        'accepted': 1,
+        'rejected': 1,
+        'rejected_rows': [{'line': 3, 'message': "{'cost': ['Not a valid number.']}"}]
+    }
+    assert result.status_code == 201
+
+    with app.app_context():
+        costs = db.session.query(OperationOrder.cost)\
+            .order_by(OperationOrder.id.desc()).limit(4).all()
+        assert [cost for cost, in costs] == [1, 2.0, 1000, 1]
+        assert not any(rollups.rebuild(db.session).values())
+        db.session.rollback()
+
 if __name__ == '__main__':
     pytest.main(['tests/test_operations.py'])
\ No newline at end of file
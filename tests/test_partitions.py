@@ -0,0 +1,168 @@
+import pytest
+from datetime import date, datetime, timezone
+from flask_migrate import Migrate
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from apis import partitions, rollups
+from apis.app import create_app
+from apis.models.equipment import equipment
+from apis.models.model import db
+from apis.models.operation_order import OperationOrder
+from apis.models.vessel import vessel
+from sqlalchemy import event, text
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Migrate(app, db)
+        db.session.add(vessel(code='MV101'))
+        db.session.add(vessel(code='MV102'))
+        db.session.commit()
+        db.session.add(equipment(vessel_id=1, code='5310B9D7', location='brazil', name='compressor', active=True))
+        db.session.add(equipment(vessel_id=2, code='5310B9D8', location='brazil', name='compressor', active=True))
+        db.session.commit()
+        for equipment_id, cost, executed_at in (
+            (1, 10.0, datetime(2025, 1, 10, tzinfo=timezone.utc)),
+            (1, 20.0, datetime(2025, 2, 10, tzinfo=timezone.utc)),
+            (2, 40.0, datetime(2025, 2, 20, tzinfo=timezone.utc)),
+            (1, 80.0, datetime(2025, 3, 10, tzinfo=timezone.utc))
+        ):
+            db.session.add(OperationOrder(
+                equipment_id=equipment_id, type='repair', cost=cost, executed_at=executed_at
+            ))
+        db.session.commit()
+        rollups.rebuild(db.session)
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def rows_per_partition():
+    return dict(db.session.execute(text(
+        'SELECT tableoid::regclass::text, count(*) FROM operation_order GROUP BY 1'
+    )).all())
+
+
+def test_create_partitions_moves_rows_out_of_default(app):
+    with app.app_context():
+        assert rows_per_partition() == {'operation_order_default': 4}
+
+        created = partitions.ensure_partitions(db.session, months_ahead=0, since=date(2025, 1, 15))
+        db.session.commit()
+        assert created[:3] == ['operation_order_2025_01', 'operation_order_2025_02', 'operation_order_2025_03']
+        assert created[-1] == partitions.partition_name(partitions.month_start(date.today()))
+        assert rows_per_partition() == {
+            'operation_order_2025_01': 1, 'operation_order_2025_02': 2, 'operation_order_2025_03': 1
+        }
+
+        # existing partitions are kept
+        assert partitions.ensure_partitions(db.session, months_ahead=0, since=date(2025, 1, 1)) == []
+        db.session.commit()
+
+
+def test_inserts_wait_for_the_new_partition(app):
+    outcomes = []
+    def insert_before_attach(conn, cursor, statement, parameters, context, executemany):
+        if 'ATTACH PARTITION' not in statement:
+            return
+        with db.engine.connect() as other:
+            other.execute(text("SET lock_timeout = '100ms'"))
+            try:
+                # the row would go to the default partition, after its rows of the month were moved
+                other.execute(text(
+                    "INSERT INTO operation_order (equipment_id, type, cost, executed_at) "
+                    "VALUES (1, 'repair', 1, '2024-06-10T00:00:00+00:00')"
+                ))
+                outcomes.append('inserted')
+            except Exception as e:
+                outcomes.append(str(e))
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', insert_before_attach)
+        try:
+            partitions.create_partition(db.session, date(2024, 6, 1))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', insert_before_attach)
+        db.session.commit()
+        assert len(outcomes) == 1 and 'lock timeout' in outcomes[0]
+        assert 'operation_order_2024_06' in partitions.existing_partitions(db.session)
+
+
+def test_month_start():
+    assert partitions.month_start(date(2025, 12, 31), 1) == date(2026, 1, 1)
+    assert partitions.month_start(date(2025, 1, 31), -1) == date(2024, 12, 1)
+    assert partitions.month_start(date(2025, 5, 5), -17) == date(2023, 12, 1)
+
+
+@pytest.mark.parametrize(
+    'description,input_data,expected', [
+    ('without range, total from the rollup', {'name': 'compressor'}, 150),
+    ('from start', {'name': 'compressor', 'start': '2025-02-01T00:00:00+00:00'}, 140),
+    ('until end', {'code': '5310B9D7', 'end': '2025-02-15T00:00:00+00:00'}, 30),
+    ('inside a month', {'name': 'compressor', 'start': '2025-02-15T00:00:00+00:00', 'end': '2025-03-01T00:00:00+00:00'}, 40),
+    ('without orders in the range', {'code': '5310B9D8', 'start': '2025-03-01T00:00:00+00:00'}, None)
+])
+def test_total_cost_in_range(app, description, input_data, expected):
+    result = app.test_client().get('/operation_order/total_cost', json=input_data)
+    assert result.status_code == 200, description
+    assert result.get_json() == {'total_cost': expected}, description
+
+
+def test_average_cost_in_range(app):
+    client = app.test_client()
+    assert client.get('/operation_order/average_cost').get_json() == {'MV101': 36.67, 'MV102': 40.0}
+    assert client.get('/operation_order/average_cost', json={
+        'start': '2025-01-01T00:00:00+00:00', 'end': '2025-03-01T00:00:00+00:00'
+    }).get_json() == {'MV101': 15.0, 'MV102': 40.0}
+    assert client.get('/operation_order/average_cost', json={
+        'start': '2024-01-01T00:00:00+00:00', 'end': '2024-02-01T00:00:00+00:00'
+    }).get_json() == {}
+
+
+@pytest.mark.parametrize(
+    'description,input_data', [
+    ('end before start', {'start': '2025-02-01T00:00:00+00:00', 'end': '2025-01-01T00:00:00+00:00'}),
+    ('invalid date', {'start': 'yesterday'}),
+    ('mixed timezones', {'start': '2025-01-01T00:00:00', 'end': '2025-02-01T00:00:00+00:00'})
+])
+def test_invalid_range(app, description, input_data):
+    result = app.test_client().get('/operation_order/average_cost', json=input_data)
+    assert result.status_code == 400, description
+    result = app.test_client().get('/operation_order/total_cost', json=dict(input_data, name='compressor'))
+    assert result.status_code == 400, description
+
+
+def test_range_reads_only_its_partitions(app):
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            result = app.test_client().get('/operation_order/average_cost', json={
+                'start': '2025-02-01T00:00:00+00:00', 'end': '2025-03-01T00:00:00+00:00'
+            })
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        assert result.status_code == 200
+
+        statement, parameters = next(s for s in statements if 'avg' in s[0])
+        with db.engine.connect() as connection:
+            plan = '\n'.join(connection.exec_driver_sql(f'EXPLAIN {statement}', parameters).scalars())
+    assert 'operation_order_2025_02' in plan
+    assert 'operation_order_2025_01' not in plan
+    assert 'operation_order_2025_03' not in plan
+    assert 'operation_order_default' not in plan
@@ -0,0 +1,80 @@
+import json
+import pytest
+from flask_migrate import Migrate
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from apis.app import create_app
+from apis.models.model import db
+from apis.profiling import profiling
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+    app.config['PROFILING_ENABLED'] = True
+    app.config['PROFILING_TOKEN'] = 'secret'
+    profiling.init_app(app)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Migrate(app, db)
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def test_disabled_registers_nothing():
+    app = create_app(test_config=True)
+    assert not any(
+        function.__qualname__.startswith('Profiling.')
+        for functions in app.before_request_funcs.values() for function in functions
+    )
+
+
+def test_not_requested(app):
+    result = app.test_client().post('/vessel/insert_vessel', json={'code': 'MV101'})
+    assert result.status_code == 201
+    assert 'X-Profile-Id' not in result.headers
+    assert result.json == {'message': 'OK'}
+
+    result = app.test_client().get('/operation_order/average_cost', headers={'X-Profile': 'wrong'})
+    assert 'X-Profile-Id' not in result.headers
+
+
+def test_profile_in_response(app):
+    result = app.test_client().post(
+        '/vessel/insert_vessel', json={'code': 'MV102'}, headers={'X-Profile': 'secret'}
+    )
+    assert result.status_code == 201
+    report = result.json
+    assert report['id'] == result.headers['X-Profile-Id']
+    assert report['endpoint'] == 'vessels.insert_vessel'
+    assert json.loads(report['response']) == {'message': 'OK'}
+    assert 'insert_vessel' in report['profile']
+
+    inserts = [statement for statement in report['sql'] if statement['statement'].startswith('INSERT INTO vessels')]
+    assert len(inserts) == 1
+    assert inserts[0]['parameters'] == {'code': 'MV102'}
+    assert inserts[0]['duration_ms'] >= 0
+
+
+def test_profile_in_directory(app, tmp_path):
+    app.config['PROFILING_DIR'] = str(tmp_path)
+    try:
+        result = app.test_client().get('/operation_order/average_cost', headers={'X-Profile': 'secret'})
+    finally:
+        app.config['PROFILING_DIR'] = ''
+
+    assert result.status_code == 200
+    profile_id = result.headers['X-Profile-Id']
+    assert (tmp_path / f'{profile_id}.prof').exists()
+    report = json.loads((tmp_path / f'{profile_id}.json').read_text())
+    assert report['endpoint'] == 'operation_order.average_cost'
+    assert report['status'] == 200
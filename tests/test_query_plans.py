@@ -0,0 +1,165 @@
+import pytest
+from datetime import date
+from flask_migrate import Migrate, upgrade
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from apis import partitions, rollups
+from apis.app import create_app
+from apis.models.model import db
+from sqlalchemy import event, text
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), '../migrations')
+VESSELS, EQUIPMENTS_PER_VESSEL, ORDERS_PER_EQUIPMENT = 1_000, 20, 5
+THIS_MONTH = partitions.month_start(date.today())
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+
+    with app.app_context():
+        db.drop_all()
+        db.session.execute(text('DROP TABLE IF EXISTS alembic_version'))
+        db.session.commit()
+        Migrate(app, db, directory=MIGRATIONS_DIR)
+        upgrade(directory=MIGRATIONS_DIR)
+
+        db.session.execute(text(
+            "INSERT INTO vessels (code) SELECT 'V' || n FROM generate_series(1, :vessels) n"
+        ), {'vessels': VESSELS})
+        db.session.execute(text(
+            "INSERT INTO equipments (vessel_id, code, name, location, active) "
+            "SELECT v.id, 'E' || (v.id * :per_vessel + n), 'equipment ' || n, 'brazil', n % 4 > 0 "
+            "FROM vessels v, generate_series(1, :per_vessel) n"
+        ), {'per_vessel': EQUIPMENTS_PER_VESSEL})
+        db.session.execute(text(
+            "INSERT INTO operation_order (equipment_id, type, cost) "
+            "SELECT e.id, 'replacement', n * 10.5 "
+            "FROM equipments e, generate_series(1, :per_equipment) n"
+        ), {'per_equipment': ORDERS_PER_EQUIPMENT})
+        rollups.rebuild(db.session)
+        db.session.commit()
+        for table in db.metadata.sorted_tables:
+            db.session.execute(text(f'ANALYZE {table.name}'))
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.session.execute(text('DROP TABLE alembic_version'))
+        db.session.commit()
+
+
+def seq_scans(plan):
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan['Relation Name']
+    for child in plan.get('Plans', []):
+        yield from seq_scans(child)
+
+
+def explained_seq_scans(app, endpoint, method, input_data):
+    """Calls the endpoint and returns the tables sequentially scanned by its statements"""
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            client = app.test_client()
+            request_handler = client.get \
+                if method == 'get' else client.post
+            result = request_handler(endpoint, json=input_data)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+        scans = set()
+        with db.engine.connect() as connection:
+            # scans of a partition count as scans of its table
+            parents = dict(connection.execute(text(
+                'SELECT inhrelid::regclass::text, inhparent::regclass::text FROM pg_inherits'
+            )).all())
+            for statement, parameters in statements:
+                if statement.split(None, 1)[0].upper() not in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE'):
+                    continue
+                plan = connection.exec_driver_sql(
+                    f'EXPLAIN (FORMAT JSON) {statement}', parameters
+                ).scalar()
+                scans.update(parents.get(name, name) for name in seq_scans(plan[0]['Plan']))
+    return result, statements, scans
+
+
+def test_migrations_match_models(app):
+    with app.app_context():
+        with db.engine.connect() as connection:
+            context = MigrationContext.configure(connection, opts={
+                'compare_type': False,
+                'include_object': partitions.include_object(connection)
+            })
+            assert compare_metadata(context, db.metadata) == []
+
+
+@pytest.mark.parametrize(
+    'description,endpoint,method,input_data,indexed_tables', [
+    (
+        'active_equipments looks up the vessel and its active equipments by index',
+        '/equipment/active_equipments', 'get',
+        {'vessel_code': 'V500'},
+        {'vessels', 'equipments'}
+    ),
+    (
+        'active_equipments pages are read by index',
+        '/equipment/active_equipments', 'get',
+        {'vessel_code': 'V500', 'limit': 5, 'after': 10005},
+        {'vessels', 'equipments'}
+    ),
+    (
+        'total_cost by code reads the equipment totals by index',
+        '/operation_order/total_cost', 'get',
+        {'code': 'E10001'},
+        {'equipments', 'equipment_costs', 'operation_order'}
+    ),
+    (
+        'total_cost by name reads the equipment totals by index',
+        '/operation_order/total_cost', 'get',
+        {'name': 'equipment 7'},
+        {'equipments', 'operation_order'}
+    ),
+    (
+        'total_cost in a range reads the orders of the equipment by index',
+        '/operation_order/total_cost', 'get',
+        # the partition created by the migrations, orders are seeded now
+        {'code': 'E10001', 'start': f'{THIS_MONTH}T00:00:00', 'end': f'{partitions.month_start(THIS_MONTH, 1)}T00:00:00'},
+        {'equipments', 'operation_order'}
+    ),
+    (
+        'average_cost only reads the vessel rollups',
+        '/operation_order/average_cost', 'get',
+        {},
+        {'equipments', 'operation_order'}
+    ),
+    (
+        'insert_equipment looks up the vessel by index',
+        '/equipment/insert_equipment', 'post',
+        {'vessel_code':'V12', 'code':'NEW1', 'location':'brazil', 'name':'compressor'},
+        {'vessels', 'equipments'}
+    ),
+    (
+        'insert_operation looks up the equipment by index',
+        '/operation_order/insert_operation', 'post',
+        {'code':'E10001', 'type': 'replacement', 'cost': 12.5},
+        {'equipments', 'operation_order'}
+    )
+])
+def test_no_seq_scans(app, description, endpoint, method, input_data, indexed_tables):
+    result, statements, scans = explained_seq_scans(app, endpoint, method, input_data)
+    assert result.status_code in (200, 201), description
+    assert statements, description
+    assert not scans & indexed_tables, description
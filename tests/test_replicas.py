@@ -0,0 +1,153 @@
+import pytest
+from flask_migrate import Migrate
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from apis.app import create_app
+from apis.models.equipment import equipment
+from apis.models.model import db
+from apis.models.vessel import vessel
+from apis.replicas import replicas
+from sqlalchemy import text
+
+# a second database of the test server stands for the replica
+REPLICA_DATABASE = 'vessels_replica'
+
+
+def add_fleet(connection, equipment_code):
+    connection.execute(vessel.__table__.insert(), [{'code': 'MV101'}])
+    connection.execute(equipment.__table__.insert(), [{
+        'vessel_id': 1, 'code': equipment_code, 'location': 'brazil',
+        'name': 'compressor', 'active': True
+    }])
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+    primary_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    with app.app_context():
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS {REPLICA_DATABASE}'))
+            connection.execute(text(f'CREATE DATABASE {REPLICA_DATABASE}'))
+
+    app.config['SQLALCHEMY_BINDS'] = {
+        'replica_0': primary_uri.rsplit('/', 1)[0] + f'/{REPLICA_DATABASE}'
+    }
+    app.config['REPLICA_STICKY_SECONDS'] = 5
+    app.config['REPLICA_LAG_CHECK_INTERVAL'] = 0
+    replicas.init_app(app)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Migrate(app, db)
+        replica_engine = db.get_engine(app, bind='replica_0')
+        db.metadata.create_all(bind=replica_engine)
+        with db.engine.begin() as connection:
+            add_fleet(connection, 'PRIMARY1')
+        with replica_engine.begin() as connection:
+            add_fleet(connection, 'REPLICA1')
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.get_engine(app, bind='replica_0').dispose()
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS {REPLICA_DATABASE}'))
+
+
+def active_codes(client, limit=10):
+    # responses read from the primary are cached, the limit changes the key
+    result = client.get('/equipment/active_equipments', json={'vessel_code': 'MV101', 'limit': limit})
+    assert result.status_code == 200
+    return [item['code'] for item in result.get_json()['equipments']['MV101']], result
+
+
+def reads(app):
+    return app.extensions['replicas'].stats()['reads']
+
+
+def test_reads_go_to_the_replica(app):
+    codes, result = active_codes(app.test_client())
+    assert codes == ['REPLICA1']
+    assert app.extensions['replicas'].stats()['lag'] == {'replica_0': 0}
+    assert reads(app)['replica_0', 'replica'] == 1
+
+
+def test_replica_responses_are_cached_once_replayed(app):
+    client = app.test_client()
+    # measured before the read, the replica is past the position the first
+    # read required
+    active_codes(client, limit=5)
+    codes, result = active_codes(client, limit=5)
+    assert codes == ['REPLICA1']
+    etag = result.headers.get('ETag')
+    assert etag is not None
+
+    result = client.get(
+        '/equipment/active_equipments', json={'vessel_code': 'MV101', 'limit': 5},
+        headers={'If-None-Match': etag}
+    )
+    assert result.status_code == 304
+
+
+def test_replica_responses_wait_for_the_writes(app):
+    router = app.extensions['replicas']
+    replica = router.replicas[0]
+    lag, replayed = replica.state
+    # the replica stays behind the position of the primary
+    replica.checked_at = float('inf')
+    replica.state = (0.0, 0)
+    try:
+        result = active_codes(app.test_client(), limit=6)[1]
+        assert result.headers.get('ETag') is None
+    finally:
+        replica.state = (lag, replayed)
+        replica.checked_at = None
+
+
+def test_writes_go_to_the_primary(app):
+    client = app.test_client()
+    result = client.post('/vessel/insert_vessel', json={'code': 'MV102'})
+    assert result.status_code == 201
+    with app.app_context():
+        codes = [row.code for row in db.session.query(vessel.code).order_by(vessel.code)]
+        assert codes == ['MV101', 'MV102']
+
+
+def test_reads_stick_to_the_primary_after_a_write(app):
+    client = app.test_client()
+    assert active_codes(client)[0] == ['REPLICA1']
+
+    result = client.post('/vessel/insert_vessel', json={'code': 'MV103'})
+    assert 'db_primary_until' in result.headers['Set-Cookie']
+    # a new key, the response read from the replica before is cached
+    codes, result = active_codes(client, limit=11)
+    assert codes == ['PRIMARY1']
+    assert result.headers.get('ETag') is not None
+    assert reads(app)['primary', 'sticky'] == 1
+
+    # other clients still read from the replica
+    assert active_codes(app.test_client(), limit=20)[0] == ['REPLICA1']
+
+
+def test_lagging_replica_falls_back_to_the_primary(app):
+    router = app.extensions['replicas']
+    router.max_lag = -1
+    try:
+        assert active_codes(app.test_client(), limit=30)[0] == ['PRIMARY1']
+        assert reads(app)['primary', 'lagging'] == 1
+    finally:
+        router.max_lag = app.config['REPLICA_MAX_LAG']
+
+
+def test_replica_metrics(app):
+    result = app.test_client().get('/metrics')
+    metrics = result.get_data(as_text=True)
+    assert 'db_replica_lag_seconds{bind="replica_0"} 0' in metrics
+    assert 'db_replica_reads_total{target="primary",reason="lagging"} 1' in metrics
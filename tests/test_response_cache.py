@@ -0,0 +1,186 @@
+import time
+import pytest
+from flask_migrate import Migrate
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from apis import notifications
+from apis.app import create_app
+from apis.models.model import db
+from apis.models.vessel import vessel
+from apis.models.equipment import equipment
+from apis.response_cache import response_cache
+from sqlalchemy import event, text
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Migrate(app, db)
+        db.session.add(vessel(code='MV102'))
+        db.session.commit()
+        db.session.add(equipment(vessel_id=1, code='5310B9D7', location='brazil', name='compressor', active=True))
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def statements_of(app, call):
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            result = call()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+    return result, statements
+
+def test_cached_reads_skip_the_database(app):
+    client = app.test_client()
+    first, statements = statements_of(app, lambda: client.get(
+        '/operation_order/total_cost', json={'code': '5310B9D7', 'name': 'pump'}
+    ))
+    assert first.status_code == 200
+    assert statements
+
+    second, statements = statements_of(app, lambda: client.get(
+        '/operation_order/total_cost', json={'name': 'pump', 'code': '5310B9D7'}
+    ))
+    assert second.get_data() == first.get_data()
+    assert second.status_code == 200
+    assert statements == []
+
+def test_errors_are_not_cached(app):
+    client = app.test_client()
+    client.get('/operation_order/total_cost', json={'code': 'INVALID'})
+    result, statements = statements_of(app, lambda: client.get(
+        '/operation_order/total_cost', json={'code': 'INVALID'}
+    ))
+    assert result.get_json() == {'message': 'Invalid parameters'}
+    assert statements
+
+def test_writes_invalidate_reads(app):
+    client = app.test_client()
+    assert client.get('/operation_order/average_cost').get_json() == {}
+    assert client.get('/equipment/active_equipments', json={'vessel_code': 'MV102'}).status_code == 200
+
+    result = client.post(
+        '/operation_order/insert_operation',
+        json={'code':'5310B9D7', 'type': 'replacement', 'cost': 100}
+    )
+    assert result.status_code == 201
+    assert client.get('/operation_order/average_cost').get_json() == {'MV102': 100}
+    assert client.get('/operation_order/total_cost', json={'code': '5310B9D7'}).get_json() == {'total_cost': 100}
+
+    # active equipments did not change, so they are still cached
+    result, statements = statements_of(app, lambda: client.get(
+        '/equipment/active_equipments', json={'vessel_code': 'MV102'}
+    ))
+    assert result.status_code == 200
+    assert statements == []
+
+    client.put('/equipment/update_equipment_status', json={'codes': ['5310B9D7']})
+    assert client.get('/equipment/active_equipments', json={'vessel_code': 'MV102'}).get_json() == {'MV102': []}
+
+def test_conditional_requests(app):
+    client = app.test_client()
+    first = client.get('/operation_order/average_cost')
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    result, statements = statements_of(app, lambda: client.get(
+        '/operation_order/average_cost', headers={'If-None-Match': etag}
+    ))
+    assert result.status_code == 304
+    assert result.get_data() == b''
+    assert result.headers['ETag'] == etag
+    assert statements == []
+
+    other = client.get('/equipment/active_equipments', json={'vessel_code': 'MV102'})
+    assert other.headers['ETag'] != etag
+
+    client.post(
+        '/operation_order/insert_operation',
+        json={'code':'5310B9D7', 'type': 'replacement', 'cost': 50}
+    )
+    result = client.get('/operation_order/average_cost', headers={'If-None-Match': etag})
+    assert result.status_code == 200
+    assert result.get_json() == {'MV102': 75}
+    assert result.headers['ETag'] != etag
+
+    # equipments did not change
+    result = client.get(
+        '/equipment/active_equipments', json={'vessel_code': 'MV102'},
+        headers={'If-None-Match': other.headers['ETag']}
+    )
+    assert result.status_code == 304
+
+def test_errors_have_no_etag(app):
+    result = app.test_client().get('/equipment/active_equipments', json={'vessel_code': 'INVALID'})
+    assert result.status_code == 400
+    assert 'ETag' not in result.headers
+
+def test_rollbacks_do_not_bump_versions(app):
+    with app.app_context():
+        backend = response_cache.backend()
+        versions = backend.versions_of(['operation_order'])
+        response_cache.touch(db.session, 'operation_order')
+        db.session.rollback()
+        assert backend.versions_of(['operation_order']) == versions
+
+def test_listening_workers_bump_versions(app):
+    app.config['RESPONSE_CACHE_LISTEN'] = True
+    try:
+        response_cache.init_app(app)
+        notifications.start(app)
+        with app.app_context():
+            deadline = time.monotonic() + 5
+            # pg_stat_activity is a snapshot taken once per transaction
+            while not db.session.execute(text(
+                "SELECT count(*) FROM pg_stat_activity WHERE query = 'LISTEN response_cache'"
+            )).scalar():
+                db.session.commit()
+                assert time.monotonic() < deadline, 'listener did not start'
+                time.sleep(0.05)
+            db.session.commit()
+
+            backend = response_cache.backend()
+            response_cache.touch(db.session, 'vessel')
+            db.session.commit()
+            # bumped once on commit and once more by the notification
+            deadline = time.monotonic() + 5
+            while backend.versions_of(['vessel']) != (2,):
+                assert time.monotonic() < deadline, 'notification was not applied'
+                time.sleep(0.05)
+    finally:
+        app.config['RESPONSE_CACHE_LISTEN'] = False
+
+def test_entries_without_expiry(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'RESPONSE_CACHE_TTL', 0)
+    response_cache.init_app(app)
+    try:
+        client = app.test_client()
+        first = client.get('/operation_order/average_cost')
+        assert first.status_code == 200
+        result, statements = statements_of(app, lambda: client.get(
+            '/operation_order/average_cost', headers={'If-None-Match': first.headers['ETag']}
+        ))
+        assert result.status_code == 304
+        assert statements == []
+    finally:
+        monkeypatch.undo()
+        response_cache.init_app(app)
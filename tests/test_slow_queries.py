@@ -0,0 +1,92 @@
+import pytest
+from flask_migrate import Migrate
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from apis.app import create_app
+from apis.models.model import db, fingerprint, slow_query_log
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = 40
+    slow_query_log.init_app(app)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Migrate(app, db)
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def test_fingerprint_ignores_literals_and_in_lists():
+    assert fingerprint("SELECT * FROM vessels WHERE id = 1 AND code = 'MV101'") == \
+        fingerprint("SELECT *  FROM vessels\nWHERE id = 22 AND code = 'MV''02'")
+    assert fingerprint('SELECT * FROM vessels WHERE id IN (%(id_1)s, %(id_2)s)') == \
+        fingerprint('SELECT * FROM vessels WHERE id IN (%(id_1)s)')
+    assert fingerprint('SELECT * FROM vessels') != fingerprint('SELECT * FROM equipments')
+
+
+def test_slow_select_is_logged_and_explained_once(app):
+    slow_queries = app.extensions['slow_query_log']
+    with app.test_request_context('/operation_order/average_cost'):
+        db.session.execute(text('SELECT pg_sleep(:seconds)'), {'seconds': 0.05})
+        db.session.execute(text('SELECT pg_sleep(:seconds)'), {'seconds': 0.06})
+        db.session.execute(text('SELECT 1'))
+        db.session.rollback()
+    slow_queries.queue.join()
+
+    first, second = list(slow_queries.recent)[-2:]
+    assert first['endpoint'] == 'operation_order.average_cost'
+    assert first['parameters'] == {'seconds': 0.05}
+    assert first['duration_ms'] >= 40
+    assert first['fingerprint'] == second['fingerprint']
+    assert 'Execution Time' in first['plan']
+    # deduplicated by fingerprint
+    assert second['plan'] is None
+
+
+def test_slow_write_is_not_explained(app):
+    slow_queries = app.extensions['slow_query_log']
+    with app.app_context():
+        db.session.execute(text('DO $$ BEGIN PERFORM pg_sleep(0.05); END $$'))
+        db.session.rollback()
+    slow_queries.queue.join()
+
+    entry = slow_queries.recent[-1]
+    assert entry['statement'].startswith('DO')
+    assert entry['plan'] is None
+
+def test_slow_select_is_explained_where_it_ran(app):
+    slow_queries = app.extensions['slow_query_log']
+    with app.app_context():
+        db.session.execute(text('CREATE SCHEMA IF NOT EXISTS elsewhere'))
+        db.session.execute(text('CREATE TABLE IF NOT EXISTS elsewhere.only_there (id int)'))
+        db.session.commit()
+    # the table is only visible from the connections of this engine
+    engine = create_engine(make_url(app.config['SQLALCHEMY_DATABASE_URI']).update_query_dict(
+        {'options': '-csearch_path=elsewhere'}
+    ))
+    try:
+        with app.app_context(), engine.connect() as connection:
+            connection.execute(text('SELECT pg_sleep(0.05) FROM (SELECT 1) AS one LEFT JOIN only_there ON true'))
+        slow_queries.queue.join()
+    finally:
+        engine.dispose()
+        with app.app_context():
+            db.session.execute(text('DROP SCHEMA elsewhere CASCADE'))
+            db.session.commit()
+
+    entry = slow_queries.recent[-1]
+    assert 'only_there' in entry['statement']
+    assert 'Execution Time' in entry['plan']
@@ -70,5 +70,40 @@ def test_insert_invalid_inputs(app, description, input_data, expected_msg, expec
         query_results = db.session.execute(query).all()
         assert query_results[0][0] == 1, description
 
+def test_insert_batch(app):
+    result = app.test_client().post(
+        '/vessel/insert_vessels',
+        json={'codes':['MV103', 'MV102', '', 'MV104', 'MV103', '123456789']}
+    )
+    assert result.get_json() == {
+        'created': ['MV103', 'MV104'],
+        'duplicate': ['MV103', 'MV102'],
+        'invalid': ['', '123456789']
+    }
+    assert result.status_code == 201
+    with app.app_context():
+        query = db.session.query(vessel.code).order_by(vessel.code)
+        query_results = db.session.execute(query).all()
+        assert [row[0] for row in query_results] == ['MV102', 'MV103', 'MV104']
+
+@pytest.mark.parametrize('description,input_data,expected_msg,expected_status', [
+    (
+        'test insert batch without codes',
+        {},
+        "{'codes': ['Missing data for required field.']}",
+        400
+    ),
+    (
+        'test insert batch with empty codes',
+        {'codes':[]},
+        "{'codes': ['Length must be between 1 and 10000.']}",
+        400
+    )
+])
+def test_insert_batch_invalid_inputs(app, description, input_data, expected_msg, expected_status):
+    result = app.test_client().post('/vessel/insert_vessels', json=input_data)
+    assert result.get_json().get('message') == expected_msg
+    assert result.status_code == expected_status, description
+
 if __name__ == '__main__':
     pytest.main(['tests/test_vessels.py'])
\ No newline at end of file
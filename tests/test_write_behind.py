@@ -0,0 +1,130 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from flask_migrate import Migrate
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__),'../'))
+
+from apis.app import create_app
+from apis.models.model import db
+from apis.models.vessel import vessel
+from apis.models.equipment import equipment
+from apis.models.operation_order import OperationOrder
+from apis.write_behind import write_behind
+from sqlalchemy import func
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = create_app(test_config=True)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Migrate(app, db)
+        db.session.add(vessel(code='MV102'))
+        db.session.add(vessel(code='MV101'))
+        db.session.commit()
+        db.session.add(equipment(vessel_id=1, code='5310B9D7', location='brazil', name='compressor', active=True))
+        db.session.add(equipment(vessel_id=2, code='5310B9D8', location='brazil', name='compressor', active=True))
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def use_mode(app, mode):
+    app.config['OPERATION_WRITE_BEHIND'] = mode
+    app.config['OPERATION_FLUSH_INTERVAL'] = 0.2
+    write_behind.init_app(app)
+    with app.app_context():
+        return write_behind.writer()
+
+def operations_count(app):
+    with app.app_context():
+        return db.session.query(func.count(OperationOrder.id)).scalar()
+
+def test_group_commit(app):
+    writer = use_mode(app, 'wait')
+
+    def post(index):
+        return app.test_client().post(
+            '/operation_order/insert_operation',
+            json={'code': '5310B9D7' if index % 2 else '5310B9D8', 'type': 'replacement', 'cost': 10}
+        )
+    with ThreadPoolExecutor(20) as executor:
+        results = list(executor.map(post, range(20)))
+
+    assert [result.status_code for result in results] == [201] * 20
+    assert operations_count(app) == 20
+    stats = writer.stats()
+    assert stats['flushed'] == 20
+    assert stats['queue_depth'] == 0
+    assert stats['batches'] < 20
+    # the metrics are observed once the requests are answered
+    assert writer.drain()
+    metrics = app.test_client().get('/metrics').get_data(as_text=True)
+    assert f"operation_writer_batch_size_count {stats['batches']}" in metrics
+    assert 'operation_writer_batch_size_sum 20' in metrics
+    assert f"operation_writer_flush_duration_seconds_count {stats['batches']}" in metrics
+    assert app.test_client().get('/operation_order/average_cost').get_json() == {'MV101': 10, 'MV102': 10}
+
+def test_validation_is_synchronous(app):
+    use_mode(app, 'wait')
+    result = app.test_client().post(
+        '/operation_order/insert_operation',
+        json={'code': 'INVALID', 'type': 'replacement', 'cost': 10}
+    )
+    assert result.get_json() == {'message': 'Invalid equipment code'}
+    assert result.status_code == 400
+
+def test_async_mode(app):
+    writer = use_mode(app, 'async')
+    result = app.test_client().post(
+        '/operation_order/insert_operation',
+        json={'code': '5310B9D7', 'type': 'replacement', 'cost': 40}
+    )
+    assert result.get_json() == {'message': 'Accepted'}
+    assert result.status_code == 202
+
+    assert writer.drain()
+    assert operations_count(app) == 21
+    assert app.test_client().get('/operation_order/total_cost', json={'code': '5310B9D7'}).get_json() == {'total_cost': 140}
+
+def test_failed_operations_do_not_fail_their_batch(app):
+    writer = use_mode(app, 'wait')
+    valid = writer.submit(1, 1, 'replacement', 1)
+    invalid = writer.submit(999, 1, 'replacement', 1)
+    assert valid.done.wait(5) and invalid.done.wait(5)
+    assert valid.error is None
+    assert invalid.error is not None
+    assert operations_count(app) == 22
+    assert writer.stats()['failed'] == 1
+
+def test_writer_outlives_failures(app, monkeypatch):
+    writer = use_mode(app, 'wait')
+    def fail(*args, **kwargs):
+        raise RuntimeError('unavailable')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(app, 'app_context', fail)
+        lost = writer.submit(1, 1, 'replacement', 1)
+        assert lost.done.wait(5)
+        assert str(lost.error) == 'unavailable'
+    assert writer.drain()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(app.extensions['metrics'].writer_flush, 'observe', fail)
+        written = writer.submit(1, 1, 'replacement', 1)
+        assert written.done.wait(5)
+        assert written.error is None
+        assert writer.drain()
+
+    pending = writer.submit(2, 2, 'replacement', 1)
+    assert pending.done.wait(5)
+    assert pending.error is None
+    assert operations_count(app) == 24
@@ -0,0 +1,3 @@
+from apis.app import create_app
+
+app = create_app(production_conf=True)